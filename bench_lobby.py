@@ -0,0 +1,92 @@
+from __future__ import print_function
+import argparse
+import random
+import time
+from collections import Counter
+
+from lobby_protocol import Dispatcher, MessageReader, ReplaySocket
+
+
+def generate_traffic(count, seed=0):
+    """
+    Creates fake lobby traffic, for when no recording (see frozen.py --record) is available.
+    """
+    r = random.Random(seed)
+    lines = []
+    for i in range(0, count):
+        kind = r.random()
+        if kind < 0.4:
+            lines.append("textcom\tcommand\tping")
+        elif kind < 0.6:
+            lines.append("textcom\tcommand\tack\t%d" % i)
+        elif kind < 0.7:
+            lines.append("textcom\tcommand\tsetMyStats\t%d\t%d\t%d" % (r.randint(1, 200), r.randint(0, 999),
+                                                                       r.randint(0, 999)))
+        elif kind < 0.8:
+            lines.append("textcom\tcommand\tHasDLCStatus\t%d" % r.randint(0, 1))
+        elif kind < 0.95:
+            lines.append("textcom\tcommand\toppDisplayStatusChanged\tplayer%d\t%d" % (r.randint(0, 999), r.randint(0, 3)))
+        else:
+            lines.append("textcom\tchat\tplayer%d\t%s" % (r.randint(0, 999), "hello " * r.randint(1, 20)))
+    return ("\n".join(lines) + "\n").encode("latin-1")
+
+
+def make_dispatcher(counts):
+    """
+    A dispatcher with the same routes as frozen.py, whose handlers only count the messages.
+    """
+    def count(s, message):
+        counts[message.command or message.kind] += 1  # Messages which aren't commands are counted by kind.
+
+    def skip_file(s, message):  # Like frozen.py, consume the contents of the file.
+        counts[message.command] += 1
+        s.recv(10000)
+
+    dispatcher = Dispatcher(default=count)
+    dispatcher.register("setMyStats", "HasDLCStatus", "ping", "ack", "SetSocketMode",
+                        "oppDisplayStatusChanged")(count)
+    dispatcher.register("writeFile")(skip_file)
+    return dispatcher
+
+
+def run(data, bufsize):
+    counts = Counter()
+    dispatcher = make_dispatcher(counts)
+    reader = MessageReader(ReplaySocket(data), bufsize)
+    start = time.time()
+    for message in reader:
+        dispatcher.dispatch(reader, message)
+    return time.time() - start, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how many lobby messages per second can be parsed and "
+                                                 "dispatched.")
+    parser.add_argument("recording", nargs="?", help="Traffic recorded with frozen.py --record. Fake traffic is "
+                                                     "generated if omitted.")
+    parser.add_argument("--generate", type=int, default=200000, metavar="N",
+                        help="The number of fake messages to generate (default: 200000).")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs; the best one is kept (default: 5).")
+    parser.add_argument("--bufsize", type=int, default=1024, help="Size of the reads (default: 1024, like "
+                                                                  "frozen.py).")
+    args = parser.parse_args()
+
+    if args.recording:
+        with open(args.recording, "rb") as f:
+            data = f.read()
+    else:
+        data = generate_traffic(args.generate)
+
+    best = None
+    for i in range(0, args.repeat):
+        elapsed, counts = run(data, args.bufsize)
+        best = elapsed if best is None else min(best, elapsed)
+    total = sum(counts.values())
+    print("%d messages (%d bytes) in %.3fs: %.0f messages/s." % (total, len(data), best,
+                                                                 total / best if best else float("inf")))
+    for command, n in counts.most_common():
+        print("\t%s: %d" % (command, n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from __future__ import print_function
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+from frozen_parse_mt import read_mt_header, read_units
+from mt_synth import make_encounter
+
+
+def parse_headers(corpus):
+    for data in corpus:
+        read_mt_header(io.BytesIO(data))
+
+
+def parse_games(corpus):
+    for data in corpus:
+        f = io.BytesIO(data)
+        read_mt_header(f)
+        read_units(f)
+
+
+def measure(function, corpus, repeat):
+    """
+    @return The best time out of repeat runs, and the peak memory allocated during one run (None if it can't
+            be measured).
+    """
+    best = None
+    for i in range(0, repeat):
+        start = time.time()
+        function(corpus)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    peak = None
+    if tracemalloc is not None:
+        tracemalloc.start()
+        function(corpus)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return best, peak
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the MT parser (frozen_parse_mt.py) on generated games.")
+    parser.add_argument("--count", type=int, default=5000, help="The number of games in the bulk benchmarks "
+                                                                "(default: 5000).")
+    parser.add_argument("--units", type=int, default=16, help="The number of units per game (default: 16).")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs; the best one is kept (default: 5).")
+    parser.add_argument("--results", default="bench_mt.jsonl", help="The file in which results are appended, so "
+                                                                    "they can be compared between versions "
+                                                                    "(default: bench_mt.jsonl).")
+    args = parser.parse_args()
+
+    r = random.Random(0)
+    corpus = [make_encounter(r, i + 1, args.units) for i in range(0, args.count)]
+    single = corpus[:1] * 1000  # The same file parsed over and over: nothing but the parser's own overhead.
+    size = sum(len(data) for data in corpus)
+
+    previous = None  # The last results obtained with the same parameters, for comparison.
+    if os.path.exists(args.results):
+        with open(args.results, "r") as f:
+            for line in f:
+                record = json.loads(line)
+                if record["count"] == args.count and record["units"] == args.units:
+                    previous = record
+
+    results = {}
+    for name, function, games in [("single_header", parse_headers, single),
+                                  ("single_game", parse_games, single),
+                                  ("bulk_headers", parse_headers, corpus),
+                                  ("bulk_games", parse_games, corpus)]:
+        elapsed, peak = measure(function, games, args.repeat)
+        results[name] = {"games": len(games),
+                         "seconds": elapsed,
+                         "games_per_second": len(games) / elapsed if elapsed else None,
+                         "peak_memory": peak}
+        if name.startswith("bulk"):
+            results[name]["megabytes_per_second"] = size / elapsed / 1024 / 1024 if elapsed else None
+        comparison = ""
+        if previous is not None and previous["results"][name]["seconds"] and elapsed:
+            comparison = " [%+.1f%% since %s]" % (100.0 * (previous["results"][name]["seconds"] / elapsed - 1),
+                                                 previous["revision"] or "the last run")
+        print("%-14s %8d games in %.3fs: %10.0f games/s%s%s"
+              % (name, len(games), elapsed, len(games) / elapsed if elapsed else float("inf"),
+                 " (peak memory: %d KB)" % (peak // 1024) if peak is not None else "", comparison))
+
+    record = {"time": time.time(),
+              "revision": get_revision(),
+              "python": platform.python_version(),
+              "count": args.count,
+              "units": args.units,
+              "results": results}
+    with open(args.results, "a") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+    print("Results appended to %s." % args.results)
+
+
+if __name__ == "__main__":
+    main()
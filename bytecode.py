@@ -0,0 +1,325 @@
+from __future__ import print_function
+import sys
+import copy
+import hashlib
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from torque_vm_values import *
+
+
+# A function declared in a DSO file. start and end delimit its code (OP_FUNC_DECL included).
+Function = namedtuple("Function", ["name", "namespace", "package", "argv", "start", "end"])
+
+
+def get_ste_size(dso):
+    # StringTable entries were "expanded to 64bits" in version 44.
+    return 1 if dso.version < 44 else 2
+
+
+def iter_instructions(dso, start=0, end=None):
+    """
+    Walks the bytecode without interpreting it.
+    @param  dso     The DSO object to walk
+    @param  start   The ip of the first instruction
+    @param  end     The ip at which to stop. Default is the end of the code.
+    @return A generator of (ip, opcode, operands) tuples, where operands is a list of (kind, position)
+            pairs. See OPERANDS in torque_vm_values.py for the possible kinds.
+    """
+    code = dso.code
+    if end is None:
+        end = len(code)
+    ste_size = get_ste_size(dso)
+    ip = start
+    while ip < end:
+        opcode = get_opcode(dso.version, code[ip])
+        if not opcode:
+            raise ValueError("Encountered a value which does not translate to an opcode (%d) at ip=%d." % (code[ip], ip))
+        operands = []
+        pos = ip + 1
+        for kind in get_operands(dso.version, opcode):
+            if kind == "ste" or kind == "ns":
+                operands.append((kind, pos))
+                pos += ste_size
+            elif kind == "argc":
+                operands.append(("uint", pos))
+                count = code[pos]
+                pos += 1
+                for i in range(0, count):
+                    operands.append(("ste", pos))
+                    pos += ste_size
+            else:
+                operands.append((kind, pos))
+                pos += 1
+        yield ip, opcode, operands
+        ip = pos
+
+
+# Cache of the tables built by get_decode_table, by version.
+DECODE_TABLES = {}
+
+
+def get_decode_table(version):
+    """
+    Precomputes how each value which can be found in place of an opcode should be decoded for a given version.
+    @return A dictionary mapping raw values to (opcode, size, ip_offsets, ste_offsets) tuples, where size
+            is the number of slots used by the instruction (the arguments of OP_FUNC_DECL excluded) and the
+            offsets are relative to the opcode.
+    """
+    table = DECODE_TABLES.get(version)
+    if table is not None:
+        return table
+    ste_size = 1 if version < 44 else 2
+    table = {}
+    for value in range(0, 0x100):
+        opcode = get_opcode(version, value)
+        if not opcode:
+            continue
+        pos = 1
+        ip_offsets = []
+        ste_offsets = []
+        for kind in get_operands(version, opcode):
+            if kind == "ste" or kind == "ns":
+                ste_offsets.append(pos)
+                pos += ste_size
+            else:
+                if kind == "ip":
+                    ip_offsets.append(pos)
+                pos += 1
+        table[value] = (opcode, pos, tuple(ip_offsets), tuple(ste_offsets))
+    DECODE_TABLES[version] = table
+    return table
+
+
+# Cache of the tables built by get_validation_tables, by version.
+VALIDATION_TABLES = {}
+
+
+def get_validation_tables(version):
+    """
+    The decode table of a version (see get_decode_table) as arrays indexed by raw value, so that the whole code
+    can be looked up at once. Index 0x100 stands for the values which are too big to be opcodes.
+    @return (valid, lengths, func_decl, ip_offsets, ste_offsets). The offsets are 2D arrays with one row per
+            operand, containing 0 when an instruction has fewer operands.
+    """
+    tables = VALIDATION_TABLES.get(version)
+    if tables is not None:
+        return tables
+    table = get_decode_table(version)
+    valid = np.zeros(0x101, dtype=bool)
+    lengths = np.ones(0x101, dtype=np.int64)  # Invalid values are skipped like one-slot instructions.
+    func_decl = np.zeros(0x101, dtype=bool)
+    ip_offsets = np.zeros((max(len(d[2]) for d in table.values()), 0x101), dtype=np.int64)
+    ste_offsets = np.zeros((max(len(d[3]) for d in table.values()), 0x101), dtype=np.int64)
+    for value, (opcode, size, ips, stes) in table.items():
+        valid[value] = True
+        lengths[value] = size
+        func_decl[value] = opcode == "OP_FUNC_DECL"
+        ip_offsets[:len(ips), value] = ips
+        ste_offsets[:len(stes), value] = stes
+    tables = VALIDATION_TABLES[version] = (valid, lengths, func_decl, ip_offsets, ste_offsets)
+    return tables
+
+
+def follow(next_ip, size):
+    """
+    Finds the positions reached from ip 0 by following next_ip, i.e. where the instructions start. Instead of
+    walking the code one instruction at a time, the chain is followed by pointer doubling: after k rounds, jump
+    skips 2^k instructions at once and reached holds every instruction less than 2^k steps away from the start.
+    @param  next_ip The position of the next instruction, for each position of the code.
+    @return The sorted array of the positions reached.
+    """
+    jump = np.append(np.minimum(next_ip, size), size)  # Everything past the end of the code ends up in size.
+    reached = np.zeros(size + 1, dtype=bool)
+    reached[0] = True
+    while True:
+        reached[jump[np.flatnonzero(reached)]] = True
+        if jump[0] == size:  # The whole chain fits in the positions reached so far.
+            break
+        jump = jump[jump]
+    return np.flatnonzero(reached[:size])
+
+
+def validate(dso):
+    """
+    Checks that the bytecode can be decompiled: every instruction has to translate to an opcode, jumps and
+    function ends have to point inside the code, and the IdentTable can only patch string operands. The code is
+    handled as an array, without looping over the instructions in Python (requires NumPy), which is much faster
+    than running into the problem in the middle of decompile().
+    @return A list of problems. Empty if nothing was found.
+    """
+    if np is None:
+        raise ImportError("NumPy is required to validate the bytecode (pip install numpy).")
+    problems = []
+    if not is_version_supported(dso.version):
+        problems.append("Version %d is not supported (only versions %d to %d are, see torque_vm_values.py)."
+                        % (dso.version, OLDEST_VERSION, LATEST_VERSION))
+    code = np.array(dso.code, dtype=np.int64)
+    size = len(code)
+    valid, lengths, func_decl, ip_offsets, ste_offsets = get_validation_tables(dso.version)
+    ste_size = get_ste_size(dso)
+
+    # Decode every position as if it was an instruction. OP_FUNC_DECL is followed by its arguments, the last
+    # slot of its fixed part being their number.
+    values = np.minimum(code, 0x100)
+    positions = np.arange(size, dtype=np.int64)
+    fixed_end = positions + lengths[values]
+    argc = np.where(func_decl[values] & (fixed_end <= size), code[np.minimum(fixed_end, size) - 1], 0)
+    starts = follow(fixed_end + argc * ste_size, size) if size else positions
+
+    stop = None  # The problem which prevents decoding the rest of the code
+    invalid = starts[~valid[values[starts]]]
+    if len(invalid):
+        ip = invalid[0]
+        stop = "ip=%d: %d does not translate to an opcode for version %d." % (ip, code[ip], dso.version)
+        starts = starts[starts < ip]
+    if len(starts) and fixed_end[starts[-1]] + argc[starts[-1]] * ste_size > size:
+        ip = starts[-1]
+        opcode = get_opcode(dso.version, int(code[ip]))
+        if fixed_end[ip] <= size:
+            stop = "ip=%d: %s is truncated (%d arguments)." % (ip, opcode, argc[ip])
+        else:
+            stop = "ip=%d: %s is truncated." % (ip, opcode)
+        starts = starts[:-1]
+    opcodes = values[starts]
+
+    decls = starts[func_decl[opcodes]]
+    for ip, end_ip in zip(decls, code[decls + ip_offsets[0][values[decls]]]):
+        if end_ip <= ip or end_ip > size:
+            problems.append("ip=%d: the end of the function (%d) is out of range." % (ip, end_ip))
+    if stop is not None:
+        problems.append(stop)
+
+    jumps = np.concatenate([starts[offsets[opcodes] > 0] + offsets[opcodes][offsets[opcodes] > 0]
+                            for offsets in ip_offsets])
+    bad = jumps[code[jumps] > size]
+    if len(bad):
+        problems.append("%d jump(s) out of range (first one: %d at ip=%d)." % (len(bad), code[bad[0]], bad[0]))
+
+    # Locations where the IdentTable may patch a string offset: string operands and function arguments.
+    ste_positions = np.zeros(size + 1, dtype=bool)
+    for offsets in ste_offsets:
+        ste_positions[starts[offsets[opcodes] > 0] + offsets[opcodes][offsets[opcodes] > 0]] = True
+    counts = argc[decls]
+    # The arguments of all the functions are numbered together by arange: shift them to where each function's
+    # own arguments start.
+    shift = np.repeat(fixed_end[decls] - (np.cumsum(counts) - counts) * ste_size, counts)
+    ste_positions[shift + np.arange(counts.sum(), dtype=np.int64) * ste_size] = True
+    locations = np.array(getattr(dso, "ident_locations", ()), dtype=np.int64)
+    bad = locations[(locations >= size) | ~ste_positions[np.minimum(locations, size)]]
+    if len(bad):
+        problems.append("%d IdentTable location(s) don't point to a string operand (first one: %d)." % (len(bad),
+                                                                                                         bad[0]))
+    return problems
+
+
+def resolve_operand(dso, kind, value, in_function=False):
+    """
+    Returns the value an operand refers to: strings and floats are looked up in the DSO's tables.
+    """
+    if kind == "ste":
+        return dso.get_string(value)  # Always pick from the global pool
+    elif kind == "ns":
+        return dso.get_string(value) if value else ""
+    elif kind == "str":
+        return dso.get_string(value, in_function)
+    elif kind == "flt":
+        return dso.get_float(value, in_function)
+    return value
+
+
+def find_functions(dso):
+    """
+    Lists the functions declared in a DSO file.
+    """
+    functions = []
+    for ip, opcode, operands in iter_instructions(dso):
+        if opcode != "OP_FUNC_DECL":
+            continue
+        values = [resolve_operand(dso, kind, dso.code[pos]) for kind, pos in operands]
+        functions.append(Function(name=values[0], namespace=values[1], package=values[2], argv=values[6:],
+                                  start=ip, end=values[4]))
+    return functions
+
+
+def iter_segments(dso):
+    """
+    Splits the code of a DSO file into its functions and the top-level code located between them.
+    @return A generator of Function tuples. Top-level code is represented by Functions whose name is None.
+    """
+    start = 0
+    for function in find_functions(dso):
+        if function.start > start:
+            yield Function(None, None, None, [], start, function.start)
+        yield function
+        start = function.end
+    if start < len(dso.code):
+        yield Function(None, None, None, [], start, len(dso.code))
+
+
+def extract_function(dso, function):
+    """
+    Creates a copy of the DSO object containing only the given function. Absolute jumps are rebased
+    so that the copy can be decompiled on its own.
+    """
+    dso_copy = copy.copy(dso)
+    dso_copy.code = dso.code[function.start:function.end]
+    for ip, opcode, operands in iter_instructions(dso, function.start, function.end):
+        for kind, pos in operands:
+            if kind == "ip":
+                dso_copy.code[pos - function.start] -= function.start
+    return dso_copy
+
+
+def hash_function(dso, function):
+    """
+    Hashes the normalized bytecode of a function. String and float operands are replaced by the values they
+    point to and jumps are made relative to the start of the function, so that the hash doesn't depend on
+    where the function is located in the file or on the layout of the DSO's tables. The version of the DSO is
+    hashed too since the decompiler's output depends on it.
+    """
+    h = hashlib.sha1()
+    h.update(repr(dso.version).encode("UTF-8"))
+    for ip, opcode, operands in iter_instructions(dso, function.start, function.end):
+        values = []
+        for kind, pos in operands:
+            value = resolve_operand(dso, kind, dso.code[pos], in_function=True)
+            if kind == "ip":
+                value -= function.start
+            values.append(value)
+        h.update(repr((opcode, values)).encode("UTF-8", "replace"))
+    return h.hexdigest()
+
+
+def disassemble(dso, sink=None, lines=False, start=0, end=None):
+    """
+    Writes a listing of the DSO's bytecode.
+    @param  dso     The object to disassemble
+    @param  sink    A file object in which the listing will be written. Default is stdout.
+    @param  lines   Whether to indicate the lines of the original script (see DSOFile.get_line).
+    @param  start   The ip of the first instruction to list. Must not be inside a function.
+    @param  end     The ip at which to stop. Default is the end of the code.
+    """
+    if sink is None:
+        sink = sys.stdout
+    function_end = None
+    last_line = None
+    for ip, opcode, operands in iter_instructions(dso, start, end):
+        if lines:
+            line = dso.get_line(ip)
+            if line is not None and line != last_line:
+                print("; line %d" % line, file=sink)
+                last_line = line
+        if function_end is not None and ip >= function_end:
+            function_end = None
+        values = []
+        for kind, pos in operands:
+            value = resolve_operand(dso, kind, dso.code[pos], in_function=function_end is not None)
+            values.append(repr(value) if kind in ("ste", "ns", "str") else str(value))
+        print(("%6d  %-26s %s" % (ip, opcode, ", ".join(values))).rstrip(), file=sink)
+        if opcode == "OP_FUNC_DECL":
+            function_end = dso.code[operands[4][1]]
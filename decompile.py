@@ -4,32 +4,21 @@ import os
 import copy
 import bisect
 
-from torque_vm_values import *
-
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
 
-def pretty_print_function(function_name, namespace="", arguments=None, call_type="FunctionCall"):
-    if arguments is None:
-        arguments = []
+from torque_vm_values import *
+from expressions import *
+from bytecode import find_functions, hash_function
 
-    # Sanitize arguments. Their name may be omitted if they are unused.
-    for i in range(0, len(arguments)):
-        if not arguments[i]:
-            arguments[i] = "%%unused_var_%d" % i
 
-    function_call = "%s::" % namespace if namespace != "" else ""
-    if call_type == "MethodCall":
-        if " " in arguments[0]:  # The caller name may have been constructed dynamically, i.e. (Objh @ "andle").call()
-            function_call += "(%s)." % arguments[0]
-        else:
-            function_call += "%s." % arguments[0]
-        arguments = arguments[1:]
-    function_call += "%s(" % function_name
-    if len(arguments) == 0:
-        function_call += ")"
-    else:
-        for arg in arguments:
-            function_call += "%s, " % arg if arg is not arguments[-1] else "%s)" % arg
-    return function_call
+class DecompileError(Exception):
+    """
+    Raised when the bytecode contains a construction the decompiler doesn't handle.
+    """
+    pass
 
 
 def is_number(s):
@@ -43,6 +32,28 @@ def is_number(s):
         return False
 
 
+def indent(code, indentation):
+    """
+    Adds indentation tabs at the beginning of each line which isn't empty.
+    """
+    return "".join(indentation*"\t" + line if line.strip() else line for line in code.splitlines(True))
+
+
+def unindent(code, indentation):
+    """
+    Removes indentation tabs from the beginning of each line which isn't empty.
+    @return The code, or None if a line isn't indented that much.
+    """
+    lines = []
+    for line in code.splitlines(True):
+        if line.strip():
+            if not line.startswith(indentation*"\t"):
+                return None
+            line = line[indentation:]
+        lines.append(line)
+    return "".join(lines)
+
+
 def partial_decompile(dso, start, end, in_function, previous_offset=0):
     dso_copy = copy.copy(dso)
     assert(start < end)
@@ -79,11 +90,13 @@ def delete_code(dso, code_inserts, index):
     for i in range(bisect.bisect_left(code_inserts, index), len(code_inserts)):
         code_inserts[i] -= 1
 
-def decompile(dso, sink=None, in_function=False, offset=0):
+def decompile(dso, sink=None, in_function=False, offset=0, cache=None):
     """
     Decompiles the DSO object given as parameter.
     @param  dso         The object to decompile
     @param  sink        A file object in which the decompiled code will be written. Default is stdout.
+    @param  cache       A FunctionCache (see function_cache.py) used to avoid decompiling functions which have
+                        already been seen.
     @param  in_function Whether the code to decompile is located in a function.
                         Do not use. It is only relevant to partial decompilations.
     @param  offset      An offset to apply to absolute jumps.
@@ -108,6 +121,14 @@ def decompile(dso, sink=None, in_function=False, offset=0):
     indentation = 0
     previous_opcodes = ["OP_INVALID", "OP_INVALID", "OP_INVALID", "OP_INVALID", "OP_INVALID"]
     code_inserts = []
+    # Sinks which map the output to the original lines (see LineAnnotator in parse_dso.py) need the ips.
+    track_ip = getattr(sink, "track_ip", None)
+    # Hashes of the functions which can be looked up in the cache, by ip. They have to be computed before the
+    # code is modified. Cached code can't be annotated with line information, so don't use it in that case.
+    function_hashes = {}
+    if cache is not None and offset == 0 and track_ip is None:
+        function_hashes = dict((f.start, hash_function(dso, f)) for f in find_functions(dso))
+    captured_function = None  # (hash, sink) while the code of a function is being recorded for the cache
     
     # For debugging
     # for i in range(len(dso.code)):
@@ -115,7 +136,10 @@ def decompile(dso, sink=None, in_function=False, offset=0):
 
     # The big switch-case
     while ip < len(dso.code):
+        opcode_ip = ip  # Where the instruction starts, for the error reports (see get_error_location in parse_dso.py)
         opcode = get_opcode(dso.version, dso.code[ip])
+        if track_ip is not None:
+            track_ip(ip - bisect.bisect_left(code_inserts, ip) + offset)  # The ip in the original code
         # For debugging
         # print("Opcode: %s\nValue: %s\nIp: %s\n" % (opcode, hex(dso.code[ip]), hex(ip)), file=sys.stdout)
         if not opcode:
@@ -126,14 +150,10 @@ def decompile(dso, sink=None, in_function=False, offset=0):
             print(indentation*"\t" + "///%s" % dso.get_string(dso.code[ip], in_function), file=sink)
             ip += 1
         elif opcode == "OP_LOADIMMED_STR" or opcode == "OP_TAG_TO_STR":
-            op = dso.get_string(dso.code[ip], in_function)
+            # The literal was classified and rendered when the file was loaded.
+            literal = dso.get_literal(dso.code[ip], in_function)
             ip += 1
-            # Some floats may be represented as string literals. Omit brackets for those.
-            if opcode == "OP_TAG_TO_STR":  # Tagged strings are encased in single quotes.
-                string_stack.append('%s' % op if is_number(op) else "'%s'" % op)
-            else:
-                # Also escape any double quote in the string.
-                string_stack.append('%s' % op if is_number(op) else '"%s"' % op.replace('"', r'\"'))
+            string_stack.append(literal.tagged if opcode == "OP_TAG_TO_STR" else literal.quoted)
         elif opcode == "OP_SETCURVAR_CREATE" or opcode == "OP_SETCURVAR":
             current_variable = dso.get_string(dso.code[ip])  # Always lookup in the global ST for this opcode
             ip += ste_size
@@ -177,7 +197,7 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                 done_object_opcode = "OP_FINISH_OBJECT"
             
             if previous_opcodes[0] == done_object_opcode:
-                print(indentation*"\t" + int_stack.pop(), file=sink)
+                print(indentation*"\t" + str(int_stack.pop()), file=sink)
             else:
                 int_stack.pop()
         elif opcode == "OP_UINT_TO_FLT":
@@ -212,31 +232,44 @@ def decompile(dso, sink=None, in_function=False, offset=0):
             else:
                 namespace = ""
             function_name = dso.get_string(dso.code[ip])
-            string_stack.append(pretty_print_function(function_name, namespace, arguments[-1], call_type))
+            string_stack.append(Call(function_name, namespace, arguments[-1], call_type))
             arguments.pop()
             ip += 1 + 2*ste_size
 
         elif opcode == "OP_FUNC_DECL":
-            function_name = dso.get_string(dso.code[ip])
-            if dso.code[ip + ste_size] == 0:
-                namespace = ""
+            digest = function_hashes.get(ip - 1 - bisect.bisect_left(code_inserts, ip - 1))
+            cached_code = cache.get(digest) if digest is not None else None
+            if cached_code is not None:
+                # This function has already been decompiled: skip to its end. The code is stored without indentation
+                # since the same function may be found at different levels.
+                print(indent(cached_code, indentation), end="", file=sink)
+                ip = get_jmp_target(dso, ip + 3*ste_size + 1, code_inserts, offset)
+                opcode = "META_ENDFUNC"
             else:
-                namespace = dso.get_string(dso.code[ip + ste_size])
-            package = dso.get_string(dso.code[ip + 2*ste_size])
-            has_body = dso.code[ip + 3*ste_size]
-            end_ip = dso.code[ip + 3*ste_size + 1]
-            # Mark the end of the function so we can close the bracket and unindent.
-            # We can't rely on "return" because a function may have multiple exit points.
-            insert_code(dso, code_inserts, end_ip, METADATA["META_ENDFUNC"])
-            argc = dso.code[ip + 3*ste_size + 2]
-            argv = []
-            for i in range(0, argc):
-                argv.append(dso.get_string(dso.code[ip + 3*ste_size + 3 + ste_size*i]))
+                if digest is not None:
+                    captured_function = (digest, sink)
+                    sink = StringIO()
+                function_name = dso.get_string(dso.code[ip])
+                if dso.code[ip + ste_size] == 0:
+                    namespace = ""
+                else:
+                    namespace = dso.get_string(dso.code[ip + ste_size])
+                package = dso.get_string(dso.code[ip + 2*ste_size])
+                has_body = dso.code[ip + 3*ste_size]
+                end_ip = dso.code[ip + 3*ste_size + 1]
+                # Mark the end of the function so we can close the bracket and unindent.
+                # We can't rely on "return" because a function may have multiple exit points.
+                insert_code(dso, code_inserts, end_ip, METADATA["META_ENDFUNC"])
+                argc = dso.code[ip + 3*ste_size + 2]
+                argv = []
+                for i in range(0, argc):
+                    argv.append(dso.get_string(dso.code[ip + 3*ste_size + 3 + ste_size*i]))
 
-            print(indentation*"\t" + "function " + pretty_print_function(function_name, namespace, argv) + "\n{", file=sink)
-            indentation += 1
-            ip += 3 + 3*ste_size + ste_size*argc
-            in_function = True
+                print(indentation*"\t" + "function " + pretty_print_function(function_name, namespace, argv) + "\n" +
+                      indentation*"\t" + "{", file=sink)
+                indentation += 1
+                ip += 3 + 3*ste_size + ste_size*argc
+                in_function = True
         elif opcode == "OP_RETURN":
             if len(string_stack) > 0:
                 print(indentation*"\t" + "return %s;" % string_stack.pop(), file=sink)
@@ -252,6 +285,14 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                 in_function = False
                 indentation -= 1
                 print(indentation*"\t" + "}\n", file=sink)
+                if captured_function is not None:
+                    digest, function_sink = captured_function
+                    code = unindent(sink.getvalue(), indentation)
+                    if code is not None:
+                        cache.put(digest, code)
+                    print(sink.getvalue(), end="", file=function_sink)
+                    sink = function_sink
+                    captured_function = None
             delete_code(dso, code_inserts, ip - 1)  # Delete the metadata we added to avoid desyncing absolute jumps.
             ip -= 1
         elif opcode == "OP_CREATE_OBJECT":
@@ -261,8 +302,8 @@ def decompile(dso, sink=None, in_function=False, offset=0):
             if parent != "":
                 pass  # TODO!
             argv = arguments[-1]
-            object_creation = "new %s(%s)\n" % (argv[0], argv[1] if argv[1] != "\"\"" else "")
-            object_creation += indentation*"\t" + "{\n"
+            object_creation = ObjectDeclaration("new %s(%s)" % (argv[0], argv[1] if argv[1] != "\"\"" else ""),
+                                                indentation)
             if dso.version < 45:
                 assert int_stack.pop() == 0
                 int_stack.append(object_creation)
@@ -286,10 +327,7 @@ def decompile(dso, sink=None, in_function=False, offset=0):
         elif opcode == "OP_END_OBJECT":
             indentation -= 1
             op = int_stack.pop()
-            if op.endswith("\n" + indentation*"\t" + "{\n"):  # Empty object declaration, omit body.
-                op = op[:-3-indentation]
-            else:
-                op += indentation*"\t" + "}"
+            op.close(indentation)
             if dso.version < 45:
                 int_stack.append(op)
             else:
@@ -297,7 +335,7 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                 if root:
                     int_stack.append(op)
                 else:
-                    int_stack.append(int_stack.pop() + indentation*"\t" + op + "\n")
+                    int_stack[-1].add_object(indentation, op)
             ip += 1
         elif opcode == "OP_FINISH_OBJECT":
             pass
@@ -306,11 +344,10 @@ def decompile(dso, sink=None, in_function=False, offset=0):
         elif opcode == "OP_ADVANCE_STR_NUL":
             pass
         elif opcode == "OP_ADVANCE_STR_APPENDCHAR":
-            c = chr(dso.code[ip])
-            string_stack[-1] += c
+            string_stack.append(AppendedChar(string_stack.pop(), chr(dso.code[ip])))
             ip += 1
         elif opcode == "OP_ADVANCE_STR_COMMA":
-            string_stack[-1] += ","
+            string_stack.append(AppendedChar(string_stack.pop(), ","))
         elif opcode == "OP_SETCUROBJECT":
             current_object = string_stack.pop()
         elif opcode == "OP_SETCUROBJECT_NEW":
@@ -327,22 +364,16 @@ def decompile(dso, sink=None, in_function=False, offset=0):
         elif opcode == "OP_REWIND_STR":
             if ip < len(dso.code) and get_opcode(dso.version, dso.code[ip]).startswith("OP_SETCURVAR_ARRAY"):  # This is an array access
                 s2 = string_stack.pop()
-                string_stack.append("%s[%s]" % (string_stack.pop(), s2))
+                string_stack.append(ArrayAccess(string_stack.pop(), s2))
             else:
                 s2 = string_stack.pop()
-                s1 = string_stack.pop()
-                if s1[-1] in STRING_OPERATORS:
-                    string_stack.append("%s %s %s" % (s1[:-1], STRING_OPERATORS[s1[-1]], s2))
-                elif s1[-1] == ",":  # Matrix indexing
-                    string_stack.append("%s%s" % (s1, s2))
-                else:
-                    string_stack.append("%s @ %s" % (s1, s2))
+                string_stack.append(concatenate(string_stack.pop(), s2))
         elif opcode == "OP_LOADFIELD_FLT":
-            float_stack.append("%s.%s" % (current_object, current_field))
+            float_stack.append(FieldAccess(current_object, current_field))
         elif opcode == "OP_LOADFIELD_STR":
-            string_stack.append("%s.%s" % (current_object, current_field))
+            string_stack.append(FieldAccess(current_object, current_field))
         elif opcode == "OP_LOADFIELD_UINT":
-            int_stack.append("%s.%s" % (current_object, current_field))
+            int_stack.append(FieldAccess(current_object, current_field))
         elif opcode == "OP_TERMINATE_REWIND_STR":
             pass
         elif opcode == "OP_SAVEFIELD_STR":
@@ -350,19 +381,19 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                 string_stack.append("\"\"")
             if current_object is None:  # This is an object creation
                 if dso.version < 45:
-                    int_stack[-1] += indentation*"\t" + "%s = %s;\n" % (current_field, string_stack[-1])
+                    int_stack[-1].add_field(indentation, current_field, string_stack[-1])
                 else:
-                    object_creation_stack[-1] += indentation*"\t" + "%s = %s;\n" % (current_field, string_stack[-1])
+                    object_creation_stack[-1].add_field(indentation, current_field, string_stack[-1])
             else:  # This is a field affectation
-                print(indentation*"\t" + "%s.%s = %s;" % (current_object, current_field, string_stack[-1]), file=sink)
+                print(indentation*"\t" + "%s = %s;" % (FieldAccess(current_object, current_field), string_stack[-1]), file=sink)
         elif opcode == "OP_SAVEFIELD_FLT":
             if current_object is None:  # This is an object creation
                 if dso.version < 45:
-                    int_stack[-1] += indentation*"\t" + "%s = %s;\n" % (current_field, float_stack.pop())
+                    int_stack[-1].add_field(indentation, current_field, float_stack.pop())
                 else:
-                    object_creation_stack[-1] += indentation*"\t" + "%s = %s;\n" % (current_field, float_stack.pop())
+                    object_creation_stack[-1].add_field(indentation, current_field, float_stack.pop())
             else:  # This is a field affectation
-                print(indentation*"\t" + "%s.%s = %s;" % (current_object, current_field, float_stack[-1]), file=sink)
+                print(indentation*"\t" + "%s = %s;" % (FieldAccess(current_object, current_field), float_stack[-1]), file=sink)
         elif opcode == "OP_CMPEQ" or \
              opcode == "OP_CMPLT" or \
              opcode == "OP_CMPNE" or \
@@ -370,9 +401,7 @@ def decompile(dso, sink=None, in_function=False, offset=0):
              opcode == "OP_CMPGE" or \
              opcode == "OP_CMPLE":
             op1 = float_stack.pop()
-            op2 = float_stack.pop()
-            op1 = "%s %s %s" % (str(op1), COMPARISON[opcode], str(op2))
-            int_stack.append(op1)
+            int_stack.append(BinaryOperation(COMPARISON[opcode], op1, float_stack.pop()))
         elif opcode == "OP_JMP":
             jmp_target = get_jmp_target(dso, ip, code_inserts, offset)
             opcode_before_dest = get_opcode(dso.version, dso.code[jmp_target - 2])
@@ -387,30 +416,26 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                 print(indentation*"\t" + "continue;", file=sink)
             ip += 1
         elif opcode == "OP_JMPIF_NP":
-            binary_stack.append(str(int_stack.pop()) + " || ")
+            binary_stack.append((int_stack.pop(), "||"))
             jmp_target = get_jmp_target(dso, ip, code_inserts, offset)
             insert_code(dso, code_inserts, jmp_target, METADATA["META_END_BINARYOP"])
             ip += 1
         elif opcode == "OP_JMPIFNOT_NP":
-            binary_stack.append(str(int_stack.pop()) + " && ")
+            binary_stack.append((int_stack.pop(), "&&"))
             jmp_target = get_jmp_target(dso, ip, code_inserts, offset)
             insert_code(dso, code_inserts, jmp_target, METADATA["META_END_BINARYOP"])
             ip += 1
         elif opcode == "META_END_BINARYOP":
             delete_code(dso, code_inserts, ip - 1)  # Delete the metadata we added to avoid desyncing absolute jumps.
             ip -= 1
-            op1 = binary_stack.pop()
-            op2 = str(int_stack.pop())
-            if "&&" in op2 or "||" in op2:
-                op2 = "(%s)" % op2
-            int_stack.append("%s%s" % (op1, op2))
+            op1, operator = binary_stack.pop()
+            int_stack.append(BinaryOperation(operator, op1, int_stack.pop()))
         elif opcode == "OP_JMPIFNOT" or opcode == "OP_JMPIFFNOT":
             # We need to determine the type of branch we're facing. The opcode just before the jump destination
             # gives us hints.
             jmp_target = get_jmp_target(dso, ip, code_inserts, offset)
             if jmp_target < ip:
-                print("Error: unexpected backward jump.", file=sys.stderr)
-                sys.exit(1)
+                raise DecompileError("Unexpected backward jump.")
             elif jmp_target == ip + 1:  # If statement with an empty body. Simply skip it.
                 ip += 1
                 if opcode == "OP_JMPIFNOT":
@@ -431,23 +456,23 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                         s_s, i_s, f_s = partial_decompile(dso, ip+1, dso.code[jmp_target - 1], in_function, offset)
                         if len(s_s) == 2:
                             op1 = s_s.pop()
-                            string_stack.append("(%s) ? %s : %s" % (int_stack.pop() if opcode == "OP_JMPIFNOT" else float_stack.pop(),
-                                                                  s_s.pop(),
-                                                                  op1))
+                            string_stack.append(Ternary(int_stack.pop() if opcode == "OP_JMPIFNOT" else float_stack.pop(),
+                                                        s_s.pop(),
+                                                        op1))
                             ip = dso.code[jmp_target - 1] # Skip past the construction
                             continue
                         elif len(i_s) == 2:
                             op1 = i_s.pop()
-                            int_stack.append("(%s) ? %s : %s" % (int_stack.pop() if opcode == "OP_JMPIFNOT" else float_stack.pop(),
-                                                               i_s.pop(),
-                                                               op1))
+                            int_stack.append(Ternary(int_stack.pop() if opcode == "OP_JMPIFNOT" else float_stack.pop(),
+                                                     i_s.pop(),
+                                                     op1))
                             ip = dso.code[jmp_target - 1]
                             continue
                         elif len(f_s) == 2:
                             op1 = f_s.pop()
-                            float_stack.append("(%s) ? %s : %s" % (int_stack.pop() if opcode == "OP_JMPIFNOT" else float_stack.pop(),
-                                                                 f_s.pop(),
-                                                                 op1))
+                            float_stack.append(Ternary(int_stack.pop() if opcode == "OP_JMPIFNOT" else float_stack.pop(),
+                                                       f_s.pop(),
+                                                       op1))
                             ip = dso.code[jmp_target - 1]
                             continue
                     except:
@@ -495,63 +520,47 @@ def decompile(dso, sink=None, in_function=False, offset=0):
             ip += 1
             indentation += 1
         elif opcode == "OP_NOT":
-            op1 = str(int_stack.pop())
-            if op1.count("==") == 1:
-                int_stack.append(op1.replace("==", "!="))
-            elif op1.count("!=") == 1:
-                int_stack.append(op1.replace("!=", "=="))
-            elif op1.count("$=") == 1:
-                int_stack.append(op1.replace("$=", "!$="))
-            elif op1.count("!$=") == 1:
-                int_stack.append(op1.replace("!$=", "$="))
-            elif not op1.startswith("!"):
-                int_stack.append("!%s" % op1)
-            elif " " in op1:
-                int_stack.append("!(%s)" % op1)  # Encase in parentheses if this is a compound operation
-            else:
-                int_stack.append(op1[1:])  # Avoid "!!" in front of variables
+            # Comparisons are inverted, and parentheses are added if this is a compound operation.
+            int_stack.append(negate(int_stack.pop()))
         elif opcode == "OP_NOTF":
             op1 = float_stack.pop()
-            if isinstance(op1, str):
-                if not op1.startswith("!"):
-                    int_stack.append("!%s" % op1)
-                else:
-                    int_stack.append(op1[1:])  # Avoid "!!" in front of variables
+            if isinstance(op1, (str, Expression)):
+                int_stack.append(negate(op1, flip_comparisons=False))
             else:  # The VM replaces true and false with 0 and 1.
                 int_stack.append("false" if float(op1) == 0 else "true")
         elif opcode == "OP_MUL":
+            # Parentheses are added where the operator precedence requires them.
             op1 = float_stack.pop()
-            if isinstance(op1, str) and (' + ' in op1 or " - " in op1):
-                op1 = "(%s)" % op1  # operand is the result of an add/sub, prevent priority issues.
-            float_stack.append("%s * %s" % (op1, float_stack.pop()))
+            float_stack.append(BinaryOperation("*", op1, float_stack.pop()))
         elif opcode == "OP_DIV":
             op1 = float_stack.pop()
-            if isinstance(op1, str) and ('+' in op1 or " -" in op1):
-                op1 = "(%s)" % op1  # operand is the result of an add/sub, prevent priority issues.
-            float_stack.append("%s / %s" % (op1, float_stack.pop()))
+            float_stack.append(BinaryOperation("/", op1, float_stack.pop()))
         elif opcode == "OP_ADD":
-            float_stack.append("%s + %s" % (float_stack.pop(), float_stack.pop()))
+            op1 = float_stack.pop()
+            float_stack.append(BinaryOperation("+", op1, float_stack.pop()))
         elif opcode == "OP_SUB":
-            float_stack.append("%s - %s" % (float_stack.pop(), float_stack.pop()))
+            op1 = float_stack.pop()
+            float_stack.append(BinaryOperation("-", op1, float_stack.pop()))
         elif opcode == "OP_NEG":
             op1 = float_stack.pop()
-            if op1 is not str:
+            if not isinstance(op1, (str, Expression)):
                 float_stack.append(-1 * op1)
+            elif isinstance(op1, UnaryOperation) and op1.operator == "-":
+                float_stack.append(op1.operand)
             else:
-                if op1.startswith("-"):
-                    float_stack.append(op1[1:])
-                else:
-                    float_stack.append("(-1 *%s)" % op1)
+                float_stack.append(UnaryOperation("-", op1))
         elif opcode == "OP_MOD":
             op = int_stack.pop()
-            int_stack.append("%s %% %s" % (int_stack.pop(), op))
+            int_stack.append(BinaryOperation("%", int_stack.pop(), op))
         elif opcode == "OP_COMPARE_STR":
             op = string_stack.pop()
-            int_stack.append("%s $= %s" % (string_stack.pop(), op))
+            int_stack.append(BinaryOperation("$=", string_stack.pop(), op))
         elif opcode == "OP_FLT_TO_STR":
-            string_stack.append(str(float_stack.pop()))
+            op = float_stack.pop()
+            string_stack.append(op if isinstance(op, Expression) else str(op))
         elif opcode == "OP_UINT_TO_STR":
-            string_stack.append(str(int_stack.pop()))
+            op = int_stack.pop()
+            string_stack.append(op if isinstance(op, Expression) else str(op))
         elif opcode == "OP_BREAK":
             pass  # Ignore breakpoints
         elif opcode == "META_ELSE":
@@ -572,22 +581,22 @@ def decompile(dso, sink=None, in_function=False, offset=0):
                 int_stack.pop()  # A test condition will have been pushed and needs to be cleaned.
         elif opcode == "OP_BITOR":
             op = int_stack.pop()
-            int_stack.append("%s | %s" % (int_stack.pop(), op)) # kind of winged this and it worked
+            int_stack.append(BinaryOperation("|", int_stack.pop(), op)) # kind of winged this and it worked
         elif opcode == "OP_BITAND":
             op = int_stack.pop()
-            int_stack.append("%s & %s" % (int_stack.pop(), op))
+            int_stack.append(BinaryOperation("&", int_stack.pop(), op))
         elif opcode == "OP_SHR":
             op = int_stack.pop()
-            int_stack.append("%s >> %s" % (int_stack.pop(), op))
+            int_stack.append(BinaryOperation(">>", int_stack.pop(), op))
         elif opcode == "OP_SHL":
             op = int_stack.pop()
-            int_stack.append("%s << %s" % (int_stack.pop(), op))
+            int_stack.append(BinaryOperation("<<", int_stack.pop(), op))
         elif opcode == "OP_AND":
             op = int_stack.pop()
-            int_stack.append("%s && %s" % (int_stack.pop(), op))
+            int_stack.append(BinaryOperation("&&", int_stack.pop(), op))
         elif opcode == "OP_OR":
             op = int_stack.pop()
-            int_stack.append("%s || %s" % (int_stack.pop(), op))
+            int_stack.append(BinaryOperation("||", int_stack.pop(), op))
         elif opcode == "OP_ASSERT":
             print(indentation*"\t" + "assert(\"%s\");" % dso.get_string(dso.code[ip], in_function), file=sink)
             ip += 1
@@ -604,8 +613,7 @@ def decompile(dso, sink=None, in_function=False, offset=0):
         elif opcode == "OP_ITER":
             ip += 1
         else:
-            print("%s not implemented yet. Stopped at ip=%d." % (opcode, ip), file=sys.stderr)
-            sys.exit(1)
+            raise DecompileError("%s not implemented yet." % opcode)
 
         # Keep the last few opcodes in memory
         previous_opcodes.pop()
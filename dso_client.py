@@ -0,0 +1,154 @@
+from __future__ import print_function
+import sys
+import os
+import argparse
+import base64
+import json
+import socket
+
+from parse_dso import find_dso_files, get_output_path, backup_dso
+from dso_server import DEFAULT_SOCKET
+from function_cache import DEFAULT_MAX_SIZE
+
+
+def decompile_remote(requests, socket_path=DEFAULT_SOCKET):
+    """
+    Sends decompilation requests to a running dso_server.py.
+    @param  requests    A list of dictionaries as described in dso_server.handle_request.
+    @return The responses, in the same order as the requests.
+    """
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.connect(socket_path)
+    try:
+        for i, request in enumerate(requests):
+            request["id"] = i
+            s.sendall((json.dumps(request) + "\n").encode("UTF-8"))
+        s.shutdown(socket.SHUT_WR)
+        responses = [None] * len(requests)
+        for line in s.makefile("rb"):
+            response = json.loads(line.decode("UTF-8"))
+            if response.get("id") is not None:
+                responses[response["id"]] = response
+    finally:
+        s.close()
+    return responses
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decompile DSO files using a running dso_server.py. The options "
+                                                 "are the same as parse_dso.py's.")
+    parser.add_argument("file", metavar='file', nargs="+", help="The DSO file to decompile.")
+    parser.add_argument("--stdout", action="store_true", help="Dump the decompiled script to stdout.")
+    parser.add_argument("--line-comments", action="store_true", help="Indicate the lines of the original script "
+                                                                     "with // line N comments.")
+    parser.add_argument("--source-map", action="store_true", help="Write a .map file (JSON) next to the output, "
+                                                                  "mapping its lines to the lines of the original "
+                                                                  "script.")
+    parser.add_argument("--disassemble", action="store_true", help="Print a listing of the bytecode to stdout "
+                                                                   "instead of decompiling it.")
+    parser.add_argument("--cache", metavar="path", help="A database in which decompiled functions are kept (opened "
+                                                        "by the server).")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), metavar="MB",
+                        help="The maximum size of the cache (default: %d MB)." % (DEFAULT_MAX_SIZE // (1024 * 1024)))
+    parser.add_argument("--keep-going", action="store_true", help="Decompile functions separately, and replace "
+                                                                  "the ones which can't be decompiled by their "
+                                                                  "disassembly instead of stopping.")
+    parser.add_argument("--validate", action="store_true", help="Check the bytecode of each file before "
+                                                                "decompiling it, and skip the invalid ones.")
+    parser.add_argument("--errors", metavar="path", help="With --keep-going or --validate, write the list of "
+                                                         "errors to this file (JSON).")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="The path of the server's socket "
+                                                                 "(default: %s)." % DEFAULT_SOCKET)
+    parser.add_argument("--send-data", action="store_true", help="Send the contents of the files instead of their "
+                                                                 "path, i.e. if the server can't access them.")
+    args = parser.parse_args()
+    if args.source_map and args.stdout:
+        parser.error("--source-map needs an output file to describe, it can't be used with --stdout.")
+    options = {}
+    for option in ("line_comments", "disassemble", "keep_going", "validate"):
+        if getattr(args, option):
+            options[option] = True
+    if args.cache:
+        options["cache"] = os.path.abspath(args.cache)
+        options["cache_size"] = args.cache_size * 1024 * 1024
+
+    jobs = []  # (decompiled file, output file)
+    for path in args.file:
+        # Verify that the path exists.
+        if not os.path.exists(path):
+            print("[!] Error: could not find %s" % path, file=sys.stderr)
+            continue
+        for f in find_dso_files(path):
+            if args.stdout or args.disassemble:
+                jobs.append((f, None))
+            else:
+                outfile = get_output_path(f)
+                jobs.append((backup_dso(f), outfile))
+
+    requests = []
+    for f, outfile in jobs:
+        if args.send_data:
+            with open(f, 'rb') as fd:
+                request = {"data": base64.b64encode(fd.read()).decode("ascii")}
+        else:
+            request = {"path": os.path.abspath(f)}
+        request["options"] = dict(options)
+        if args.source_map:
+            request["options"]["source_map"] = outfile
+        requests.append(request)
+    try:
+        responses = decompile_remote(requests, args.socket)
+    except socket.error as e:
+        print("[!] Error: could not reach the server on %s: %s" % (args.socket, e), file=sys.stderr)
+        sys.exit(1)
+
+    failed = False
+    all_errors = []
+    for (f, outfile), response in zip(jobs, responses):
+        if response is not None and response.get("problems"):
+            failed = True
+            print("[!] Error: %s is invalid and will not be decompiled:\n\t%s" % (f, "\n\t".join(response["problems"])),
+                  file=sys.stderr)
+            all_errors.append({"file": f, "function": None, "ip": None, "opcode": None, "line": None,
+                               "error": " ".join(response["problems"])})
+        elif response is None or not response["ok"]:
+            failed = True
+            if response is not None and "ip" in response:
+                line = response.get("line")
+                print("Error encountered at ip=%d (%s%s) while decompiling %s."
+                      % (response["ip"], response["opcode"], ", line %d" % line if line is not None else "", f),
+                      file=sys.stderr)
+            print("[!] Error: %s could not be decompiled: %s" % (f, response["error"] if response else "no response"),
+                  file=sys.stderr)
+        else:
+            errors = response.get("errors", [])
+            for error in errors:
+                error["file"] = f
+                print("[!] Error: could not decompile %s in %s at ip=%s (%s%s): %s"
+                      % (error["function"] or "top-level code", f, error["ip"], error["opcode"],
+                         ", line %d" % error["line"] if error["line"] is not None else "", error["error"]),
+                      file=sys.stderr)
+            all_errors.extend(errors)
+            if outfile is None:
+                sys.stdout.write(response["code"])
+            else:
+                with open(outfile, 'w') as out:
+                    out.write(response["code"])
+                if "source_map" in response:
+                    with open("%s.map" % outfile, "w") as out:
+                        json.dump(response["source_map"], out, indent=1)
+                if errors:
+                    print("%s decompiled to %s with %d error(s)." % (f, outfile, len(errors)))
+                else:
+                    print("%s successfully decompiled to %s." % (f, outfile))
+    if args.errors:
+        with open(args.errors, "w") as out:
+            json.dump(all_errors, out, indent=1)
+    if all_errors:
+        print("[!] %d error(s) encountered." % len(all_errors), file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
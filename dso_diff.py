@@ -0,0 +1,134 @@
+from __future__ import print_function
+import sys
+import os
+import argparse
+import difflib
+import hashlib
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from parse_dso import DSOFile
+from decompile import decompile
+from bytecode import find_functions, extract_function, hash_function
+
+
+def list_dso_files(root):
+    """
+    Returns the paths of the .cs.dso files located under root, relative to it.
+    """
+    files = set()
+    for dirpath, dirnames, filenames in os.walk(root):
+        for f in filenames:
+            if f.endswith(".cs.dso"):
+                files.add(os.path.relpath(os.path.join(dirpath, f), root))
+    return files
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def function_name(function):
+    name = "%s::%s" % (function.namespace, function.name) if function.namespace else function.name
+    if function.package:
+        name = "%s (package %s)" % (name, function.package)
+    return name
+
+
+def index_functions(dso):
+    """
+    Maps the name of every function of a DSO file to its declaration and hash.
+    A function may be declared several times in the same file: later declarations get a #n suffix.
+    """
+    functions = {}
+    for function in find_functions(dso):
+        name = function_name(function)
+        key = name
+        i = 1
+        while key in functions:
+            key = "%s #%d" % (name, i)
+            i += 1
+        functions[key] = (function, hash_function(dso, function))
+    return functions
+
+
+def decompile_function(dso, function):
+    out = StringIO()
+    decompile(extract_function(dso, function), sink=out)
+    return out.getvalue().splitlines(True)
+
+
+def diff_file(old_path, new_path, label, show_text=True, sink=None):
+    """
+    Compares the functions of two versions of a DSO file.
+    @return A (added, removed, modified) tuple of function counts.
+    """
+    if sink is None:
+        sink = sys.stdout
+    old_dso = DSOFile(old_path) if old_path else None
+    new_dso = DSOFile(new_path) if new_path else None
+    old_functions = index_functions(old_dso) if old_dso else {}
+    new_functions = index_functions(new_dso) if new_dso else {}
+
+    added = sorted(set(new_functions) - set(old_functions))
+    removed = sorted(set(old_functions) - set(new_functions))
+    modified = sorted(name for name in set(old_functions) & set(new_functions)
+                      if old_functions[name][1] != new_functions[name][1])
+    for name in added:
+        print("[+] %s: %s" % (label, name), file=sink)
+    for name in removed:
+        print("[-] %s: %s" % (label, name), file=sink)
+    for name in modified:
+        print("[*] %s: %s" % (label, name), file=sink)
+        if show_text:
+            # Only the functions which changed are decompiled.
+            old_text = decompile_function(old_dso, old_functions[name][0])
+            new_text = decompile_function(new_dso, new_functions[name][0])
+            sink.writelines(difflib.unified_diff(old_text, new_text, "a/%s" % label, "b/%s" % label))
+    return len(added), len(removed), len(modified)
+
+
+def diff_trees(old_root, new_root, show_text=True, sink=None):
+    """
+    Compares the functions of the DSO files located in two directories.
+    @return A (added, removed, modified) tuple of function counts.
+    """
+    old_files = list_dso_files(old_root)
+    new_files = list_dso_files(new_root)
+    totals = [0, 0, 0]
+    for f in sorted(old_files | new_files):
+        old_path = os.path.join(old_root, f) if f in old_files else None
+        new_path = os.path.join(new_root, f) if f in new_files else None
+        if old_path and new_path and file_digest(old_path) == file_digest(new_path):
+            continue  # Identical files can't contain any change.
+        counts = diff_file(old_path, new_path, f, show_text, sink)
+        totals = [t + c for t, c in zip(totals, counts)]
+    return tuple(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the script functions which changed between two "
+                                                 "versions of a game's DSO files.")
+    parser.add_argument("old", help="The DSO file or directory of the old version.")
+    parser.add_argument("new", help="The DSO file or directory of the new version.")
+    parser.add_argument("--no-text", action="store_true", help="Only list the functions, don't decompile "
+                                                                 "the modified ones to show a diff.")
+    args = parser.parse_args()
+    for path in (args.old, args.new):
+        if not os.path.exists(path):
+            print("[!] Error: could not find %s" % path, file=sys.stderr)
+            sys.exit(1)
+
+    if os.path.isdir(args.old) and os.path.isdir(args.new):
+        added, removed, modified = diff_trees(args.old, args.new, not args.no_text)
+    else:
+        added, removed, modified = diff_file(args.old, args.new, os.path.basename(args.new), not args.no_text)
+    print("%d function(s) added, %d removed, %d modified." % (added, removed, modified))
+
+
+if __name__ == "__main__":
+    main()
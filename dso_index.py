@@ -0,0 +1,232 @@
+from __future__ import print_function
+import sys
+import os
+import re
+import argparse
+import sqlite3
+import struct
+import time
+
+from parse_dso import DSOFile, find_dso_files
+
+# Increase this when the tokenization changes, so that the index is rebuilt.
+INDEX_FORMAT = 1
+TOKEN_REGEXP = re.compile(r"\w+", re.UNICODE)
+
+
+def read_string_tables(path):
+    """
+    Reads the two StringTables of a DSO file, without loading the rest of it.
+    @return A generator of (in_function, offset, string) tuples.
+    """
+    with open(path, 'rb') as f:
+        f.read(4)  # Version
+        for in_function in (False, True):
+            data = f.read(4)
+            if len(data) < 4:
+                raise ValueError("Unexpected end of file.")
+            size, = struct.unpack("<L", data)
+            table = f.read(size)
+            offset = 0
+            for s in table.split(b"\x00"):
+                if s:
+                    yield in_function, offset, DSOFile.decode_string_table(s).rstrip("\n")
+                offset += len(s) + 1
+
+
+def get_tokens(s):
+    return set(TOKEN_REGEXP.findall(s.lower()))
+
+
+def get_trigrams(s):
+    s = s.lower()
+    return set(s[i:i + 3] for i in range(0, len(s) - 2))
+
+
+class StringIndex(object):
+    """
+    Inverted index of the strings found in the StringTables of a collection of DSO files, stored in an SQLite
+    database. Each distinct string is stored once, along with the list of files and offsets where it appears,
+    and the words and trigrams it contains point back to it. Token queries are answered with the words, and
+    substring queries with the trigrams (then checked against the strings themselves).
+    Files are only indexed again when their size or modification time changes.
+    """
+    def __init__(self, path="dso_index.db"):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        if row is not None and int(row[0]) != INDEX_FORMAT:
+            for table in ("files", "strings", "occurrences", "tokens", "trigrams"):
+                self.db.execute("DROP TABLE IF EXISTS %s" % table)
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('format', ?)", (str(INDEX_FORMAT),))
+        self.db.execute("CREATE TABLE IF NOT EXISTS files "
+                        "(id INTEGER PRIMARY KEY, path TEXT UNIQUE, size INTEGER, mtime REAL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS strings (id INTEGER PRIMARY KEY, value TEXT UNIQUE)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS occurrences "
+                        "(string INTEGER, file INTEGER, in_function INTEGER, offset INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS occurrences_string ON occurrences (string)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS occurrences_file ON occurrences (file)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS tokens "
+                        "(token TEXT, string INTEGER, PRIMARY KEY (token, string)) WITHOUT ROWID")
+        self.db.execute("CREATE TABLE IF NOT EXISTS trigrams "
+                        "(trigram TEXT, string INTEGER, PRIMARY KEY (trigram, string)) WITHOUT ROWID")
+        self.db.commit()
+
+    def get_string_id(self, value):
+        row = self.db.execute("SELECT id FROM strings WHERE value = ?", (value,)).fetchone()
+        if row is not None:
+            return row[0]
+        string_id = self.db.execute("INSERT INTO strings (value) VALUES (?)", (value,)).lastrowid
+        self.db.executemany("INSERT INTO tokens VALUES (?, ?)", ((t, string_id) for t in get_tokens(value)))
+        self.db.executemany("INSERT INTO trigrams VALUES (?, ?)", ((t, string_id) for t in get_trigrams(value)))
+        return string_id
+
+    def remove_file(self, file_id):
+        self.db.execute("DELETE FROM occurrences WHERE file = ?", (file_id,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def add_file(self, path):
+        """
+        Indexes (or indexes again) a DSO file.
+        """
+        row = self.db.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self.remove_file(row[0])
+        strings = list(read_string_tables(path))
+        file_id = self.db.execute("INSERT INTO files (path, size, mtime) VALUES (?, ?, ?)",
+                                  (path, os.path.getsize(path), os.path.getmtime(path))).lastrowid
+        self.db.executemany("INSERT INTO occurrences VALUES (?, ?, ?, ?)",
+                            ((self.get_string_id(s), file_id, in_function, offset)
+                             for in_function, offset, s in strings))
+
+    def remove_orphans(self):
+        """
+        Deletes the strings which don't appear in any file anymore, along with their postings.
+        """
+        orphans = self.db.execute("SELECT id, value FROM strings WHERE id NOT IN "
+                                  "(SELECT DISTINCT string FROM occurrences)").fetchall()
+        for string_id, value in orphans:
+            self.db.executemany("DELETE FROM tokens WHERE token = ? AND string = ?",
+                                ((t, string_id) for t in get_tokens(value)))
+            self.db.executemany("DELETE FROM trigrams WHERE trigram = ? AND string = ?",
+                                ((t, string_id) for t in get_trigrams(value)))
+            self.db.execute("DELETE FROM strings WHERE id = ?", (string_id,))
+        return len(orphans)
+
+    def update(self, paths):
+        """
+        Brings the index up to date with the DSO files found in the given paths: new and modified files are
+        indexed, and files which were indexed under these paths but don't exist anymore are removed.
+        @return The number of files (indexed, unchanged, removed), and a list of (path, error) for the files which
+                couldn't be read.
+        """
+        indexed = unchanged = removed = 0
+        errors = []
+        found = set()
+        for root in paths:
+            root = os.path.abspath(root)
+            for path in find_dso_files(root):
+                found.add(path)
+                row = self.db.execute("SELECT size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+                if row is not None and row[0] == os.path.getsize(path) and row[1] == os.path.getmtime(path):
+                    unchanged += 1
+                    continue
+                try:
+                    self.add_file(path)
+                    indexed += 1
+                except (ValueError, struct.error, IOError) as e:
+                    errors.append((path, str(e)))
+            prefix = root if not os.path.isdir(root) else os.path.join(root, "")
+            for file_id, path in self.db.execute("SELECT id, path FROM files WHERE path = ? OR substr(path, 1, ?) = ?",
+                                                 (root, len(prefix), prefix)).fetchall():
+                if path not in found:
+                    self.remove_file(file_id)
+                    removed += 1
+        self.remove_orphans()
+        self.db.commit()
+        return indexed, unchanged, removed, errors
+
+    def find_strings(self, table, keys):
+        """
+        @return The IDs of the strings which have all the given keys in the tokens or trigrams table.
+        """
+        keys = list(keys)
+        return [row[0] for row in self.db.execute(
+            "SELECT string FROM %s WHERE %s IN (%s) GROUP BY string HAVING COUNT(*) = ?"
+            % (table, table[:-1], ", ".join("?" * len(keys))), keys + [len(keys)])]
+
+    def search(self, query, token=False):
+        """
+        Looks for strings containing the query (case insensitive).
+        @param  token   Match whole words (as delimited by TOKEN_REGEXP) instead of any substring.
+        @return A list of (path, in_function, offset, string) tuples.
+        """
+        if token:
+            keys = get_tokens(query)
+            candidates = self.find_strings("tokens", keys) if keys else []
+        else:
+            keys = get_trigrams(query)
+            if keys:
+                candidates = self.find_strings("trigrams", keys)
+            else:  # The query is too short to use the trigrams.
+                candidates = [row[0] for row in self.db.execute("SELECT id FROM strings WHERE instr(lower(value), ?)",
+                                                                (query.lower(),))]
+        results = []
+        lowered = query.lower()
+        for string_id in candidates:
+            value, = self.db.execute("SELECT value FROM strings WHERE id = ?", (string_id,)).fetchone()
+            if not token and lowered not in value.lower():
+                continue  # All the trigrams are there, but not in the right order.
+            results.extend(self.db.execute("SELECT files.path, in_function, offset, ? FROM occurrences "
+                                           "JOIN files ON files.id = occurrences.file WHERE string = ?",
+                                           (value, string_id)).fetchall())
+        results.sort()
+        return results
+
+    def stats(self):
+        return "%d file(s), %d distinct string(s), %d occurrence(s)." % tuple(
+            self.db.execute("SELECT COUNT(*) FROM %s" % table).fetchone()[0]
+            for table in ("files", "strings", "occurrences"))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the strings of DSO files to find which scripts mention "
+                                                 "something without decompiling them.")
+    parser.add_argument("path", nargs="*", help="DSO files or directories containing them, to add to the index "
+                                                "or update.")
+    parser.add_argument("--index", default="dso_index.db", help="The index (default: dso_index.db).")
+    parser.add_argument("--search", "-s", help="List the strings containing this text.")
+    parser.add_argument("--token", "-t", help="List the strings containing these words.")
+    args = parser.parse_args()
+
+    with StringIndex(args.index) as index:
+        if args.path:
+            start = time.time()
+            indexed, unchanged, removed, errors = index.update(args.path)
+            for path, error in errors:
+                print("[!] Error: could not index %s: %s" % (path, error), file=sys.stderr)
+            print("%d file(s) indexed, %d unchanged, %d removed in %.2fs. The index contains %s"
+                  % (indexed, unchanged, removed, time.time() - start, index.stats()), file=sys.stderr)
+        for query, token in ((args.search, False), (args.token, True)):
+            if query is None:
+                continue
+            start = time.time()
+            results = index.search(query, token)
+            for path, in_function, offset, value in results:
+                print("%s: %s@%d: %s" % (path, "function" if in_function else "global", offset, value))
+            print("%d result(s) in %.1f ms." % (len(results), 1000 * (time.time() - start)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
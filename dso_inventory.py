@@ -0,0 +1,108 @@
+from __future__ import print_function
+import sys
+import os
+import argparse
+import csv
+import json
+import struct
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_dso import DSOFile, find_dso_files
+from bytecode import find_functions
+from torque_vm_values import is_version_supported, OLDEST_VERSION, LATEST_VERSION
+
+FIELDS = ["path", "file_size", "version", "supported", "global_string_table_size", "function_string_table_size",
+          "global_floats", "function_floats", "code_size", "linebreak_pairs", "functions", "error"]
+
+
+def read_u32(f):
+    data = f.read(4)
+    if len(data) < 4:
+        raise ValueError("Unexpected end of file at offset %d." % f.tell())
+    return struct.unpack("<L", data)[0]
+
+
+def scan_file(path, count_functions=False):
+    """
+    Reads the sizes found in the header of a DSO file. The tables themselves are skipped, and the bytecode
+    is only read if the functions have to be counted.
+    @return A dictionary with the keys listed in FIELDS.
+    """
+    info = dict.fromkeys(FIELDS)
+    info["path"] = path
+    try:
+        info["file_size"] = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            info["version"] = read_u32(f)
+            info["supported"] = is_version_supported(info["version"])
+            info["global_string_table_size"] = read_u32(f)
+            f.seek(info["global_string_table_size"], os.SEEK_CUR)
+            info["function_string_table_size"] = read_u32(f)
+            f.seek(info["function_string_table_size"], os.SEEK_CUR)
+            info["global_floats"] = read_u32(f)
+            f.seek(8 * info["global_floats"], os.SEEK_CUR)
+            info["function_floats"] = read_u32(f)
+            f.seek(8 * info["function_floats"], os.SEEK_CUR)
+            info["code_size"] = read_u32(f)
+            info["linebreak_pairs"] = read_u32(f)
+            if f.tell() > info["file_size"]:
+                raise ValueError("The tables extend past the end of the file.")
+        if count_functions and info["supported"]:
+            info["functions"] = len(find_functions(DSOFile(path)))
+    except Exception as e:
+        info["error"] = "%s: %s" % (type(e).__name__, e)
+    return info
+
+
+def write_csv(inventory, out):
+    writer = csv.DictWriter(out, FIELDS)
+    writer.writeheader()
+    for info in inventory:
+        writer.writerow(info)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the DSO files found in a directory along with their version "
+                                                 "and the size of their tables, without decompiling them.")
+    parser.add_argument("path", nargs="+", help="DSO files or directories containing them.")
+    parser.add_argument("--output", "-o", help="Write the inventory to this file (.csv or .json). Default is a CSV "
+                                               "on stdout.")
+    parser.add_argument("--functions", action="store_true", help="Also count the functions (requires reading the "
+                                                                 "bytecode).")
+    parser.add_argument("--workers", type=int, help="The number of worker processes (default: one per CPU).")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.path:
+        if not os.path.exists(path):
+            print("[!] Error: could not find %s" % path, file=sys.stderr)
+            continue
+        files.extend(find_dso_files(path))
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        inventory = list(pool.map(scan_file, files, [args.functions] * len(files),
+                                  chunksize=max(1, len(files) // (8 * (args.workers or os.cpu_count() or 1)))))
+
+    if args.output and args.output.endswith(".json"):
+        with open(args.output, "w") as f:
+            json.dump(inventory, f, indent=1)
+    elif args.output:
+        with open(args.output, "w") as f:
+            write_csv(inventory, f)
+    else:
+        write_csv(inventory, sys.stdout)
+
+    versions = Counter(info["version"] for info in inventory if info["error"] is None)
+    print("%d file(s). Versions: %s" % (len(inventory), ", ".join("%d (%d file(s))" % (v, n) for v, n in
+                                                                   sorted(versions.items()))), file=sys.stderr)
+    for info in inventory:
+        if info["error"] is not None:
+            print("[!] Error: %s: %s" % (info["path"], info["error"]), file=sys.stderr)
+        elif not info["supported"]:
+            print("[!] %s: version %d is not supported (only versions %d to %d are, see torque_vm_values.py)."
+                  % (info["path"], info["version"], OLDEST_VERSION, LATEST_VERSION), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+from __future__ import print_function
+import sys
+import os
+import argparse
+import csv
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from parse_dso import DSOFile, find_dso_files
+from bytecode import iter_instructions
+
+CSV_FIELDS = ["file", "line", "function", "datablock", "class", "name", "parent", "container", "field", "value"]
+
+# Stack effects of the opcodes whose result can't be known without running the code. Their results are
+# represented by None.
+FLOAT_OPERATIONS = {"OP_ADD", "OP_SUB", "OP_MUL", "OP_DIV"}  # Two floats -> float
+INT_OPERATIONS = {"OP_MOD", "OP_BITAND", "OP_BITOR", "OP_XOR", "OP_SHL", "OP_SHR", "OP_AND", "OP_OR"}
+COMPARISONS = {"OP_CMPEQ", "OP_CMPLT", "OP_CMPNE", "OP_CMPGR", "OP_CMPGE", "OP_CMPLE"}  # Two floats -> int
+INT_JUMPS = {"OP_JMPIF", "OP_JMPIFNOT", "OP_JMPIF_NP", "OP_JMPIFNOT_NP"}
+FLOAT_JUMPS = {"OP_JMPIFF", "OP_JMPIFFNOT"}
+
+
+def pop(stack):
+    # The code isn't followed through jumps, so the stacks may not always be balanced.
+    return stack.pop() if stack else None
+
+
+def top(stack):
+    return stack[-1] if stack else None
+
+
+def extract_objects(dso):
+    """
+    Lists the objects and datablocks created by a DSO file by walking its bytecode once. Only the stacks are
+    followed (control flow isn't recovered and no code is generated), so values computed at runtime (variables,
+    function calls, arithmetic...) can't be known: they are reported as None.
+    @return A list of dictionaries (class, name, parent, fields...) in the order in which the objects are declared.
+            Fields of arrays are named "field[index]".
+    """
+    objects = []
+    string_stack = []
+    int_stack = []
+    float_stack = []
+    arguments = []
+    creating = []  # Objects whose declaration is being read
+    new_object = False  # Whether fields are assigned to the object being created (OP_SETCUROBJECT_NEW)
+    current_field = None
+    function = None
+    function_end = None
+    code = dso.code
+
+    for ip, opcode, operands in iter_instructions(dso):
+        if function_end is not None and ip >= function_end:
+            function = function_end = None
+        in_function = function is not None
+        values = [code[pos] for kind, pos in operands]
+
+        if opcode == "OP_FUNC_DECL":
+            function = dso.get_string(values[0])
+            if values[1]:
+                function = "%s::%s" % (dso.get_string(values[1]), function)
+            function_end = values[4]
+        elif opcode == "OP_LOADIMMED_STR" or opcode == "OP_TAG_TO_STR":
+            string_stack.append(dso.get_string(values[0], in_function))
+        elif opcode == "OP_LOADIMMED_IDENT":
+            string_stack.append(dso.get_string(values[0]))  # Always pick from the global pool
+        elif opcode == "OP_LOADIMMED_UINT":
+            int_stack.append(values[0])
+        elif opcode == "OP_LOADIMMED_FLT":
+            float_stack.append(dso.get_float(values[0], in_function))
+        elif opcode in ("OP_LOADVAR_STR", "OP_LOADFIELD_STR", "OP_CALLFUNC", "OP_CALLFUNC_RESOLVE"):
+            if opcode.startswith("OP_CALLFUNC"):
+                pop(arguments)
+            string_stack.append(None)
+        elif opcode == "OP_LOADVAR_UINT" or opcode == "OP_LOADFIELD_UINT":
+            int_stack.append(None)
+        elif opcode == "OP_LOADVAR_FLT" or opcode == "OP_LOADFIELD_FLT":
+            float_stack.append(None)
+        elif opcode == "OP_STR_TO_UINT" or opcode == "OP_FLT_TO_UINT":
+            int_stack.append(pop(string_stack if opcode == "OP_STR_TO_UINT" else float_stack))
+        elif opcode == "OP_STR_TO_FLT" or opcode == "OP_UINT_TO_FLT":
+            float_stack.append(pop(string_stack if opcode == "OP_STR_TO_FLT" else int_stack))
+        elif opcode == "OP_FLT_TO_STR" or opcode == "OP_UINT_TO_STR":
+            string_stack.append(pop(float_stack if opcode == "OP_FLT_TO_STR" else int_stack))
+        elif opcode == "OP_STR_TO_NONE" or opcode == "OP_SETCURVAR_ARRAY" or opcode == "OP_SETCURVAR_ARRAY_CREATE" \
+                or opcode == "OP_SETCUROBJECT" or opcode == "OP_RETURN":
+            pop(string_stack)
+            if opcode == "OP_SETCUROBJECT":
+                new_object = False
+        elif opcode == "OP_UINT_TO_NONE" or opcode in INT_JUMPS:
+            pop(int_stack)
+        elif opcode == "OP_FLT_TO_NONE" or opcode in FLOAT_JUMPS:
+            pop(float_stack)
+        elif opcode == "OP_REWIND_STR":
+            s2 = pop(string_stack)
+            s1 = pop(string_stack)
+            string_stack.append(s1 + s2 if s1 is not None and s2 is not None else None)
+        elif opcode == "OP_ADVANCE_STR_APPENDCHAR" or opcode == "OP_ADVANCE_STR_COMMA":
+            s = pop(string_stack)
+            string_stack.append(s + (chr(values[0]) if operands else ",") if s is not None else None)
+        elif opcode == "OP_COMPARE_STR":
+            pop(string_stack)
+            pop(string_stack)
+            int_stack.append(None)
+        elif opcode in FLOAT_OPERATIONS or opcode in INT_OPERATIONS or opcode in COMPARISONS:
+            operand_stack = int_stack if opcode in INT_OPERATIONS else float_stack
+            pop(operand_stack)
+            pop(operand_stack)
+            (float_stack if opcode in FLOAT_OPERATIONS else int_stack).append(None)
+        elif opcode == "OP_NOT" or opcode == "OP_ONESCOMPLEMENT":
+            pop(int_stack)
+            int_stack.append(None)
+        elif opcode == "OP_NOTF":
+            pop(float_stack)
+            int_stack.append(None)
+        elif opcode == "OP_NEG":
+            pop(float_stack)
+            float_stack.append(None)
+        elif opcode == "OP_PUSH_FRAME":
+            arguments.append([])
+        elif opcode == "OP_PUSH":
+            if not arguments:
+                arguments.append([])  # Old versions don't seem to push stack frames all the time.
+            arguments[-1].append(pop(string_stack))
+        elif opcode == "OP_SETCUROBJECT_NEW":
+            new_object = True
+        elif opcode == "OP_SETCUROBJECT_INTERNAL":
+            int_stack.append(pop(string_stack))
+            new_object = False
+        elif opcode == "OP_SETCURFIELD":
+            current_field = dso.get_string(values[0])
+        elif opcode == "OP_SETCURFIELD_ARRAY":
+            # The value is pushed first, then the index.
+            index = pop(string_stack)
+            current_field = "%s[%s]" % (current_field, index if index is not None else "?")
+        elif opcode in ("OP_SAVEFIELD_STR", "OP_SAVEFIELD_UINT", "OP_SAVEFIELD_FLT"):
+            if new_object and creating:
+                if opcode == "OP_SAVEFIELD_STR":
+                    value = top(string_stack)
+                    if value is None and dso.version <= 36 and not string_stack:
+                        value = ""
+                else:
+                    value = top(int_stack if opcode == "OP_SAVEFIELD_UINT" else float_stack)
+                creating[-1]["fields"][current_field] = value
+        elif opcode == "OP_CREATE_OBJECT":
+            argv = pop(arguments) or []
+            parent = dso.get_string(values[0])
+            objects.append(OrderedDict([("line", dso.get_line(ip)),
+                                        ("function", function),
+                                        ("datablock", bool(values[1])),
+                                        ("class", argv[0] if argv else None),
+                                        ("name", argv[1] if len(argv) > 1 else None),
+                                        ("parent", parent or None),
+                                        ("container", creating[-1]["name"] if creating else None),
+                                        ("arguments", argv[2:]),
+                                        ("fields", OrderedDict())]))
+            creating.append(objects[-1])
+        elif opcode == "OP_ADD_OBJECT":
+            # Like in decompile(), the handle of the object replaces the 0 pushed before a root object.
+            if dso.version >= 45:
+                if values[0]:
+                    pop(int_stack)
+                int_stack.append(None)
+        elif opcode == "OP_END_OBJECT":
+            pop(creating)
+            handle = pop(int_stack)
+            if dso.version < 45 or values[0]:  # The handle of nested objects is given to their parent.
+                int_stack.append(handle)
+    return objects
+
+
+def scan_file(path):
+    """
+    @return The objects declared in a DSO file (see extract_objects) and an error message, if any.
+    """
+    try:
+        objects = extract_objects(DSOFile(path))
+    except Exception as e:
+        return [], "%s: %s" % (type(e).__name__, e)
+    return [OrderedDict([("file", path)] + list(o.items())) for o in objects], None
+
+
+def write_csv(objects, out):
+    """
+    Writes one row per field, which is what spreadsheets handle best.
+    """
+    writer = csv.DictWriter(out, CSV_FIELDS)
+    writer.writeheader()
+    for o in objects:
+        row = dict((k, o[k]) for k in CSV_FIELDS[:-2])
+        if not o["fields"]:
+            writer.writerow(row)
+        for field, value in o["fields"].items():
+            row["field"] = field
+            row["value"] = value
+            writer.writerow(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract the objects and datablocks declared in DSO files, "
+                                                 "without decompiling them.")
+    parser.add_argument("path", nargs="+", help="DSO files or directories containing them.")
+    parser.add_argument("--output", "-o", help="Write the objects to this file (.csv or .json). Default is a CSV "
+                                               "on stdout.")
+    parser.add_argument("--datablocks", action="store_true", help="Only extract datablocks.")
+    parser.add_argument("--class", dest="classes", action="append", help="Only extract objects of this class. "
+                                                                         "Can be repeated.")
+    parser.add_argument("--workers", type=int, help="The number of worker processes (default: one per CPU).")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.path:
+        if not os.path.exists(path):
+            print("[!] Error: could not find %s" % path, file=sys.stderr)
+            continue
+        files.extend(find_dso_files(path))
+
+    objects = []
+    with ProcessPoolExecutor(args.workers) as pool:
+        for f, (found, error) in zip(files, pool.map(scan_file, files, chunksize=max(1, len(files) // (
+                8 * (args.workers or os.cpu_count() or 1))))):
+            if error is not None:
+                print("[!] Error: %s: %s" % (f, error), file=sys.stderr)
+            objects.extend(o for o in found if (o["datablock"] or not args.datablocks) and
+                           (not args.classes or o["class"] in args.classes))
+
+    if args.output and args.output.endswith(".json"):
+        with open(args.output, "w") as f:
+            json.dump(objects, f, indent=1)
+    elif args.output:
+        with open(args.output, "w") as f:
+            write_csv(objects, f)
+    else:
+        write_csv(objects, sys.stdout)
+    print("%d object(s) found in %d file(s)." % (len(objects), len(files)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from __future__ import print_function
+import sys
+import os
+import argparse
+import base64
+import json
+import queue
+import signal
+import socket
+import socketserver
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+
+from parse_dso import DSOFile, LineAnnotator, decompile_keep_going, get_error_location
+from decompile import decompile
+from bytecode import disassemble, validate
+from function_cache import FunctionCache, DEFAULT_MAX_SIZE
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), "dso_server.sock")
+
+# The FunctionCaches opened by this worker process, by path.
+CACHES = {}
+
+
+def get_cache(path, max_size=DEFAULT_MAX_SIZE):
+    cache = CACHES.get(path)
+    if cache is None:
+        cache = CACHES[path] = FunctionCache(path, max_size)
+    return cache
+
+
+def handle_request(request):
+    """
+    Decompiles the DSO described by a request. Runs in one of the worker processes.
+    @param  request A dictionary containing either a "path" or the base64 encoded "data" of the file,
+                    and optionally "options", which are the options of parse_dso.py: "line_comments",
+                    "source_map" (the name of the output file, the map is returned in the response),
+                    "disassemble", "keep_going", "validate", "cache" (path of a FunctionCache on the server)
+                    and "cache_size" (in bytes).
+    @return The response to send back to the client.
+    """
+    response = {"id": request.get("id")}
+    options = request.get("options", {})
+    dso = None
+    try:
+        if "data" in request:
+            dso = DSOFile.from_bytes(base64.b64decode(request["data"]))
+        else:
+            dso = DSOFile(request["path"])
+        if options.get("validate"):
+            problems = validate(dso)
+            if problems:
+                response["ok"] = False
+                response["error"] = "The file is invalid and was not decompiled."
+                response["problems"] = problems
+                return response
+        out = StringIO()
+        if options.get("disassemble"):
+            disassemble(dso, out, lines=True)
+        else:
+            sink = out
+            if options.get("line_comments") or options.get("source_map"):
+                sink = LineAnnotator(out, dso, comments=options.get("line_comments", False))
+            cache = get_cache(options["cache"], options.get("cache_size", DEFAULT_MAX_SIZE)) \
+                if options.get("cache") else None
+            try:
+                if options.get("keep_going"):
+                    response["errors"] = decompile_keep_going(dso, sink=sink, cache=cache)
+                else:
+                    decompile(dso, sink=sink, cache=cache)
+            finally:
+                if cache is not None:
+                    cache.commit()  # Other workers use the same database.
+            if options.get("source_map"):
+                response["source_map"] = sink.get_source_map(options["source_map"])
+        response["ok"] = True
+        response["code"] = out.getvalue()
+    except (Exception, SystemExit) as e:  # A worker must always answer.
+        response["ok"] = False
+        response["error"] = "%s: %s" % (type(e).__name__, e)
+        location = get_error_location(sys.exc_info()[2])
+        if location is not None:
+            response["ip"], response["opcode"] = location
+            if dso is not None:
+                response["line"] = dso.get_line(location[0])
+    return response
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Each connection sends one JSON request per line. Requests are dispatched to the worker pool as soon
+    as they are read and responses are written back as they complete, so they may arrive out of order:
+    clients should match them using the "id" field.
+    """
+    def handle(self):
+        self.finished = queue.Queue()
+        reader = threading.Thread(target=self.read_requests)
+        reader.daemon = True
+        reader.start()
+        # Responses are written by this thread only, as the requests complete: a client which doesn't read its
+        # socket blocks its own connection, not the pool or the other clients.
+        submitted = None
+        sent = 0
+        while submitted is None or sent < submitted:
+            item = self.finished.get()
+            if isinstance(item, int):  # All the requests have been read
+                submitted = item
+            elif isinstance(item, dict):  # Invalid request
+                self.send(item)
+            else:
+                sent += 1
+                try:
+                    self.send(item.result())
+                except Exception as e:  # The worker died
+                    self.send({"ok": False, "error": "%s: %s" % (type(e).__name__, e)})
+
+    def read_requests(self):
+        """
+        Submits the requests to the worker pool as they are read. The futures are put in self.finished when they
+        complete, followed by the number of requests once the client is done sending them.
+        """
+        submitted = 0
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line.decode("UTF-8"))
+                except ValueError as e:
+                    self.finished.put({"ok": False, "error": "Invalid request: %s" % e})
+                    continue
+                self.server.pool.submit(handle_request, request).add_done_callback(self.finished.put)
+                submitted += 1
+        except (socket.error, ValueError):
+            pass  # The client went away
+        finally:
+            self.finished.put(submitted)
+
+    def send(self, response):
+        data = (json.dumps(response) + "\n").encode("UTF-8")
+        try:
+            self.wfile.write(data)
+            self.wfile.flush()
+        except (socket.error, ValueError):
+            pass  # The client went away
+
+
+class DecompilerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, workers=None):
+        if os.path.exists(path):
+            os.remove(path)  # Stale socket left by a previous instance
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        self.pool = ProcessPoolExecutor(workers)
+        # Start the workers right away so that the first requests don't pay for it.
+        for future in [self.pool.submit(int) for i in range(0, workers or os.cpu_count() or 1)]:
+            future.result()
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.shutdown()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep the DSO decompiler running in the background and serve "
+                                                 "requests sent through a Unix socket (see dso_client.py).")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="The path of the socket to listen on "
+                                                                 "(default: %s)." % DEFAULT_SOCKET)
+    parser.add_argument("--workers", type=int, help="The number of worker processes (default: one per CPU).")
+    args = parser.parse_args()
+
+    server = DecompilerServer(args.socket, args.workers)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Clean up the socket when killed.
+    print("*** Listening on %s" % args.socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
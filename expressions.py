@@ -0,0 +1,299 @@
+from torque_vm_values import STRING_OPERATORS
+
+
+# Operator precedence, taken from the TorqueScript grammar. Higher values bind tighter.
+PRECEDENCE = {
+    "?":    1,
+    "||":   2,
+    "&&":   3,
+    "|":    4,
+    "^":    5,
+    "&":    6,
+    "==":   7,
+    "!=":   7,
+    "<":    8,
+    "<=":   8,
+    ">":    8,
+    ">=":   8,
+    "@":    9,
+    "SPC":  9,
+    "TAB":  9,
+    "NL":   9,
+    "$=":   9,
+    "!$=":  9,
+    "<<":   10,
+    ">>":   10,
+    "+":    11,
+    "-":    11,
+    "*":    12,
+    "/":    12,
+    "%":    12,
+}
+SEQUENCE_PRECEDENCE = 0
+UNARY_PRECEDENCE = 13
+ATOM_PRECEDENCE = 14
+
+NEGATED_COMPARISON = {
+    "==":   "!=",
+    "!=":   "==",
+    "$=":   "!$=",
+    "!$=":  "$=",
+}
+
+
+def write(parts, value, min_precedence=0):
+    """
+    Appends the code of a value found on one of the VM stacks to parts. Expressions binding less tightly
+    than min_precedence are encased in parentheses. Anything which isn't an Expression (variable names,
+    literals, numbers) is atomic.
+    """
+    if isinstance(value, Expression):
+        if value.precedence < min_precedence:
+            parts.append("(")
+            value.render(parts)
+            parts.append(")")
+        else:
+            value.render(parts)
+    else:
+        parts.append(str(value))
+
+
+def is_compound(value):
+    return isinstance(value, Expression) and value.precedence < ATOM_PRECEDENCE
+
+
+class Expression(object):
+    """
+    Base class of the nodes pushed on the VM stacks during the decompilation. The code is only generated
+    when a statement is printed.
+    """
+    __slots__ = ()
+    precedence = ATOM_PRECEDENCE
+
+    def render(self, parts):
+        raise NotImplementedError()
+
+    def __str__(self):
+        parts = []
+        self.render(parts)
+        return "".join(parts)
+
+
+class BinaryOperation(Expression):
+    __slots__ = ("operator", "left", "right", "precedence")
+
+    def __init__(self, operator, left, right):
+        self.operator = operator
+        self.left = left
+        self.right = right
+        self.precedence = PRECEDENCE[operator]
+
+    def render(self, parts):
+        write(parts, self.left, self.precedence)
+        parts.append(" %s " % self.operator)
+        if self.operator == "&&" or self.operator == "||":
+            # Always encase nested boolean operations in parentheses for readability.
+            write(parts, self.right, PRECEDENCE["&&"] + 1)
+        else:
+            write(parts, self.right, self.precedence + 1)
+
+    def negate(self):
+        """
+        Returns the opposite comparison, or None if this operation isn't a comparison.
+        """
+        if self.operator in NEGATED_COMPARISON:
+            return BinaryOperation(NEGATED_COMPARISON[self.operator], self.left, self.right)
+        return None
+
+
+class UnaryOperation(Expression):
+    __slots__ = ("operator", "operand")
+    precedence = UNARY_PRECEDENCE
+
+    def __init__(self, operator, operand):
+        self.operator = operator
+        self.operand = operand
+
+    def render(self, parts):
+        parts.append(self.operator)
+        write(parts, self.operand, UNARY_PRECEDENCE)
+
+
+def negate(value, flip_comparisons=True):
+    """
+    Returns the logical negation of a value, avoiding "!!" in front of variables.
+    """
+    if isinstance(value, UnaryOperation) and value.operator == "!":
+        return value.operand
+    if flip_comparisons and isinstance(value, BinaryOperation):
+        negated = value.negate()
+        if negated is not None:
+            return negated
+    return UnaryOperation("!", value)
+
+
+class Ternary(Expression):
+    __slots__ = ("condition", "if_true", "if_false")
+    precedence = PRECEDENCE["?"]
+
+    def __init__(self, condition, if_true, if_false):
+        self.condition = condition
+        self.if_true = if_true
+        self.if_false = if_false
+
+    def render(self, parts):
+        parts.append("(")
+        write(parts, self.condition)
+        parts.append(") ? ")
+        write(parts, self.if_true, self.precedence + 1)
+        parts.append(" : ")
+        write(parts, self.if_false, self.precedence)
+
+
+class AppendedChar(Expression):
+    """
+    A string on which OP_ADVANCE_STR_APPENDCHAR or OP_ADVANCE_STR_COMMA was used. The character tells
+    which operator the next OP_REWIND_STR stands for.
+    """
+    __slots__ = ("value", "char")
+
+    def __init__(self, value, char):
+        self.value = value
+        self.char = char
+
+    @property
+    def precedence(self):
+        return self.value.precedence if isinstance(self.value, Expression) else ATOM_PRECEDENCE
+
+    def render(self, parts):
+        write(parts, self.value)
+        parts.append(self.char)
+
+
+class Sequence(Expression):
+    """
+    Comma separated values, i.e. matrix indexes.
+    """
+    __slots__ = ("left", "right")
+    precedence = SEQUENCE_PRECEDENCE
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def render(self, parts):
+        write(parts, self.left)
+        parts.append(",")
+        write(parts, self.right)
+
+
+def concatenate(s1, s2):
+    """
+    Builds the expression corresponding to an OP_REWIND_STR.
+    """
+    if isinstance(s1, AppendedChar):
+        if s1.char in STRING_OPERATORS:
+            return BinaryOperation(STRING_OPERATORS[s1.char], s1.value, s2)
+        elif s1.char == ",":  # Matrix indexing
+            return Sequence(s1.value, s2)
+    return BinaryOperation("@", s1, s2)
+
+
+class ArrayAccess(Expression):
+    __slots__ = ("array", "index")
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    def render(self, parts):
+        write(parts, self.array, ATOM_PRECEDENCE)
+        parts.append("[")
+        write(parts, self.index)
+        parts.append("]")
+
+
+class FieldAccess(Expression):
+    __slots__ = ("object", "field")
+
+    def __init__(self, object, field):
+        self.object = object
+        self.field = field
+
+    def render(self, parts):
+        write(parts, self.object, ATOM_PRECEDENCE)
+        parts.append(".%s" % self.field)
+
+
+class Call(Expression):
+    __slots__ = ("function_name", "namespace", "arguments", "call_type")
+
+    def __init__(self, function_name, namespace="", arguments=None, call_type="FunctionCall"):
+        self.function_name = function_name
+        self.namespace = namespace
+        self.arguments = arguments if arguments is not None else []
+        self.call_type = call_type
+
+    def render(self, parts):
+        # Sanitize arguments. Their name may be omitted if they are unused.
+        arguments = [arg if isinstance(arg, Expression) or arg else "%%unused_var_%d" % i
+                     for i, arg in enumerate(self.arguments)]
+        if self.namespace != "":
+            parts.append("%s::" % self.namespace)
+        if self.call_type == "MethodCall":
+            # The caller name may have been constructed dynamically, i.e. (Objh @ "andle").call()
+            write(parts, arguments[0], ATOM_PRECEDENCE)
+            parts.append(".")
+            arguments = arguments[1:]
+        parts.append("%s(" % self.function_name)
+        for i, arg in enumerate(arguments):
+            if i > 0:
+                parts.append(", ")
+            write(parts, arg)
+        parts.append(")")
+
+
+def pretty_print_function(function_name, namespace="", arguments=None, call_type="FunctionCall"):
+    return str(Call(function_name, namespace, arguments, call_type))
+
+
+class ObjectDeclaration(Expression):
+    """
+    An object or datablock declaration. Fields and nested objects are stored as they are encountered
+    and the code is only generated once, when the declaration is printed.
+    """
+    __slots__ = ("header", "indentation", "entries")
+
+    def __init__(self, header, indentation):
+        self.header = header
+        self.indentation = indentation
+        # (indentation, field, value) for fields, (indentation, ObjectDeclaration) for nested objects
+        # and (indentation,) where OP_END_OBJECT closed the declaration.
+        self.entries = []
+
+    def add_field(self, indentation, field, value):
+        self.entries.append((indentation, field, value))
+
+    def add_object(self, indentation, declaration):
+        self.entries.append((indentation, declaration))
+
+    def close(self, indentation):
+        self.entries.append((indentation,))
+
+    def render(self, parts):
+        if self.entries and len(self.entries[0]) == 1:  # Empty object declaration, omit body.
+            parts.append(self.header)
+        else:
+            parts.append("%s\n%s{\n" % (self.header, self.indentation*"\t"))
+        for i, entry in enumerate(self.entries):
+            if len(entry) == 1:
+                if i > 0:
+                    parts.append(entry[0]*"\t" + "}")
+            elif len(entry) == 3:
+                parts.append(entry[0]*"\t" + "%s = " % entry[1])
+                write(parts, entry[2])
+                parts.append(";\n")
+            else:
+                parts.append(entry[0]*"\t")
+                entry[1].render(parts)
+                parts.append("\n")
@@ -1,51 +1,123 @@
 #!/bin/python
 
+import argparse
+import atexit
 import hashlib
 import socket
-import zlib
 import sys
 
+from lobby_cache import LobbyCache
+from lobby_events import EventStream, FORMATS
+from lobby_history import LobbyHistory
+from mt_pack import EncounterPack
+from lobby_protocol import Dispatcher, MessageReader, RecordingSocket, receive_compressed
+from mt_stream import EncounterPipeline, receive_encounter
+
 HOST = "62.197.39.230"
 PORT = 28021
 
-ACTIVE_GAMES = []
+CACHE = LobbyCache(history=LobbyHistory())
+ENCOUNTERS = None  # The EncounterPack (see mt_pack.py) the encounters are stored in, opened by main().
+EVENTS = None  # An EventStream (see lobby_events.py) if --events was given.
+
+
+def emit(type, **fields):
+    if EVENTS is not None:
+        EVENTS.emit(type, **fields)
+
+
+def store_encounter(encounter):
+    if encounter.game_id is None:
+        print "[!] Error: received an encounter without a header."
+        return
+    ENCOUNTERS.add(encounter.data, encounter.game_id)
+    emit("encounter", game_id=encounter.game_id, size=len(encounter.data),
+         units=len(encounter.units) if encounter.units is not None else None)
+    print "Storing MultiTurn data for game #%d (%s units)." % (encounter.game_id, len(encounter.units) if encounter.units is not None else "unknown")
+
+
+# Encounters are parsed while they are received and stored by a separate thread.
+PIPELINE = EncounterPipeline(store_encounter)
 
 
 def hash_password(password, salt):
     return hashlib.md5(salt + hashlib.md5(password).hexdigest().upper()).hexdigest().upper()
 
 
-def handle_writefile(s, commandline):
-    data = s.recv(10000)
-    decompress = zlib.decompressobj(-zlib.MAX_WBITS)
-    filename = commandline.split("\t")[1]
+def print_online_players(cached=False):
+    emit("online_players", count=CACHE.online_count, cached=cached,
+         players=[{"name": p.name, "level": p.level} for p in CACHE.players.values()])
+    print "%s online players: " % CACHE.online_count
+    for player in CACHE.players.values():
+        print "\t%s (%s)" % (player.name, player.level)
+
+
+def print_active_games(cached=False):
+    emit("active_games", cached=cached,
+         games=[{"id": g.id, "type": g.type, "opponent": g.opponent} for g in CACHE.active_games.values()])
+    if CACHE.active_games:
+        print "Active games:"
+        for game in CACHE.active_games.values():
+            print "\t%s against %s (#%s)" % (game.type, game.opponent, game.id)
+
+
+def print_unknown(s, message):
+    emit("unknown", line=message.line)
+    print "*** Received: %s" % message.line
+
+
+DISPATCHER = Dispatcher(default=print_unknown)
+
+
+@DISPATCHER.register("writeFile")
+def handle_writefile(s, message):
+    filename = message.args[0]
+    if filename.endswith(".enc"):
+        encounter = receive_encounter(s)
+        s.send("fileFinished\t%s" % filename)
+        PIPELINE.submit(encounter)
+        return
+
+    content = receive_compressed(s)
     s.send("fileFinished\t%s" % filename)
 
-    # Handle special files
+    # Handle special files. Their contents are cached and only parsed again if they changed.
     if filename == "psychoff/rankings.txt": # Online players
-        lines = decompress.decompress(data).split("\n")
-        print "%s online players: " % lines[0]
-        for line in lines[1:]:
-            print "\t%s (%s)" % (line.split("\t")[0], line.split("\t")[1])
+        CACHE.store(filename, content)
+        print_online_players()
         return
 
     if filename == "psychoff/activeGames.txt": # Active games
-        game_list = decompress.decompress(data).split("\n")
-        if len(game_list) > 1:
-            print "Active games:"
-            for line in game_list[1:]:
-                game_details = line.split("\t")
-                print "\t%s against %s (#%s)" % (game_details[2], game_details[1], game_details[0])
-                ACTIVE_GAMES.append(game_details[0])
-                return
-
-    if filename.endswith(".enc"):
-        print "Dumping MultiTurn data."
-        with open("testMT.enc", "w") as f:
-            f.write(data)
+        CACHE.store(filename, content)
+        print_active_games()
         return
 
-    return decompress.decompress(data)
+    CACHE.store(filename, content)
+    emit("file_received", filename=filename, content=content, cached=False)
+    print "File received: %s:\n----------\n%s\n----------" % (filename, content)
+
+
+@DISPATCHER.register("setMyStats")
+def handle_set_my_stats(s, message):
+    emit("stats", level=message.args[0], arguments=message.args[1:])
+    print "You are currently level %s." % message.args[0]
+
+
+@DISPATCHER.register("HasDLCStatus")
+def handle_dlc_status(s, message):
+    emit("dlc_status", active=message.args[0] == "1")
+    print "Red DLC is activated for your account!" if message.args[0] == "1" else "Red DLC is not activated for your account."
+
+
+@DISPATCHER.register("ping")
+def handle_ping(s, message):
+    emit("ping")
+    print "* Server ping *"
+
+
+@DISPATCHER.register("ack", "SetSocketMode", "oppDisplayStatusChanged")
+def ignore(s, message):
+    pass
 
 
 def login(s, username, password):
@@ -54,6 +126,7 @@ def login(s, username, password):
     salt = salt_rec.split("\t")[-2]
     s.send("textcom\tlogin\t%s\t%s\t33\n" % (username, hash_password(password, salt)))
     logged_in = s.recv(1024)
+    emit("login", username=username, success="loggedIn" in logged_in)
     if "loggedIn" in logged_in:
         print "*** Successfully logged in as %s!" % username
         return True
@@ -62,40 +135,60 @@ def login(s, username, password):
         return False
 
 
-s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-s.connect((HOST, PORT))
-if not login(s, "[username]", "[password]"):
-    sys.exit(-1)
-
-s.send("textcom\tcommand\tsetMyOS\twindows.steam\n")
-s.send("textcom\tcommand\trefreshPeopleOnline\n")
-s.send("textcom\tcommand\trequestHomeScreen\n")  # Request home screen messages
-# s.send("textcom\tcommand\tselectMT\t[game ID]\n")
-
-while True:
-    data = s.recv(1024)
-    requests = data.split("\n")
-    for request in requests:
-        if not request: continue
-
-        splitted = request.split("\t")
-
-        if splitted[0] == "writeFile":
-            read = handle_writefile(s, request)
-            if read:
-                print "File received: %s:\n----------\n%s\n----------" % (request.split("\t")[1], read)
-
-        elif splitted[0] == "textcom" and splitted[1] == "command":
-            if splitted[2] == "setMyStats":
-                print "You are currently level %s." % splitted[3]
-            elif splitted[2] == "HasDLCStatus":
-                print "Red DLC is activated for your account!" if splitted[3] == "1" else "Red DLC is not activated for your account."
-            elif splitted[2] == "ping":
-                print "* Server ping *"
-            elif splitted[2] == "ack" or splitted[2] == "SetSocketMode" or splitted[2] == "oppDisplayStatusChanged":
-                continue
-            else:
-                print "*** Received: %s" % request
-
-        else:
-            print "*** Received: %s" % request
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Log into the Frozen Synapse lobby.")
+    parser.add_argument("--record", metavar="file", help="Save the traffic received from the server (it can be "
+                                                         "played back by bench_lobby.py).")
+    parser.add_argument("--events", metavar="destination", help="Also write what happens as events for other "
+                                                                "programs: a file or named pipe, - for stdout (the "
+                                                                "usual output then goes to stderr), or unix:[path] "
+                                                                "for a local socket.")
+    parser.add_argument("--event-format", choices=FORMATS, default="jsonl", help="jsonl (default) or msgpack "
+                                                                                   "(requires the msgpack module).")
+    parser.add_argument("--batch-size", type=int, default=100, help="Events are written by batches of this size "
+                                                                    "(default: 100)...")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="...or after this many seconds "
+                                                                          "(default: 1).")
+    args = parser.parse_args()
+
+    global EVENTS, ENCOUNTERS
+    if args.events:
+        EVENTS = EventStream(args.events, args.event_format, args.batch_size, args.flush_interval)
+        atexit.register(EVENTS.close)
+        if args.events == "-":
+            sys.stdout = sys.stderr  # Keep the events alone on stdout: the usual output goes to stderr.
+
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.connect((HOST, PORT))
+    if args.record:
+        s = RecordingSocket(s, args.record)
+    if not login(s, "[username]", "[password]"):
+        sys.exit(-1)
+
+    s.send("textcom\tcommand\tsetMyOS\twindows.steam\n")
+    # Only ask for the files which aren't in the cache or have expired.
+    if CACHE.is_fresh("psychoff/activeGames.txt"):
+        print_active_games(cached=True)
+    if CACHE.is_fresh("psychoff/rankings.txt"):
+        print_online_players(cached=True)
+    else:
+        s.send("textcom\tcommand\trefreshPeopleOnline\n")
+    if CACHE.is_fresh("psychoff/homeSc.txt"):
+        emit("file_received", filename="psychoff/homeSc.txt", content=CACHE.get("psychoff/homeSc.txt"), cached=True)
+        print "File received: psychoff/homeSc.txt:\n----------\n%s\n----------" % CACHE.get("psychoff/homeSc.txt")
+    else:
+        s.send("textcom\tcommand\trequestHomeScreen\n")  # Request home screen messages
+    # s.send("textcom\tcommand\tselectMT\t[game ID]\n")
+
+    ENCOUNTERS = EncounterPack("encounters.pack")
+    try:
+        reader = MessageReader(s)
+        for message in reader:
+            DISPATCHER.dispatch(reader, message)
+    finally:
+        PIPELINE.close()  # Store the encounters which are still queued before the pack's index is written.
+        ENCOUNTERS.close()
+
+
+if __name__ == "__main__":
+    main()
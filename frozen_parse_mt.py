@@ -1,9 +1,23 @@
+from __future__ import print_function
 import sys
 import struct
+from collections import namedtuple
+
+MT_MAGIC = b"\x06\x00\x00\x00"
+
+Unit = namedtuple("Unit", ["type", "team", "x", "y", "waypoints"])
+# Layout of the unit records, as far as it is understood.
+UNIT_COUNT = struct.Struct("<L")
+UNIT_TYPE_SIZE = struct.Struct("xB")
+UNIT_TEAM = struct.Struct(">2xL12x")
+UNIT_POSITION = struct.Struct("<l8x2f8x")  # Number of waypoints, x, y
+WAYPOINT_SIZE = 22
 
 
 class MTHeader:
     def __init__(self, header):
+        if not isinstance(header, str):
+            header = header.decode("latin-1")
         splitted = header.split("\t")
         self.id = int(splitted[0])  # Game ID
         self.opponent = splitted[2]
@@ -52,31 +66,71 @@ class MTHeader:
         return s
 
 
+def read_mt_header(f):
+    """
+    Reads the header of an MT file.
+    @param  f   A file object positioned at the beginning of the MT data.
+    @return The MTHeader, or None if the file doesn't have one.
+    """
+    if f.read(4) != MT_MAGIC:
+        raise ValueError("Wrong magic!")
+
+    header_size, = struct.unpack("B", f.read(1))
+    if header_size > 0:
+        return MTHeader(f.read(header_size))
+    return None
+
+
 def parse_mt(path):
     with open(path, 'rb') as f:
-        if f.read(4) != "\x06\x00\x00\x00":
-            print "Wrong magic!"
+        try:
+            h = read_mt_header(f)
+        except ValueError as e:
+            print(e)
             return
+        if h is not None:
+            print(h)
+
 
-        header_size, = struct.unpack("B", f.read(1))
-        if header_size > 0:
-            header = f.read(header_size)
-            h = MTHeader(header)
-            print h
+def skip_zero(f):
+    """
+    Skips a zero byte separating two parts of the file.
+    @return False if the byte wasn't zero, which means the parser is out of sync with the data.
+    """
+    return f.read(1) == b"\x00"
 
-        """if not skip_zero(f): return
-        number_of_units, = struct.unpack("L", f.read(4))
-        if not skip_zero(f): return
-        print "Number of units: %d" % number_of_units
+
+def read_units(f):
+    """
+    Reads the units which follow the header. This part of the format hasn't been completely reversed:
+    only the type, team, position and number of waypoints of each unit are known, and the waypoints are skipped.
+    @param  f   A file object positioned right after the header.
+    @return A list of Units, or None if the data doesn't look as expected (or is truncated).
+    """
+    try:
+        if not skip_zero(f):
+            return None
+        number_of_units, = UNIT_COUNT.unpack(f.read(UNIT_COUNT.size))
+        if not skip_zero(f):
+            return None
+        units = []
         for i in range(0, number_of_units):
-            type_size, = struct.unpack("xB", f.read(2))
+            type_size, = UNIT_TYPE_SIZE.unpack(f.read(UNIT_TYPE_SIZE.size))
             type = f.read(type_size)
-            print hex(f.tell())
-            team, = struct.unpack(">2xL12x", f.read(18))
-            waypoints, x, y = struct.unpack("l8x2f8x", f.read(28))
-            print "%s (Player %d, X=%f, Y=%f, WP=%d)" % (type, team, x, y, waypoints)
-            f.read((waypoints - 1) * 22) # Burn waypoint info for now
-            print f.tell()"""
+            if len(type) != type_size:
+                return None
+            if not isinstance(type, str):
+                type = type.decode("latin-1")
+            team, = UNIT_TEAM.unpack(f.read(UNIT_TEAM.size))
+            waypoints, x, y = UNIT_POSITION.unpack(f.read(UNIT_POSITION.size))
+            units.append(Unit(type, team, x, y, waypoints))
+            skipped = max(0, (waypoints - 1) * WAYPOINT_SIZE)
+            if len(f.read(skipped)) != skipped:  # Burn waypoint info for now
+                return None
+    except struct.error:
+        return None
+    return units
+
 
 if __name__ == "__main__":
     parse_mt(sys.argv[1])
\ No newline at end of file
@@ -0,0 +1,93 @@
+from __future__ import print_function
+import sqlite3
+import time
+
+# Increase this when a change to the decompiler modifies its output, so that stale entries are discarded.
+CACHE_FORMAT = 2
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024  # Bytes of decompiled code
+
+
+class FunctionCache(object):
+    """
+    Stores the decompiled code of functions, indexed by the hash of their normalized bytecode (see
+    bytecode.hash_function). Since the hash doesn't depend on the location of the function or on the layout of
+    the DSO's tables, the same function found in different files or versions of a game is only decompiled once.
+    The cache is an SQLite database, and the least recently used entries are evicted once it exceeds max_size.
+    """
+    def __init__(self, path="function_cache.db", max_size=DEFAULT_MAX_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS functions "
+                        "(hash TEXT PRIMARY KEY, code TEXT, size INTEGER, last_used REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS functions_last_used ON functions (last_used)")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+        if row is None or int(row[0]) != CACHE_FORMAT:
+            self.db.execute("DELETE FROM functions")
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('format', ?)", (str(CACHE_FORMAT),))
+        self.size, = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM functions").fetchone()
+        self.db.commit()
+
+    def get(self, digest):
+        """
+        @return The decompiled code of the function, or None if it isn't in the cache.
+        """
+        row = self.db.execute("SELECT code FROM functions WHERE hash = ?", (digest,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.db.execute("UPDATE functions SET last_used = ? WHERE hash = ?", (time.time(), digest))
+        return row[0]
+
+    def put(self, digest, code):
+        size = len(code)
+        if size > self.max_size:
+            return
+        row = self.db.execute("SELECT size FROM functions WHERE hash = ?", (digest,)).fetchone()
+        if row is not None:
+            self.size -= row[0]
+        self.db.execute("INSERT OR REPLACE INTO functions VALUES (?, ?, ?, ?)", (digest, code, size, time.time()))
+        self.size += size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used functions until the cache fits in max_size.
+        """
+        for digest, size in self.db.execute("SELECT hash, size FROM functions ORDER BY last_used").fetchall():
+            if self.size <= self.max_size:
+                break
+            self.db.execute("DELETE FROM functions WHERE hash = ?", (digest,))
+            self.size -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM functions").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return "Function cache: %d hit(s), %d miss(es) (%.1f%% hit rate), %d eviction(s), %d function(s) " \
+               "totalling %d bytes." % (self.hits, self.misses, 100.0 * self.hits / lookups if lookups else 0,
+                                        self.evictions, len(self), self.size)
+
+    def commit(self):
+        """
+        Saves the changes, e.g. when other processes are using the same cache.
+        """
+        self.db.commit()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
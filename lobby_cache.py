@@ -0,0 +1,124 @@
+import base64
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple, OrderedDict
+
+from lobby_history import TRACKED_FILES
+
+
+Player = namedtuple("Player", ["name", "level", "extra"])
+Game = namedtuple("Game", ["id", "opponent", "type", "extra"])
+
+# How long (in seconds) a file received from the lobby server is considered up to date.
+DEFAULT_TTLS = {
+    "psychoff/homeSc.txt":          3600,
+    "psychoff/rankings.txt":        60,
+    "psychoff/activeGames.txt":     60,
+}
+
+
+def parse_rankings(content):
+    """
+    psychoff/rankings.txt: the number of online players, followed by one tab separated line per player.
+    """
+    players = OrderedDict()
+    for line in content.split("\n")[1:]:
+        if not line:
+            continue
+        fields = line.split("\t")
+        players[fields[0]] = Player(fields[0], fields[1] if len(fields) > 1 else None, tuple(fields[2:]))
+    return players
+
+
+def parse_active_games(content):
+    """
+    psychoff/activeGames.txt: a header line, followed by one tab separated line per game.
+    """
+    games = OrderedDict()
+    for line in content.split("\n")[1:]:
+        if not line:
+            continue
+        fields = line.split("\t")
+        games[fields[0]] = Game(fields[0], fields[1], fields[2], tuple(fields[3:]))
+    return games
+
+
+class LobbyCache(object):
+    """
+    Keeps the files sent by the lobby server (writeFile commands) between sessions, so they only have to be
+    requested again once they expire. Files are only parsed again when their contents actually change.
+    """
+    def __init__(self, path="lobby_cache.json", ttls=None, history=None):
+        """
+        @param  history A LobbyHistory in which the new versions of the players and games lists are recorded.
+        """
+        self.path = path
+        self.history = history
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.entries = {}  # filename -> {"hash", "time", "content"}
+        self.players = {}
+        self.active_games = {}
+        self.online_count = None  # As sent by the server
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            try:
+                entries = json.load(f)
+            except ValueError:
+                return  # Corrupt cache, start from scratch.
+        for filename, entry in entries.items():
+            entry["content"] = base64.b64decode(entry["content"].encode("ascii"))
+            self.entries[str(filename)] = entry
+            self.parse(str(filename))
+
+    def save(self):
+        entries = {}
+        for filename, entry in self.entries.items():
+            entries[filename] = {"hash": entry["hash"],
+                                 "time": entry["time"],
+                                 "content": base64.b64encode(entry["content"]).decode("ascii")}
+        with open(self.path, "w") as f:
+            json.dump(entries, f)
+
+    def store(self, filename, content):
+        """
+        Records a file received from the server.
+        @return Whether the contents of the file changed.
+        """
+        digest = hashlib.sha1(content).hexdigest()
+        entry = self.entries.get(filename)
+        changed = entry is None or entry["hash"] != digest
+        self.entries[filename] = {"hash": digest, "time": time.time(), "content": content}
+        if changed:
+            self.parse(filename)
+            if self.history is not None and filename in TRACKED_FILES:
+                self.history.append(filename, content)
+        self.save()
+        return changed
+
+    def is_fresh(self, filename):
+        entry = self.entries.get(filename)
+        return entry is not None and time.time() - entry["time"] < self.ttls.get(filename, 0)
+
+    def get(self, filename):
+        """
+        @return The contents of the file if they are up to date, or None.
+        """
+        return self.entries[filename]["content"] if self.is_fresh(filename) else None
+
+    def parse(self, filename):
+        content = self.entries[filename]["content"]
+        if not isinstance(content, str):
+            content = content.decode("latin-1")
+        if filename == "psychoff/rankings.txt":
+            self.online_count = content.split("\n")[0]
+            self.players = parse_rankings(content)
+        elif filename == "psychoff/activeGames.txt":
+            self.active_games = parse_active_games(content)
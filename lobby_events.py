@@ -0,0 +1,107 @@
+from __future__ import print_function
+import sys
+import json
+import socket
+import threading
+import time
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+FORMATS = ["jsonl", "msgpack"]
+
+
+class EventStream(object):
+    """
+    Writes typed events (dictionaries with a "type" and a "time") for other programs to consume, as JSON lines or
+    a stream of msgpack maps. Events are written in batches: when batch_size events are waiting, or every
+    flush_interval seconds (by a background thread), whichever comes first. At most batch_size events are held
+    in memory; if the reader is slow, emit blocks until the batch is written.
+    """
+    def __init__(self, destination, format="jsonl", batch_size=100, flush_interval=1.0):
+        """
+        @param  destination "-" for stdout, "unix:[path]" for a local socket, or the path of a file or named pipe
+                            (which is appended to).
+        """
+        if format == "msgpack" and msgpack is None:
+            raise ImportError("msgpack is not installed (pip install msgpack).")
+        self.format = format
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.lock = threading.Lock()
+        self.closed = False
+        self.s = None
+        self.f = None
+        self.close_file = destination != "-"
+        if destination == "-":
+            self.f = getattr(sys.stdout, "buffer", sys.stdout)
+        elif destination.startswith("unix:"):
+            self.s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.s.connect(destination[len("unix:"):])
+        else:
+            self.f = open(destination, "ab")
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def encode(self, event):
+        if self.format == "msgpack":
+            return msgpack.packb(event)
+        if sys.version_info[0] < 3:
+            return json.dumps(event, separators=(",", ":"), encoding="latin-1") + "\n"
+        return (json.dumps(event, separators=(",", ":")) + "\n").encode("UTF-8")
+
+    def emit(self, type, **fields):
+        fields["type"] = type
+        fields["time"] = time.time()
+        with self.lock:
+            if self.closed:
+                return
+            self.pending.append(self.encode(fields))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Writes the pending events. The lock must be held.
+        """
+        if not self.pending:
+            return
+        data = b"".join(self.pending)
+        self.pending = []
+        try:
+            if self.s is not None:
+                self.s.sendall(data)
+            else:
+                self.f.write(data)
+                self.f.flush()
+        except (IOError, OSError, socket.error) as e:  # The reader went away: stop writing, but keep running.
+            print("[!] Error: could not write events: %s" % e, file=sys.stderr)
+            self.closed = True
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            with self.lock:
+                if self.closed:
+                    return
+                self.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.flush()
+            self.closed = True
+            if self.s is not None:
+                self.s.close()
+            elif self.f is not None and self.close_file:
+                self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
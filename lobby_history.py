@@ -0,0 +1,251 @@
+from __future__ import print_function
+import argparse
+import bisect
+import json
+import os
+import time
+from collections import OrderedDict
+
+# The lobby files whose history is kept.
+TRACKED_FILES = ["psychoff/rankings.txt", "psychoff/activeGames.txt"]
+
+
+def parse_snapshot(content):
+    """
+    Splits a lobby file into its first line and its rows, indexed by their first field (player name or game ID).
+    """
+    if isinstance(content, bytes):
+        content = content.decode("latin-1")
+    lines = content.split("\n")
+    rows = OrderedDict()
+    for line in lines[1:]:
+        if line:
+            fields = line.split("\t")
+            rows[fields[0]] = fields[1:]
+    return lines[0], rows
+
+
+class LobbyHistory(object):
+    """
+    Append-only history of the lobby files, stored as JSON lines. Each record only contains the differences with
+    the previous snapshot of the same file (rows added, removed or changed), and every keyframe_interval
+    records, a full copy of the snapshot is added so that any point in time can be rebuilt without replaying
+    the whole file.
+    """
+    def __init__(self, path="lobby_history.jsonl", keyframe_interval=50):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.index = {}  # filename -> (times, offsets, keyframe flags)
+        self.last = {}  # filename -> (header, rows, records since the last keyframe) of the latest snapshot
+        self.size = 0  # Size of the valid part of the file
+        self.f = None  # Only opened for writing by append(), so that queries never modify the file.
+        self.load_index()
+
+    def load_index(self):
+        """
+        Reads the file once to find where the records of each lobby file are. Records of the different files
+        are interleaved.
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError()
+                    record = json.loads(line.decode("UTF-8"))
+                except ValueError:
+                    break  # Truncated record, i.e. the program was interrupted while writing it.
+                times, offsets, keyframes = self.index.setdefault(record["file"], ([], [], []))
+                times.append(record["time"])
+                offsets.append(offset)
+                keyframes.append("rows" in record)
+                offset += len(line)
+        self.size = offset
+
+    def open_for_writing(self):
+        if os.path.exists(self.path) and os.path.getsize(self.path) != self.size:
+            # Truncated record, i.e. the program was interrupted while writing it.
+            with open(self.path, "r+b") as f:
+                f.truncate(self.size)
+        self.f = open(self.path, "ab")
+
+    def append(self, filename, content, timestamp=None):
+        """
+        Records a new version of a lobby file.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        header, rows = parse_snapshot(content)
+        if filename not in self.last:
+            latest = self.snapshot_at(filename, float("inf"))
+            self.last[filename] = (latest[1], latest[2], self.records_since_keyframe(filename)) if latest else None
+        previous = self.last[filename]
+        previous_header, previous_rows, count = previous if previous else (None, {}, self.keyframe_interval)
+
+        record = OrderedDict([("time", timestamp), ("file", filename)])
+        if header != previous_header:
+            record["header"] = header
+        # Empty fields are omitted to save space.
+        added = dict((k, v) for k, v in rows.items() if k not in previous_rows)
+        removed = [k for k in previous_rows if k not in rows]
+        changed = dict((k, v) for k, v in rows.items() if k in previous_rows and previous_rows[k] != v)
+        if added:
+            record["added"] = added
+        if removed:
+            record["removed"] = removed
+        if changed:
+            record["changed"] = changed
+        count += 1
+        if count >= self.keyframe_interval:
+            record["header"] = header
+            record["rows"] = rows
+            count = 0
+
+        if self.f is None:
+            self.open_for_writing()
+        self.f.seek(0, os.SEEK_END)
+        offset = self.f.tell()
+        self.f.write((json.dumps(record, separators=(",", ":")) + "\n").encode("UTF-8"))
+        self.f.flush()
+        times, offsets, keyframes = self.index.setdefault(filename, ([], [], []))
+        times.append(timestamp)
+        offsets.append(offset)
+        keyframes.append("rows" in record)
+        self.last[filename] = (header, rows, count)
+
+    def records_since_keyframe(self, filename):
+        keyframes = self.index.get(filename, ([], [], []))[2]
+        count = 0
+        for is_keyframe in reversed(keyframes):
+            if is_keyframe:
+                return count
+            count += 1
+        return self.keyframe_interval  # No keyframe yet: the next record has to be one.
+
+    def iter_records(self, filename, start=None, end=None):
+        """
+        @return A generator of the raw records of a lobby file whose time is in [start, end].
+        """
+        times, offsets, keyframes = self.index.get(filename, ([], [], []))
+        first = 0 if start is None else bisect.bisect_left(times, start)
+        last = len(times) if end is None else bisect.bisect_right(times, end)
+        if first >= last:
+            return
+        with open(self.path, "rb") as f:
+            for i in range(first, last):
+                f.seek(offsets[i])  # The records of the other files are in between.
+                yield json.loads(f.readline().decode("UTF-8"))
+
+    def iter_snapshots(self, filename, start=None, end=None):
+        """
+        Rebuilds the successive versions of a lobby file.
+        @return A generator of (time, header, rows) tuples. rows maps the first field of each row to the others.
+        """
+        times, offsets, keyframes = self.index.get(filename, ([], [], []))
+        first = 0 if start is None else bisect.bisect_left(times, start)
+        if first >= len(times):
+            return
+        # Start from the closest keyframe.
+        keyframe = first
+        while keyframe > 0 and not keyframes[keyframe]:
+            keyframe -= 1
+        header = None
+        rows = OrderedDict()
+        for record in self.iter_records(filename, times[keyframe], end):
+            if "rows" in record:
+                header = record["header"]
+                rows = OrderedDict(record["rows"])
+            else:
+                if "header" in record:
+                    header = record["header"]
+                for k in record.get("removed", []):
+                    rows.pop(k, None)
+                rows.update(record.get("changed", {}))
+                rows.update(record.get("added", {}))
+            if start is None or record["time"] >= start:
+                yield record["time"], header, OrderedDict(rows)
+
+    def snapshot_at(self, filename, timestamp):
+        """
+        @return The (time, header, rows) of the version of a lobby file which was current at a given time, or None.
+        """
+        times, offsets, keyframes = self.index.get(filename, ([], [], []))
+        i = bisect.bisect_right(times, timestamp) - 1
+        if i < 0:
+            return None
+        snapshot = None
+        for snapshot in self.iter_snapshots(filename, times[i], times[i]):
+            pass
+        return snapshot
+
+    def iter_changes(self, filename, start=None, end=None):
+        """
+        Lists what happened between two dates without rebuilding the snapshots.
+        @return A generator of (time, added, removed, changed) tuples.
+        """
+        for record in self.iter_records(filename, start, end):
+            yield record["time"], record.get("added", {}), record.get("removed", []), record.get("changed", {})
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def parse_time(s):
+    """
+    Accepts a UNIX timestamp or a date such as "2016-05-21 18:30".
+    """
+    try:
+        return float(s)
+    except ValueError:
+        for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+            try:
+                return time.mktime(time.strptime(s, fmt))
+            except ValueError:
+                pass
+    raise argparse.ArgumentTypeError("invalid date: %s" % s)
+
+
+def format_time(t):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the history of the lobby recorded by frozen.py.")
+    parser.add_argument("history", nargs="?", default="lobby_history.jsonl", help="The history file.")
+    parser.add_argument("--file", default=TRACKED_FILES[0], choices=TRACKED_FILES, help="The lobby file to query.")
+    parser.add_argument("--at", type=parse_time, help="Print the contents of the file at this date.")
+    parser.add_argument("--from", dest="start", type=parse_time, help="Print the changes since this date.")
+    parser.add_argument("--to", dest="end", type=parse_time, help="Print the changes until this date.")
+    args = parser.parse_args()
+
+    with LobbyHistory(args.history) as history:
+        if args.at is not None:
+            snapshot = history.snapshot_at(args.file, args.at)
+            if snapshot is None:
+                print("No data at this date.")
+                return
+            print("%s (%s)" % (args.file, format_time(snapshot[0])))
+            print(snapshot[1])
+            for key, fields in snapshot[2].items():
+                print("\t".join([key] + fields))
+            return
+        for t, added, removed, changed in history.iter_changes(args.file, args.start, args.end):
+            for key in added:
+                print("%s [+] %s" % (format_time(t), "\t".join([key] + added[key])))
+            for key in removed:
+                print("%s [-] %s" % (format_time(t), key))
+            for key in changed:
+                print("%s [*] %s" % (format_time(t), "\t".join([key] + changed[key])))
+
+
+if __name__ == "__main__":
+    main()
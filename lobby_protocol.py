@@ -0,0 +1,198 @@
+import zlib
+from collections import namedtuple
+
+
+# A message received from the lobby server. Messages are tab separated, and most of them are commands of the
+# form "textcom\tcommand\t[name]\t[arguments...]". The only other command is "writeFile\t[filename]"; the
+# command of any other message is None.
+Message = namedtuple("Message", ["kind", "command", "args", "line"])
+
+
+def parse_message(line):
+    """
+    Splits a line received from the server into a Message. The line is only split once.
+    """
+    fields = line.split("\t")
+    if fields[0] == "textcom" and len(fields) > 2 and fields[1] == "command":
+        return Message(fields[0], fields[2], fields[3:], line)
+    if fields[0] == "writeFile":
+        return Message(fields[0], fields[0], fields[1:], line)
+    # Not a command: a bare "ping" must not be mistaken for "textcom\tcommand\tping".
+    return Message(fields[0], None, fields[1:], line)
+
+
+class MessageReader(object):
+    """
+    Reads messages from a socket. Some messages are followed by data which isn't made of lines (the contents of
+    a writeFile): their handlers read it with recv, which returns what was already received after the message
+    before reading from the socket, and give back what they read past its end with unread so that it is parsed
+    as messages.
+    """
+    def __init__(self, s, bufsize=1024):
+        """
+        @param  s       The socket (or any object with recv and send methods).
+        """
+        self.s = s
+        self.bufsize = bufsize
+        self.buffer = b""
+        self.pos = 0
+
+    def recv(self, bufsize):
+        if self.pos < len(self.buffer):
+            data = self.buffer[self.pos:self.pos + bufsize]
+            self.pos += len(data)
+            return data
+        return self.s.recv(bufsize)
+
+    def unread(self, data):
+        self.buffer = data + self.buffer[self.pos:]
+        self.pos = 0
+
+    def send(self, data):
+        return self.s.send(data)
+
+    def __iter__(self):
+        """
+        Reads messages until the connection is closed. Lines which are split between two packets are put back
+        together.
+        @return A generator of Messages.
+        """
+        while True:
+            data = self.buffer[self.pos:]
+            lines = (data if isinstance(data, str) else data.decode("latin-1")).split("\n")
+            if len(lines) == 1:
+                data = self.s.recv(self.bufsize)
+                if not data:
+                    return
+                self.buffer = self.buffer[self.pos:] + data
+                self.pos = 0
+                continue
+            pos = self.pos
+            for line in lines[:-1]:
+                pos += len(line) + 1
+                if line:
+                    self.pos = pos
+                    yield parse_message(line)
+                    if self.pos != pos:
+                        break  # The handler read (or gave back) data: the rest of the buffer has to be split again.
+            else:
+                self.pos = pos
+
+
+def read_messages(s, bufsize=1024):
+    """
+    @return A generator of the Messages read from a socket (see MessageReader).
+    """
+    return iter(MessageReader(s, bufsize))
+
+
+def stream_ended(decompress):
+    """
+    @return Whether a zlib decompression object has reached the end of its stream. Python 2's objects have no
+            eof attribute: a copy is fed one more byte, which only ends up in unused_data after the end.
+    """
+    if hasattr(decompress, "eof"):
+        return decompress.eof
+    if decompress.unused_data:
+        return True
+    probe = decompress.copy()
+    try:
+        probe.decompress(b"\x00")
+    except zlib.error:
+        return True  # The stream is broken, there's no point in reading any further.
+    return bool(probe.unused_data)
+
+
+def receive_compressed(s, bufsize=10000):
+    """
+    Reads a compressed file sent after a writeFile message. The file ends with its deflate stream: reading stops
+    there, and whatever follows is given back to the MessageReader.
+    @param  s   A MessageReader.
+    @return The decompressed contents of the file.
+    """
+    decompress = zlib.decompressobj(-zlib.MAX_WBITS)
+    content = decompress.decompress(s.recv(bufsize))
+    while not stream_ended(decompress):
+        data = s.recv(bufsize)
+        if not data:
+            break
+        content += decompress.decompress(data)
+    s.unread(decompress.unused_data)
+    return content
+
+
+class Dispatcher(object):
+    """
+    Routes messages to the handler registered for their command. Messages which aren't commands (see
+    parse_message) go to the default handler.
+    """
+    def __init__(self, default=None):
+        """
+        @param  default The handler called for the commands which have no handler of their own.
+        """
+        self.handlers = {}
+        self.default = default
+
+    def register(self, *commands):
+        """
+        Decorator registering a function as the handler of one or more commands. Handlers receive the
+        socket and the Message.
+        """
+        def decorator(function):
+            for command in commands:
+                self.handlers[command] = function
+            return function
+        return decorator
+
+    def dispatch(self, s, message):
+        handler = self.handlers.get(message.command, self.default)
+        if handler is not None:
+            return handler(s, message)
+
+
+class RecordingSocket(object):
+    """
+    Wraps a socket and saves everything it receives to a file, which can be played back with ReplaySocket.
+    """
+    def __init__(self, s, path):
+        self.s = s
+        self.f = open(path, "ab")
+
+    def recv(self, bufsize):
+        data = self.s.recv(bufsize)
+        self.f.write(data)
+        self.f.flush()
+        return data
+
+    def send(self, data):
+        return self.s.send(data)
+
+    def settimeout(self, timeout):
+        self.s.settimeout(timeout)
+
+    def gettimeout(self):
+        return self.s.gettimeout()
+
+    def close(self):
+        self.f.close()
+        self.s.close()
+
+
+class ReplaySocket(object):
+    """
+    Plays back traffic recorded by RecordingSocket. What is sent is discarded.
+    """
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def recv(self, bufsize):
+        chunk = self.data[self.pos:self.pos + bufsize]
+        self.pos += len(chunk)
+        return chunk
+
+    def send(self, data):
+        return len(data)
+
+    def close(self):
+        pass
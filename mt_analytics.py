@@ -0,0 +1,308 @@
+from __future__ import print_function
+import sys
+import os
+import io
+import struct
+import argparse
+
+import numpy as np
+
+from frozen_parse_mt import read_mt_header, UNIT_COUNT, UNIT_TYPE_SIZE, UNIT_TEAM, UNIT_POSITION, WAYPOINT_SIZE
+from mt_pack import EncounterPack, PACK_MAGIC
+
+# The unit records don't say which player they belong to. Assumed: team 0 is player 1 and team 1 is player 2.
+PLAYER_TEAMS = (0, 1)
+
+
+def iter_encounters(paths):
+    """
+    Iterates over the MT files contained in a list of paths.
+    @param  paths   .enc files, encounter packs (see mt_pack.py) or directories containing either.
+    @return (name, MT data) pairs.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.endswith(".enc") or f.endswith(".pack"):
+                        for item in iter_encounters([os.path.join(root, f)]):
+                            yield item
+            continue
+        with open(path, 'rb') as f:
+            is_pack = f.read(len(PACK_MAGIC)) == PACK_MAGIC
+        if is_pack:
+            with EncounterPack(path) as pack:
+                for game_id, data in pack:
+                    yield "%s:%d" % (path, game_id), data
+        else:
+            with open(path, 'rb') as f:
+                yield path, f.read()
+
+
+# The fixed-size part of a unit record, which follows its type: the same fields as UNIT_TEAM and UNIT_POSITION.
+UNIT_RECORD = np.dtype({"names": ["team", "waypoints", "x", "y"],
+                        "formats": [">u4", "<i4", "<f4", "<f4"],
+                        "offsets": [2, UNIT_TEAM.size, UNIT_TEAM.size + 12, UNIT_TEAM.size + 16],
+                        "itemsize": UNIT_TEAM.size + UNIT_POSITION.size})
+# The smallest unit record: separator, type size, and the fixed-size part.
+MIN_UNIT_SIZE = UNIT_TYPE_SIZE.size + UNIT_RECORD.itemsize
+
+
+def gather(buf, positions, width):
+    """
+    @return The width bytes found at each position of buf, as a (len(positions), width) array. Positions past
+            the end of buf read zeros.
+    """
+    indexes = positions[:, None] + np.arange(width)
+    return np.where(indexes < len(buf), buf[np.minimum(indexes, len(buf) - 1)], 0).astype(np.uint8)
+
+
+def decode_units(data, starts, ends):
+    """
+    Decodes the units of several games at once. The records have a variable size (type, waypoints), so they
+    are read in lockstep: the n-th unit of every game is decoded in one go with a structured dtype, and the
+    number of iterations is the number of units of the biggest game rather than the total number of units.
+    @param  data    The games, one after the other.
+    @param  starts  The position of the units of each game in data (right after the header).
+    @param  ends    The position of the end of each game in data.
+    @return A mask of the games whose units could be read (like read_units, a game is rejected when the data
+            doesn't look as expected) and a dictionary of arrays with one entry per unit of these games: "game"
+            (index in starts), "team", "x", "y", "waypoints", as well as "type_offset" and "type_size" which
+            locate the type of the unit in data.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    pos = starts + UNIT_COUNT.size + 2
+    ok = (pos <= ends) & (gather(buf, starts, 1)[:, 0] == 0) & (gather(buf, pos - 1, 1)[:, 0] == 0)
+    counts = gather(buf, starts + 1, UNIT_COUNT.size).view("<u4")[:, 0].astype(np.int64)
+    ok &= counts * MIN_UNIT_SIZE <= ends - pos  # Also guarantees that the loop below is bounded.
+    parts = []
+    for n in range(0, int(counts[ok].max()) if ok.any() else 0):
+        games = np.flatnonzero(ok & (counts > n))
+        type_size = gather(buf, pos[games] + 1, 1)[:, 0].astype(np.int64)
+        record = pos[games] + UNIT_TYPE_SIZE.size + type_size
+        units = gather(buf, record, UNIT_RECORD.itemsize).view(UNIT_RECORD)[:, 0]
+        waypoints = np.maximum(0, units["waypoints"].astype(np.int64) - 1)  # Skipped, like in read_units
+        pos[games] = record + UNIT_RECORD.itemsize + waypoints * WAYPOINT_SIZE
+        ok[games[pos[games] > ends[games]]] = False
+        parts.append((games, units, record - type_size, type_size))
+    if not parts:
+        parts.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=UNIT_RECORD), np.zeros(0, dtype=np.int64),
+                      np.zeros(0, dtype=np.int64)))
+    games = np.concatenate([p[0] for p in parts])
+    # Put the units back in the order of the files (the parts are sorted by unit number), without the rejected games.
+    order = np.argsort(games, kind="stable")
+    order = order[ok[games[order]]]
+    units = np.concatenate([p[1] for p in parts])[order]
+    return ok, {"game": games[order],
+                "team": units["team"].astype(np.int64),
+                "x": units["x"].astype(np.float64),
+                "y": units["y"].astype(np.float64),
+                "waypoints": units["waypoints"].astype(np.int64),
+                "type_offset": np.concatenate([p[2] for p in parts])[order],
+                "type_size": np.concatenate([p[3] for p in parts])[order]}
+
+
+def iter_chunks(paths, chunk_size=1000):
+    """
+    Decodes the units of the encounters found in paths, and groups them in NumPy arrays. Only chunk_size
+    games are held in memory at the same time, so whole corpora can be processed.
+    @return Dictionaries of arrays ("x", "y", "team", "rank", "waypoints", "type") with one entry per unit.
+            "type" contains indexes in the "types" list, which is shared between all the chunks.
+    """
+    types = []
+    type_ids = {}
+    chunk = []
+    for name, data in iter_encounters(paths):
+        f = io.BytesIO(data)
+        try:
+            header = read_mt_header(f)
+        except (ValueError, IndexError, struct.error) as e:
+            print("[!] Error: could not parse %s (%s)." % (name, e), file=sys.stderr)
+            continue
+        if header is None:
+            print("[!] Error: could not read the units of %s." % name, file=sys.stderr)
+            continue
+        chunk.append((name, header, data, f.tell()))
+        if len(chunk) == chunk_size:
+            yield make_chunk(chunk, types, type_ids)
+            chunk = []
+    if chunk:
+        yield make_chunk(chunk, types, type_ids)
+
+
+def make_chunk(games, types, type_ids):
+    """
+    Decodes the units of a list of (name, header, data, position of the units) tuples.
+    """
+    data = b"".join(g[2] for g in games)
+    ends = np.cumsum([len(g[2]) for g in games])
+    starts = ends - [len(g[2]) for g in games] + [g[3] for g in games]
+    ok, units = decode_units(data, starts, ends)
+    for i in np.flatnonzero(~ok):
+        print("[!] Error: could not read the units of %s." % games[i][0], file=sys.stderr)
+
+    # Each distinct type is only decoded once: the types are compared as rows of bytes (prefixed by their size).
+    width = int(units["type_size"].max()) if units["type_size"].size else 0
+    rows = gather(np.frombuffer(data, dtype=np.uint8), units["type_offset"], width)
+    rows[np.arange(width) >= units["type_size"][:, None]] = 0
+    rows = np.ascontiguousarray(np.column_stack((units["type_size"].astype(np.uint8), rows)))
+    keys = rows.view("S%d" % (width + 1))[:, 0]
+    distinct, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    ids = np.zeros(len(distinct), dtype=np.int64)
+    for i in np.argsort(first):  # New types are numbered in the order in which they appear.
+        row = rows[first[i]]
+        unit_type = row[1:1 + row[0]].tobytes().decode("latin-1")
+        if unit_type not in type_ids:
+            type_ids[unit_type] = len(types)
+            types.append(unit_type)
+        ids[i] = type_ids[unit_type]
+
+    team = units["team"]
+    p1_ranks = np.array([g[1].p1_rank for g in games], dtype=np.int64)[units["game"]]
+    p2_ranks = np.array([g[1].p2_rank for g in games], dtype=np.int64)[units["game"]]
+    return {"x": units["x"],
+            "y": units["y"],
+            "team": team,
+            "rank": np.where(team == PLAYER_TEAMS[0], p1_ranks, np.where(team == PLAYER_TEAMS[1], p2_ranks, -1)),
+            "waypoints": units["waypoints"],
+            "type": ids[inverse.ravel()],
+            "types": types}
+
+
+def select(chunk, teams=None, unit_types=None, min_rank=None, max_rank=None):
+    """
+    @return A boolean mask of the units of a chunk which match the filters.
+    """
+    mask = np.isfinite(chunk["x"]) & np.isfinite(chunk["y"])
+    if teams:
+        mask &= np.isin(chunk["team"], teams)
+    if unit_types:
+        wanted = [i for i, t in enumerate(chunk["types"]) if t in unit_types]
+        mask &= np.isin(chunk["type"], wanted)
+    if min_rank is not None:
+        mask &= (chunk["rank"] >= min_rank) & (chunk["rank"] != -1)
+    if max_rank is not None:
+        mask &= (chunk["rank"] <= max_rank) & (chunk["rank"] != -1)
+    return mask
+
+
+class PositionStats(object):
+    """
+    Accumulates a heatmap and statistics of unit positions, one chunk at a time.
+    """
+    def __init__(self, bins, bounds):
+        """
+        @param  bins    The number of bins of the heatmap on each axis.
+        @param  bounds  ((xmin, xmax), (ymin, ymax)). Fixed, so that the histograms of every chunk can be added.
+        """
+        self.bins = bins
+        self.bounds = bounds
+        self.heatmap = np.zeros((bins, bins), dtype=np.int64)
+        self.count = 0
+        self.sum = np.zeros(2)
+        self.sum_squares = np.zeros(2)
+        self.waypoints = 0
+        self.type_counts = np.zeros(0, dtype=np.int64)
+        self.types = []
+
+    def update(self, chunk, mask):
+        x = chunk["x"][mask]
+        y = chunk["y"][mask]
+        h, _, _ = np.histogram2d(x, y, bins=self.bins, range=self.bounds)
+        self.heatmap += h.astype(np.int64)
+        self.count += x.size
+        self.sum += (x.sum(), y.sum())
+        self.sum_squares += ((x * x).sum(), (y * y).sum())
+        self.waypoints += int(chunk["waypoints"][mask].sum())
+        self.types = chunk["types"]
+        counts = np.bincount(chunk["type"][mask], minlength=len(self.types))
+        counts[:self.type_counts.size] += self.type_counts
+        self.type_counts = counts
+
+    def mean(self):
+        return self.sum / self.count if self.count else np.full(2, np.nan)
+
+    def std(self):
+        if not self.count:
+            return np.full(2, np.nan)
+        return np.sqrt(np.maximum(self.sum_squares / self.count - self.mean() ** 2, 0))
+
+    def __str__(self):
+        mean = self.mean()
+        std = self.std()
+        s = "%d unit(s) in the selection.\n" % self.count
+        if self.count:
+            s += "Position: x = %.2f (std %.2f), y = %.2f (std %.2f)\n" % (mean[0], std[0], mean[1], std[1])
+            s += "Average number of waypoints: %.2f\n" % (float(self.waypoints) / self.count)
+            s += "Unit types:\n"
+            for i in np.argsort(-self.type_counts, kind="stable"):
+                if self.type_counts[i]:
+                    s += "\t%s: %d\n" % (self.types[i], self.type_counts[i])
+        return s.rstrip("\n")
+
+
+def find_bounds(paths, chunk_size, filters):
+    """
+    Computes the extent of the selected positions with a first pass over the corpus.
+    """
+    xmin = ymin = np.inf
+    xmax = ymax = -np.inf
+    for chunk in iter_chunks(paths, chunk_size):
+        mask = select(chunk, **filters)
+        if mask.any():
+            xmin = min(xmin, chunk["x"][mask].min())
+            xmax = max(xmax, chunk["x"][mask].max())
+            ymin = min(ymin, chunk["y"][mask].min())
+            ymax = max(ymax, chunk["y"][mask].max())
+    if xmin > xmax:
+        return None
+    # histogram2d needs a non-empty range.
+    xmin, xmax, ymin, ymax = float(xmin), float(xmax), float(ymin), float(ymax)
+    return (xmin, xmax if xmax > xmin else xmin + 1), (ymin, ymax if ymax > ymin else ymin + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute heatmaps and statistics of unit positions over a "
+                                                 "collection of encounter (MT) files.")
+    parser.add_argument("paths", nargs="+", help=".enc files, encounter packs or directories containing them.")
+    parser.add_argument("--team", type=int, action="append", help="Only consider the units of this team "
+                                                                  "(can be repeated).")
+    parser.add_argument("--type", action="append", dest="unit_type", help="Only consider the units of this type "
+                                                                          "(can be repeated).")
+    parser.add_argument("--min-rank", type=int, help="Only consider the units of players with this rank or higher.")
+    parser.add_argument("--max-rank", type=int, help="Only consider the units of players with this rank or lower.")
+    parser.add_argument("--bins", type=int, default=50, help="The size of the heatmap (default: 50x50).")
+    parser.add_argument("--bounds", type=float, nargs=4, metavar=("XMIN", "XMAX", "YMIN", "YMAX"),
+                        help="The area covered by the heatmap. Computed from the data if omitted (which "
+                             "requires reading the files twice).")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="How many games are decoded at once "
+                                                                     "(default: 1000).")
+    parser.add_argument("--output", "-o", help="Save the heatmap (.npy or .csv).")
+    args = parser.parse_args()
+
+    filters = {"teams": args.team, "unit_types": args.unit_type,
+               "min_rank": args.min_rank, "max_rank": args.max_rank}
+    if args.bounds:
+        bounds = ((args.bounds[0], args.bounds[1]), (args.bounds[2], args.bounds[3]))
+    else:
+        bounds = find_bounds(args.paths, args.chunk_size, filters)
+        if bounds is None:
+            print("No unit matches the selection.")
+            return
+
+    stats = PositionStats(args.bins, bounds)
+    for chunk in iter_chunks(args.paths, args.chunk_size):
+        stats.update(chunk, select(chunk, **filters))
+    print(stats)
+
+    if args.output:
+        if args.output.endswith(".csv"):
+            np.savetxt(args.output, stats.heatmap, fmt="%d", delimiter=",")
+        else:
+            np.save(args.output, stats.heatmap)
+        print("Heatmap (x in rows, y in columns, covering %s) saved to %s." % (bounds, args.output))
+
+
+if __name__ == "__main__":
+    main()
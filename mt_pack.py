@@ -0,0 +1,203 @@
+from __future__ import print_function
+import sys
+import os
+import io
+import mmap
+import struct
+import argparse
+
+from frozen_parse_mt import read_mt_header
+
+PACK_MAGIC = b"MTPK\x01\x00\x00\x00"
+RECORD_HEADER = struct.Struct("<QI")  # Game ID, size of the MT data
+INDEX_HEADER = struct.Struct("<Q")  # Size of the pack covered by the index
+INDEX_ENTRY = struct.Struct("<QQI")  # Game ID, offset of the MT data, size of the MT data
+
+
+class EncounterPack(object):
+    """
+    Stores MT (encounter) files in a single append-only file. Each record is the game ID and the size of the
+    data, followed by the data itself. An index of the latest record of each game is kept in memory (and in
+    a .idx file next to the pack so that it doesn't have to be rebuilt every time), and records are read
+    through mmap.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.index_path = "%s.idx" % path
+        self.index = {}  # Game ID -> (offset, size)
+        self._map = None
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(PACK_MAGIC)
+        self.f = open(path, 'r+b')
+        if self.f.read(len(PACK_MAGIC)) != PACK_MAGIC:
+            self.f.close()
+            raise ValueError("%s is not an encounter pack." % path)
+        self.load_index()
+
+    def load_index(self):
+        """
+        Reads the .idx file, then scans the records which were appended after it was written.
+        """
+        covered = len(PACK_MAGIC)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+            if len(data) >= INDEX_HEADER.size:
+                size, = INDEX_HEADER.unpack_from(data)
+                if size <= os.path.getsize(self.path):
+                    covered = size
+                    for pos in range(INDEX_HEADER.size, len(data) - INDEX_ENTRY.size + 1, INDEX_ENTRY.size):
+                        game_id, offset, length = INDEX_ENTRY.unpack_from(data, pos)
+                        self.index[game_id] = (offset, length)
+        self.f.seek(covered)
+        while True:
+            header = self.f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            game_id, length = RECORD_HEADER.unpack(header)
+            offset = self.f.tell()
+            if offset + length > os.path.getsize(self.path):
+                break  # Truncated record, i.e. the program was interrupted while writing it.
+            self.index[game_id] = (offset, length)
+            self.f.seek(length, os.SEEK_CUR)
+        self.end = covered if not self.index else max(covered, max(o + l for o, l in self.index.values()))
+
+    def save_index(self):
+        with open(self.index_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(self.end))
+            for game_id, (offset, length) in self.index.items():
+                f.write(INDEX_ENTRY.pack(game_id, offset, length))
+
+    def add(self, data, game_id=None):
+        """
+        Appends an MT file to the pack. A previous version of the same game is superseded.
+        @param  data    The contents of the MT file.
+        @param  game_id The ID of the game. Read from the MT header if omitted.
+        @return The ID of the game.
+        @raise  ValueError if game_id is omitted and can't be read from the data. Nothing is written in that case.
+        """
+        if game_id is None:
+            try:
+                header = read_mt_header(io.BytesIO(data))
+            except (ValueError, IndexError, struct.error) as e:
+                raise ValueError("Could not read the MT header: %s" % e)
+            if header is None:
+                raise ValueError("The MT data has no header, the game ID has to be given.")
+            game_id = header.id
+        self.f.seek(self.end)
+        self.f.write(RECORD_HEADER.pack(game_id, len(data)))
+        self.f.write(data)
+        self.f.flush()
+        self.index[game_id] = (self.end + RECORD_HEADER.size, len(data))
+        self.end += RECORD_HEADER.size + len(data)
+        if self._map is not None:  # The file grew, it has to be mapped again.
+            self._map.close()
+            self._map = None
+        return game_id
+
+    def get_map(self):
+        if self._map is None:
+            self._map = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map
+
+    def get(self, game_id):
+        """
+        @return The contents of the MT file of a game.
+        """
+        offset, length = self.index[game_id]
+        return self.get_map()[offset:offset + length]
+
+    def open(self, game_id):
+        """
+        @return A file object which can be given to the frozen_parse_mt functions.
+        """
+        return io.BytesIO(self.get(game_id))
+
+    def __contains__(self, game_id):
+        return game_id in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        """
+        Iterates over (game ID, MT data) pairs, in the order in which they are stored.
+        """
+        for game_id, (offset, length) in sorted(self.index.items(), key=lambda item: item[1][0]):
+            yield game_id, self.get_map()[offset:offset + length]
+
+    def headers(self):
+        """
+        Iterates over (game ID, MTHeader) pairs.
+        """
+        for game_id, data in self:
+            yield game_id, read_mt_header(io.BytesIO(data))
+
+    def compact(self):
+        """
+        Rewrites the pack without the superseded records.
+        """
+        tmp = "%s.tmp" % self.path
+        index = {}
+        with open(tmp, 'wb') as f:
+            f.write(PACK_MAGIC)
+            for game_id, data in self:
+                f.write(RECORD_HEADER.pack(game_id, len(data)))
+                index[game_id] = (f.tell(), len(data))
+                f.write(data)
+            end = f.tell()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self.f.close()
+        os.rename(tmp, self.path)
+        self.index = index
+        self.end = end
+        self.f = open(self.path, 'r+b')
+        self.save_index()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if not self.f.closed:
+            self.save_index()
+            self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage a pack of encounter (MT) files.")
+    parser.add_argument("pack", help="The pack file.")
+    parser.add_argument("--add", nargs="+", metavar="file", help="Add MT files to the pack.")
+    parser.add_argument("--list", action="store_true", help="Print the header of every game in the pack.")
+    parser.add_argument("--extract", type=int, metavar="game_id", help="Write the MT data of a game to stdout.")
+    parser.add_argument("--compact", action="store_true", help="Remove the superseded records from the pack.")
+    args = parser.parse_args()
+
+    with EncounterPack(args.pack) as pack:
+        for path in args.add or []:
+            with open(path, 'rb') as f:
+                try:
+                    print("Added game %d." % pack.add(f.read()))
+                except ValueError as e:
+                    print("[!] Error: could not add %s: %s" % (path, e), file=sys.stderr)
+        if args.list:
+            for game_id, header in pack.headers():
+                print(header)
+        if args.extract is not None:
+            out = getattr(sys.stdout, "buffer", sys.stdout)
+            out.write(pack.get(args.extract))
+        if args.compact:
+            pack.compact()
+            print("%d game(s) in the pack." % len(pack))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+from __future__ import print_function
+import struct
+import threading
+from collections import namedtuple
+
+try:
+    from queue import Queue
+except ImportError:  # Python 2
+    from Queue import Queue
+
+from frozen_parse_mt import MT_MAGIC, MTHeader, Unit, UNIT_COUNT, UNIT_TYPE_SIZE, UNIT_TEAM, UNIT_POSITION, \
+    WAYPOINT_SIZE
+
+# A game as it comes out of the parser. units is None if they couldn't be decoded, and data holds all the bytes
+# which were received so that the game can be stored as is.
+Encounter = namedtuple("Encounter", ["game_id", "header", "units", "data"])
+
+
+class MTStreamParser(object):
+    """
+    Incremental version of read_mt_header and read_units: the data is fed as it is received, and each part of
+    the file is decoded as soon as all of its bytes have arrived, instead of waiting for the whole file.
+    """
+    def __init__(self):
+        self.data = bytearray()
+        self.pos = 0
+        self.header = None
+        self.units = None
+        self.error = None
+        self.done = False
+        self.steps = self.parse()
+        self.needed = next(self.steps)  # The number of bytes the parser is waiting for.
+
+    def parse(self):
+        """
+        Generator which yields the number of bytes it needs next, and receives them.
+        """
+        if (yield len(MT_MAGIC)) != MT_MAGIC:
+            raise ValueError("Wrong magic!")
+        header_size, = struct.unpack("B", (yield 1))
+        if header_size > 0:
+            self.header = MTHeader((yield header_size))
+
+        if (yield 1) != b"\x00":
+            return
+        number_of_units, = UNIT_COUNT.unpack((yield UNIT_COUNT.size))
+        if (yield 1) != b"\x00":
+            return
+        units = []
+        for i in range(0, number_of_units):
+            type_size, = UNIT_TYPE_SIZE.unpack((yield UNIT_TYPE_SIZE.size))
+            type = (yield type_size)
+            if not isinstance(type, str):
+                type = type.decode("latin-1")
+            team, = UNIT_TEAM.unpack((yield UNIT_TEAM.size))
+            waypoints, x, y = UNIT_POSITION.unpack((yield UNIT_POSITION.size))
+            units.append(Unit(type, team, x, y, waypoints))
+            yield max(0, (waypoints - 1) * WAYPOINT_SIZE)  # Burn waypoint info for now
+        self.units = units
+
+    def feed(self, data):
+        """
+        @return True once the parser doesn't need any more data.
+        """
+        self.data.extend(data)
+        while not self.done and len(self.data) - self.pos >= self.needed:
+            chunk = bytes(self.data[self.pos:self.pos + self.needed])
+            self.pos += self.needed
+            try:
+                self.needed = self.steps.send(chunk)
+            except StopIteration:
+                self.done = True
+            except (ValueError, IndexError, struct.error) as e:
+                self.error = e
+                self.done = True
+        return self.done
+
+    def get_missing(self):
+        """
+        @return The number of bytes the parser is still waiting for.
+        """
+        return self.needed - (len(self.data) - self.pos)
+
+    def get_encounter(self):
+        return Encounter(self.header.id if self.header is not None else None, self.header, self.units,
+                         bytes(self.data))
+
+
+def receive_encounter(s, bufsize=10000):
+    """
+    Reads an MT file sent after a writeFile message, parsing it along the way. Its size isn't given and the
+    format is only known up to the units, so the file is read like before (a single recv) and more is only
+    read while the header or the units are incomplete, no more than they need: the lobby messages which follow
+    the file are left to the MessageReader.
+    @param  s   A MessageReader (see lobby_protocol.py).
+    @return An Encounter.
+    """
+    parser = MTStreamParser()
+    parser.feed(s.recv(bufsize))
+    while not parser.done:
+        data = s.recv(min(bufsize, parser.get_missing()))
+        if not data:
+            break
+        parser.feed(data)
+    return parser.get_encounter()
+
+
+class EncounterPipeline(object):
+    """
+    Hands the encounters over to a consumer (storage, analytics...) running in its own thread, through a bounded
+    queue. When the consumer falls behind, submit blocks, and so does the socket read feeding it: memory usage
+    stays the same no matter how many games are received.
+    """
+    def __init__(self, consumer, maxsize=64):
+        """
+        @param  consumer    A function called with each Encounter.
+        @param  maxsize     The number of encounters which can be waiting for the consumer.
+        """
+        self.consumer = consumer
+        self.queue = Queue(maxsize)
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, encounter):
+        self.queue.put(encounter)
+
+    def run(self):
+        while True:
+            encounter = self.queue.get()
+            if encounter is None:
+                break
+            try:
+                self.consumer(encounter)
+            except Exception as e:
+                print("[!] Error: could not process game #%s: %s" % (encounter.game_id, e))
+
+    def close(self):
+        """
+        Waits until the encounters still in the queue have been consumed.
+        """
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
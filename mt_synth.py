@@ -0,0 +1,101 @@
+from __future__ import print_function
+import argparse
+import os
+import random
+import struct
+
+from frozen_parse_mt import MT_MAGIC
+
+UNIT_TYPES = ["Shotgun", "Machinegun", "Rocket", "Grenade", "Sniper", "Light Machinegun"]
+
+
+def make_header(r, game_id):
+    """
+    Generates the 26 tab separated fields read by MTHeader.
+    """
+    player1 = "player%d" % r.randint(0, 99999)
+    player2 = "player%d" % r.randint(0, 99999)
+    finished = r.random() < 0.5
+    fields = [str(game_id),                                         # Game ID
+              "0",
+              player2,                                              # Opponent
+              str(r.randint(0, 1)),                                 # currentGSEPSide
+              str(r.randint(1, 30)),                                # Turn
+              str(r.randint(0, 1)),                                 # Committed
+              "info",
+              "0",                                                  # Bidding phase
+              "1" if finished else "0",
+              "0",                                                  # Spectating
+              "",
+              "0",                                                  # Declined
+              "%.2f" % r.uniform(0, 2000),                          # Rating
+              "%d %d" % (r.randint(0, 20), r.randint(0, 20)),       # Record between the two players
+              "%d %d" % (r.randint(0, 999), r.randint(0, 999)),     # Player 1 wins and losses
+              "%d %d" % (r.randint(0, 999), r.randint(0, 999)),     # Player 2 wins and losses
+              str(r.randint(1, 9999)),                              # Ranks
+              str(r.randint(1, 9999)),
+              str(r.randint(1, 150)),                               # Levels
+              str(r.randint(1, 150)),
+              player1,
+              player2,
+              "%.2f" % r.uniform(-100, 100),                        # Score
+              "0" if finished else str(r.randint(0, 1)),            # Timed turns
+              str(r.randint(0, 3600)),
+              str(r.randint(0, 1))]                                 # Opponent committed
+    return "\t".join(fields).encode("latin-1")
+
+
+def make_unit(r, team):
+    """
+    Generates a unit record in the format read by frozen_parse_mt.read_units.
+    """
+    unit_type = r.choice(UNIT_TYPES).encode("latin-1")
+    waypoints = r.randint(1, 8)
+    data = b"\x00" + struct.pack("B", len(unit_type)) + unit_type
+    data += struct.pack(">2xL12x", team)
+    data += struct.pack("<l8x2f8x", waypoints, r.uniform(0, 100), r.uniform(0, 100))
+    data += bytes(bytearray(r.getrandbits(8) for i in range(0, 22 * (waypoints - 1))))  # Waypoints
+    return data
+
+
+def make_encounter(r, game_id, units=None):
+    """
+    @param  r       A random.Random instance, so that the output can be reproduced.
+    @param  units   The number of units. Chosen at random if omitted.
+    @return The contents of an MT file.
+    """
+    header = make_header(r, game_id)
+    if units is None:
+        units = r.randint(4, 24)
+    body = b"\x00" + struct.pack("<L", units) + b"\x00"
+    body += b"".join(make_unit(r, i % 2) for i in range(0, units))
+    return MT_MAGIC + struct.pack("B", len(header)) + header + body
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate fake encounter (MT) files, e.g. to benchmark or test "
+                                                 "the parser.")
+    parser.add_argument("output", help="A directory in which .enc files are written, or an encounter pack "
+                                       "(.pack) to add them to.")
+    parser.add_argument("--count", type=int, default=1000, help="The number of games (default: 1000).")
+    parser.add_argument("--units", type=int, help="The number of units per game (default: random).")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the generator (default: 0).")
+    args = parser.parse_args()
+
+    r = random.Random(args.seed)
+    if args.output.endswith(".pack"):
+        from mt_pack import EncounterPack
+        with EncounterPack(args.output) as pack:
+            for i in range(0, args.count):
+                pack.add(make_encounter(r, i + 1, args.units), i + 1)
+    else:
+        if not os.path.exists(args.output):
+            os.makedirs(args.output)
+        for i in range(0, args.count):
+            with open(os.path.join(args.output, "%d.enc" % (i + 1)), 'wb') as f:
+                f.write(make_encounter(r, i + 1, args.units))
+    print("%d game(s) written to %s." % (args.count, args.output))
+
+
+if __name__ == "__main__":
+    main()
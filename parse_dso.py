@@ -4,25 +4,58 @@ import struct
 import argparse
 import os
 import shutil
+import io
+import bisect
+import traceback
+import json
+from array import array
+from collections import namedtuple
 
-from decompile import decompile
+from decompile import decompile, is_number
+from bytecode import disassemble, iter_segments, extract_function, validate, Function
+from expressions import pretty_print_function
+from function_cache import FunctionCache, DEFAULT_MAX_SIZE
+
+
+# A string of a StringTable, along with the ways it can be rendered in the decompiled code.
+Literal = namedtuple("Literal", ["value", "is_number", "quoted", "tagged"])
 
 
 class DSOFile:
     def __init__(self, path):
         with open(path, 'rb') as f:
-            self.version, = struct.unpack("L", f.read(4))
-            size, = struct.unpack("L", f.read(4))
-            self.global_string_table = f.read(size)
-            size, = struct.unpack("L", f.read(4))
-            self.function_string_table = f.read(size)
-            self.global_float_table = []
-            self.function_float_table = []
-            self.read_floats(f)
-            self.code = []
-            self.linebreak_pairs = []
-            self.read_code(f)
-            self.patch_string_references(f)
+            self.read(f)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Loads a DSO file which is already in memory.
+        """
+        dso = cls.__new__(cls)
+        dso.read(io.BytesIO(data))
+        return dso
+
+    def read(self, f):
+        """
+        Reads the whole DSO file from a file object.
+        """
+        self.version, = struct.unpack("<L", f.read(4))
+        size, = struct.unpack("<L", f.read(4))
+        self.global_string_table = f.read(size)
+        size, = struct.unpack("<L", f.read(4))
+        self.function_string_table = f.read(size)
+        self.global_strings = self.decode_string_table(self.global_string_table)
+        self.function_strings = self.decode_string_table(self.function_string_table)
+        self.global_literals = self.classify_literals(self.global_strings)
+        self.function_literals = self.classify_literals(self.function_strings)
+        self.global_float_table = []
+        self.function_float_table = []
+        self.read_floats(f)
+        self.code = []
+        self.linebreak_pairs = []
+        self.line_index = None  # Built on demand by get_line()
+        self.read_code(f)
+        self.patch_string_references(f)
 
     @staticmethod
     def dump_string_table(st):
@@ -35,14 +68,14 @@ class DSOFile:
         def read_float_table(ft_size, fd):
             ft = []
             for i in range(0, ft_size):
-                f, = struct.unpack("d", fd.read(8))
+                f, = struct.unpack("<d", fd.read(8))
                 ft.append(f)
             return ft
 
-        size, = struct.unpack("L", fd.read(4))
+        size, = struct.unpack("<L", fd.read(4))
         if size > 0:
             self.global_float_table = read_float_table(size, fd)
-        size, = struct.unpack("L", fd.read(4))
+        size, = struct.unpack("<L", fd.read(4))
         if size > 0:
             self.function_float_table = read_float_table(size, fd)
 
@@ -50,35 +83,88 @@ class DSOFile:
         """
         Reads the file's bytecode.
         """
-        (code_size, line_break_pair_count) = struct.unpack("LL", fd.read(8))
+        (code_size, line_break_pair_count) = struct.unpack("<LL", fd.read(8))
         # The code size is a number of opcodes and arguments, not a number of bytes.
         count = 0
         while count < code_size:
             value, = struct.unpack("B", fd.read(1))
             count += 1
             if value == 0xFF:
-                value = struct.unpack("L", fd.read(4))[0]
+                value = struct.unpack("<L", fd.read(4))[0]
             self.code.append(value)
 
         count = 0
         while count < line_break_pair_count * 2:
-            value, = struct.unpack("L", fd.read(4))
+            value, = struct.unpack("<L", fd.read(4))
             count += 1
             self.linebreak_pairs.append(value)
 
-    def get_string(self, offset, in_function=False):
+    def build_line_index(self):
         """
-        Returns the value located at the given offset in a stringtable.
+        Sorts the linebreak pairs into two arrays (ips and line numbers) which can be searched with bisect.
+        Each pair contains the line number (shifted by 8 bits) and the ip of the first instruction of that line.
         """
-        if not in_function:
-            stb = self.global_string_table
-        else:
-            stb = self.function_string_table
+        pairs = sorted((self.linebreak_pairs[i + 1], self.linebreak_pairs[i] >> 8)
+                       for i in range(0, len(self.linebreak_pairs) - 1, 2))
+        self.line_index = (array("L", [p[0] for p in pairs]), array("L", [p[1] for p in pairs]))
+
+    def get_line(self, ip):
+        """
+        Returns the line of the original script the instruction located at ip was compiled from, or None if
+        the file doesn't contain this information.
+        """
+        if self.line_index is None:
+            self.build_line_index()
+        ips, lines = self.line_index
+        i = bisect.bisect_right(ips, ip) - 1
+        return lines[i] if i >= 0 else None
+
+    @staticmethod
+    def decode_string_table(stb):
         st = stb.decode("UTF-8", "replace")
         i = st.find("\ufffd")
         while i != -1:
             st = st[:i] + chr(stb[i]) + st[i + 1:]
             i = st.find("\ufffd", i + 1)
+        return st
+
+    @staticmethod
+    def make_literal(s):
+        # Some floats may be represented as string literals. Omit brackets for those.
+        if is_number(s):
+            return Literal(s, True, s, s)
+        # Escape any double quote in the string. Tagged strings are encased in single quotes.
+        return Literal(s, False, '"%s"' % s.replace('"', r'\"'), "'%s'" % s)
+
+    def classify_literals(self, st):
+        """
+        Classifies and renders every string of a StringTable once, so that repeated lookups are free.
+        """
+        literals = {}
+        offset = 0
+        for s in st.split("\x00"):
+            literals[offset] = self.make_literal(s.rstrip("\n"))
+            offset += len(s) + 1
+        return literals
+
+    def get_literal(self, offset, in_function=False):
+        """
+        Returns the Literal located at the given offset in a stringtable.
+        """
+        literals = self.function_literals if in_function else self.global_literals
+        literal = literals.get(offset)
+        if literal is None:  # Offset pointing inside of a string
+            literal = literals[offset] = self.make_literal(self.get_string(offset, in_function))
+        return literal
+
+    def get_string(self, offset, in_function=False):
+        """
+        Returns the value located at the given offset in a stringtable.
+        """
+        literal = (self.function_literals if in_function else self.global_literals).get(offset)
+        if literal is not None:
+            return literal.value
+        st = self.function_strings if in_function else self.global_strings
         return st[offset:st.find("\x00", offset)].rstrip("\n")
 
     def get_float(self, pos, in_function = False):
@@ -97,78 +183,357 @@ class DSOFile:
         Their offset into the StringTable has to be patched in the code where zero values
         have been set as placeholders.
         """
-        size, = struct.unpack("L", fd.read(4))
+        self.ident_locations = array("L")  # Kept so that they can be checked (see bytecode.validate)
+        size, = struct.unpack("<L", fd.read(4))
         for i in range(0, size):
-            offset, count = struct.unpack("LL", fd.read(8))
+            offset, count = struct.unpack("<LL", fd.read(8))
             for j in range(0, count):
-                location_to_patch, = struct.unpack("L", fd.read(4))
-                self.code[location_to_patch] = offset
+                location_to_patch, = struct.unpack("<L", fd.read(4))
+                self.ident_locations.append(location_to_patch)
+                if location_to_patch < len(self.code):
+                    self.code[location_to_patch] = offset
+
+
+class LineAnnotator(object):
+    """
+    Wraps the sink given to decompile() in order to map the decompiled code back to the lines of the original
+    script. decompile() reports the ip of each instruction through track_ip(), which is only looked up on
+    sinks that have it.
+    """
+    def __init__(self, sink, dso, comments=True):
+        """
+        @param  sink        The file object in which the decompiled code is written.
+        @param  dso         The DSO object being decompiled.
+        @param  comments    Whether to add a "// line N" comment when the original line changes.
+        """
+        self.sink = sink
+        self.dso = dso
+        self.comments = comments
+        self.ip = None
+        self.new_instruction = False
+        self.annotation = None  # Comment to add before the next newline
+        self.last_line = None
+        self.output_line = 1
+        self.source_map = []  # (line in the output, line in the original script, ip) tuples
+
+    def track_ip(self, ip):
+        self.ip = ip
+        self.new_instruction = True
+
+    def write(self, text):
+        if not text:
+            return
+        if self.new_instruction:
+            self.new_instruction = False
+            line = self.dso.get_line(self.ip)
+            if line is not None and line != self.last_line:
+                self.last_line = line
+                self.source_map.append((self.output_line, line, self.ip))
+                if self.comments:
+                    self.annotation = " // line %d" % line
+        if self.annotation is not None and "\n" in text:
+            i = text.index("\n")
+            text = text[:i] + self.annotation + text[i:]
+            self.annotation = None
+        self.output_line += text.count("\n")
+        self.sink.write(text)
+
+    def flush(self):
+        self.sink.flush()
+
+    def get_source_map(self, source):
+        """
+        @param  source  The name of the file in which the decompiled code is written.
+        """
+        return {"file": source, "mappings": [{"output": o, "line": l, "ip": ip} for o, l, ip in self.source_map]}
+
+    def save_source_map(self, path, source):
+        with open(path, "w") as f:
+            json.dump(self.get_source_map(source), f, indent=1)
+
+
+class RecordingSink(object):
+    """
+    Keeps what decompile() writes so that it can be discarded if an error occurs, or copied to another sink.
+    """
+    def __init__(self, ip_offset=None):
+        """
+        @param  ip_offset   If not None, the ips reported by decompile() are recorded too (see LineAnnotator),
+                            after adding this offset to them.
+        """
+        self.events = []  # (is_ip, value) tuples
+        if ip_offset is not None:
+            self.ip_offset = ip_offset
+            self.track_ip = self._track_ip
+
+    def _track_ip(self, ip):
+        self.events.append((True, ip + self.ip_offset))
+
+    def write(self, text):
+        self.events.append((False, text))
+
+    def flush(self):
+        pass
+
+    def replay(self, sink):
+        track_ip = getattr(sink, "track_ip", None)
+        for is_ip, value in self.events:
+            if not is_ip:
+                sink.write(value)
+            elif track_ip is not None:
+                track_ip(value)
+
+
+def write_stub(dso, segment, error, sink):
+    """
+    Replaces code which could not be decompiled by its disassembly, in a comment.
+    @param  segment The Function (see bytecode.iter_segments) which could not be decompiled.
+    @param  error   The error dictionary returned by decompile_keep_going.
+    """
+    indentation = ""
+    if segment.name is not None:
+        print("function %s\n{" % pretty_print_function(segment.name, segment.namespace, segment.argv), file=sink)
+        indentation = "\t"
+    print("%s// [!] Could not decompile this code (ip=%s, %s): %s" % (indentation, error["ip"], error["opcode"],
+                                                                       error["error"]), file=sink)
+    listing = io.StringIO()
+    try:
+        disassemble(dso, listing, lines=True, start=segment.start, end=segment.end)
+    except ValueError as e:
+        print("%s" % e, file=listing)
+    for line in listing.getvalue().splitlines():
+        print("%s// %s" % (indentation, line), file=sink)
+    if segment.name is not None:
+        print("}\n", file=sink)
+
+
+def decompile_keep_going(dso, sink=None, cache=None):
+    """
+    Decompiles each function of a DSO file (and the top-level code between them) separately, so that an error
+    only affects the function where it happened. Functions which can't be decompiled are replaced by a stub
+    containing their disassembly.
+    @return A list of dictionaries describing the errors that were encountered.
+    """
+    if sink is None:
+        sink = sys.stdout
+    try:
+        segments = list(iter_segments(dso))
+    except (ValueError, IndexError):  # The bytecode can't even be walked. Try to decompile the whole file.
+        segments = [Function(None, None, None, [], 0, len(dso.code))]
+    annotate = hasattr(sink, "track_ip")
+    errors = []
+    for segment in segments:
+        recorder = RecordingSink(segment.start if annotate else None)
+        try:
+            decompile(extract_function(dso, segment), sink=recorder, cache=cache)
+        except Exception as e:
+            location = get_error_location(sys.exc_info()[2])
+            ip, opcode = (location[0] + segment.start, location[1]) if location is not None else (None, None)
+            error = {"function": None if segment.name is None else
+                                 pretty_print_function(segment.name, segment.namespace),
+                     "ip": ip,
+                     "opcode": opcode,
+                     "line": dso.get_line(ip) if ip is not None else None,
+                     "error": "%s: %s" % (type(e).__name__, e),
+                     "traceback": traceback.format_exc()}
+            errors.append(error)
+            write_stub(dso, segment, error, sink)
+            continue
+        recorder.replay(sink)
+    return errors
+
+
+def load_and_validate(path):
+    """
+    Loads a DSO file and checks its bytecode (see bytecode.validate).
+    @return The DSOFile (None if it couldn't be loaded) and the list of problems found.
+    """
+    try:
+        dso = DSOFile(path)
+    except (struct.error, UnicodeError, ValueError, IndexError) as e:
+        return None, ["Could not read the file: %s." % e]
+    try:
+        return dso, validate(dso)
+    except Exception as e:
+        return dso, ["Could not check the bytecode: %s: %s." % (type(e).__name__, e)]
+
+
+def find_dso_files(path):
+    """
+    Returns the files to decompile for a path given on the command line.
+    """
+    files = []
+    if os.path.isdir(path):
+        # If given a directory, we decompile files in that directory with a .cs.dso extension
+        for dirpath, dirnames, filenames in os.walk(path):
+            for f in filenames:
+                if f.endswith(".cs.dso"):
+                    files.append(os.path.join(dirpath,f))
+    else:
+        files.append(path)
+    return files
+
+
+def get_output_path(f):
+    if f.endswith(".cs.dso"):
+        return f[:-4]  # file.cs.dso -> file.cs
+    else:
+        return "%s.cs" % f  # file -> file.cs
+
+
+def backup_dso(f):
+    """
+    Create a backup of the original DSO in case the decompiled one is broken.
+    @return The path of the file which should be decompiled.
+    """
+    if not os.path.exists("%s.bak" % f):
+        shutil.copy(f, "%s.bak" % f)
+        return f
+    return "%s.bak" % f  # Work on the original DSO instead of possibly decompiling our own file.
+
+
+def get_error_location(tb):
+    """
+    Looks for the decompile() frame in a traceback.
+    @return The (ip, opcode) tuple of the instruction where the error was encountered, or None. The ip refers
+            to the original code, i.e. without the metadata inserted by decompile().
+    """
+    if tb is None:
+        return None
+    prev = tb
+    curr = tb.tb_next
+    while curr is not None:
+        prev = curr
+        curr = curr.tb_next
+        if "ip" in prev.tb_frame.f_locals and "offset" in prev.tb_frame.f_locals:
+            break
+    local_vars = prev.tb_frame.f_locals
+    if "ip" not in local_vars:
+        return None
+    ip = local_vars.get("opcode_ip", local_vars["ip"])  # ip has already moved past the opcode
+    if "code_inserts" in local_vars:  # Translate the ip back to the original code
+        ip = ip - bisect.bisect_left(local_vars["code_inserts"], ip) + local_vars["offset"]
+    return ip, local_vars["opcode"]
 
 
 def main():
     parser = argparse.ArgumentParser(description="Decompile DSO files.")
     parser.add_argument("file", metavar='file', nargs="+", help="The DSO file to decompile.")
     parser.add_argument("--stdout", action="store_true", help="Dump the decompiled script to stdout.")
+    parser.add_argument("--line-comments", action="store_true", help="Indicate the lines of the original script "
+                                                                     "with // line N comments.")
+    parser.add_argument("--source-map", action="store_true", help="Write a .map file (JSON) next to the output, "
+                                                                  "mapping its lines to the lines of the original "
+                                                                  "script.")
+    parser.add_argument("--disassemble", action="store_true", help="Print a listing of the bytecode to stdout "
+                                                                   "instead of decompiling it.")
+    parser.add_argument("--cache", metavar="path", help="A database in which decompiled functions are kept, so that "
+                                                        "identical functions found in other files (in this run or "
+                                                        "later ones) don't have to be decompiled again.")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_SIZE // (1024 * 1024), metavar="MB",
+                        help="The maximum size of the cache (default: %d MB)." % (DEFAULT_MAX_SIZE // (1024 * 1024)))
+    parser.add_argument("--keep-going", action="store_true", help="Decompile functions separately, and replace "
+                                                                  "the ones which can't be decompiled by their "
+                                                                  "disassembly instead of stopping.")
+    parser.add_argument("--validate", action="store_true", help="Check the bytecode of each file before "
+                                                                "decompiling it, and skip the invalid ones.")
+    parser.add_argument("--errors", metavar="path", help="With --keep-going or --validate, write the list of "
+                                                         "errors to this file (JSON).")
     args = parser.parse_args()
+    if args.source_map and args.stdout:
+        parser.error("--source-map needs an output file to describe, it can't be used with --stdout.")
+    cache = FunctionCache(args.cache, args.cache_size * 1024 * 1024) if args.cache else None
+    try:
+        errors = decompile_files(args, cache)
+    finally:
+        if cache is not None:
+            print(cache.stats(), file=sys.stderr)
+            cache.close()
+    if args.errors:
+        with open(args.errors, "w") as f:
+            json.dump(errors, f, indent=1)
+    if errors:
+        print("[!] %d error(s) encountered." % len(errors), file=sys.stderr)
+
+
+def decompile_files(args, cache=None):
+    """
+    @return The errors encountered with --keep-going (see decompile_keep_going).
+    """
+    all_errors = []
     for path in args.file:
         # Verify that the path exists.
         if not os.path.exists(path):
             print("{!] Error: could not find %s" % path, file=sys.stderr)
             continue
-        
-        files = []
-        if os.path.isdir(path):
-            # If given a directory, we decompile files in that directory with a .cs.dso extension
-            for dirpath, dirnames, filenames in os.walk(path):
-                for f in filenames:
-                    if f.endswith(".cs.dso"):
-                        files.append(os.path.join(dirpath,f))
-        else:
-            files.append(path)
-        
-        for f in files:
+
+        for f in find_dso_files(path):
+            if args.disassemble:
+                disassemble(DSOFile(f), lines=True)
+                continue
+
             # Set the output filename
+            outfile = get_output_path(f)
+            dso = None
+            if args.validate:
+                source = f
+                if not args.stdout and os.path.exists("%s.bak" % f):
+                    source = "%s.bak" % f  # See backup_dso
+                dso, problems = load_and_validate(source)
+                if problems:
+                    print("[!] Error: %s is invalid and will not be decompiled:\n\t%s" % (source, "\n\t".join(problems)),
+                          file=sys.stderr)
+                    all_errors.append({"file": source, "function": None, "ip": None, "opcode": None, "line": None,
+                                       "error": " ".join(problems)})
+                    continue
             if args.stdout:
                 out = sys.stdout
             else:
-                if f.endswith(".cs.dso"):
-                    outfile = f[:-4]  # file.cs.dso -> file.cs
-                else:
-                    outfile = "%s.cs" % f  # file -> file.cs
                 out = open(outfile, 'w')
-
-            # Create a backup of the original DSO in case the decompiled one is broken.
-            if not os.path.exists("%s.bak" % f) and not args.stdout:
-                shutil.copy(f, "%s.bak" % f)
-            elif not args.stdout:
-                f = "%s.bak" % f  # Work on the original DSO instead of possibly decompiling our own file.
+                f = backup_dso(f)
 
             # Decompile the file
-            dso = DSOFile(f)
+            if dso is None:
+                dso = DSOFile(f)
+            sink = out
+            if args.line_comments or args.source_map:
+                sink = LineAnnotator(out, dso, comments=args.line_comments)
+            errors = []
             try:
-                decompile(dso, sink=out)
+                if args.keep_going:
+                    errors = decompile_keep_going(dso, sink=sink, cache=cache)
+                else:
+                    decompile(dso, sink=sink, cache=cache)
             except Exception:
                 exc_type, exc_value, tb = sys.exc_info()
                 if tb is not None:
-                    prev = tb
-                    curr = tb.tb_next
-                    while curr is not None:
-                        prev = curr
-                        curr = curr.tb_next
-                        if "ip" in prev.tb_frame.f_locals and "offset" in prev.tb_frame.f_locals:
-                            break
-                    if "ip" in prev.tb_frame.f_locals:
-                        ip = prev.tb_frame.f_locals["ip"]
-                        opcode = prev.tb_frame.f_locals["opcode"]
-                        print("Error encountered at ip=%d (%s) while decompiling %s." % (ip, opcode, f), file=sys.stderr)
+                    location = get_error_location(tb)
+                    if location is not None:
+                        line = dso.get_line(location[0])
+                        print("Error encountered at ip=%d (%s%s) while decompiling %s."
+                              % (location[0], location[1], ", line %d" % line if line is not None else "", f),
+                              file=sys.stderr)
                     out.close()
                     if not args.stdout:
                         os.remove(outfile)
                 raise
+            if args.source_map and not args.stdout:
+                sink.save_source_map("%s.map" % outfile, outfile)
+            for error in errors:
+                error["file"] = f
+                print("[!] Error: could not decompile %s in %s at ip=%s (%s%s): %s"
+                      % (error["function"] or "top-level code", f, error["ip"], error["opcode"],
+                         ", line %d" % error["line"] if error["line"] is not None else "", error["error"]),
+                      file=sys.stderr)
+            all_errors.extend(errors)
             if not args.stdout:
                 out.close()
-                print("%s successfully decompiled to %s." % (f, outfile))
+                if errors:
+                    print("%s decompiled to %s with %d error(s)." % (f, outfile, len(errors)))
+                else:
+                    print("%s successfully decompiled to %s." % (f, outfile))
+    return all_errors
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,78 @@
+import struct
+
+from parse_dso import DSOFile
+from torque_vm_values import get_opcode
+
+
+class Table(object):
+    """
+    A StringTable: each string is stored once.
+    """
+    def __init__(self):
+        self.data = b""
+        self.offsets = {}
+
+    def add(self, s):
+        if s not in self.offsets:
+            self.offsets[s] = len(self.data)
+            self.data += s.encode("latin-1") + b"\x00"
+        return self.offsets[s]
+
+
+class Assembler(object):
+    """
+    Writes minimal DSO files, to test the tools on known bytecode.
+    """
+    def __init__(self, version=47):
+        self.version = version
+        self.ste_size = 2 if version >= 44 else 1  # StringTable entries use two slots since version 44
+        self.global_strings = Table()
+        self.function_strings = Table()
+        self.global_floats = []
+        self.function_floats = []
+        self.code = []
+
+    def string(self, s, in_function=False):
+        return (self.function_strings if in_function else self.global_strings).add(s)
+
+    def float(self, f, in_function=False):
+        floats = self.function_floats if in_function else self.global_floats
+        floats.append(f)
+        return len(floats) - 1
+
+    def ident(self, s):
+        return [self.string(s)] + [0] * (self.ste_size - 1)
+
+    def op(self, name, *operands):
+        """
+        @return The position of the first operand.
+        """
+        self.code.append([v for v in range(0, 0x100) if get_opcode(self.version, v) == name][0])
+        self.code.extend(operands)
+        return len(self.code) - len(operands)
+
+    def here(self):
+        return len(self.code)
+
+    def function(self, name, args=(), namespace=""):
+        """
+        Writes an OP_FUNC_DECL.
+        @return The position of the end ip, to be filled with here() after the body.
+        """
+        start = self.op("OP_FUNC_DECL", *(self.ident(name) + self.ident(namespace) + self.ident("") + [1, 0, len(args)] +
+                                          sum((self.ident(arg) for arg in args), [])))
+        return start + 3*self.ste_size + 1
+
+    def build(self):
+        def table(data):
+            return struct.pack("<L", len(data)) + data
+
+        def floats(values):
+            return struct.pack("<L", len(values)) + b"".join(struct.pack("<d", f) for f in values)
+
+        data = struct.pack("<L", self.version) + table(self.global_strings.data) + table(self.function_strings.data)
+        data += floats(self.global_floats) + floats(self.function_floats)
+        data += struct.pack("<LL", len(self.code), 1)  # Code size, linebreak pairs
+        data += b"".join(struct.pack("B", v) if v < 0xFF else b"\xff" + struct.pack("<L", v) for v in self.code)
+        data += struct.pack("<LLL", 1 << 8, 0, 0)  # Line 1 starts at ip 0, empty IdentTable
+        return DSOFile.from_bytes(data)
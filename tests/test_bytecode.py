@@ -0,0 +1,81 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bytecode import validate
+from dso_assembler import Assembler
+
+
+def script():
+    # function foo(%x, %y) { if (%x) return; }
+    # foo(1, 2);
+    a = Assembler()
+    end = a.function("foo", ["%x", "%y"])
+    a.op("OP_SETCURVAR", *a.ident("%x"))
+    a.op("OP_LOADVAR_UINT")
+    jump = a.op("OP_JMPIFNOT", 0)
+    a.op("OP_RETURN_VOID")
+    a.code[jump] = a.here()
+    a.op("OP_RETURN_VOID")
+    a.code[end] = a.here()
+    a.op("OP_PUSH_FRAME")
+    for argument in ("1", "2"):
+        a.op("OP_LOADIMMED_STR", a.string(argument))
+        a.op("OP_PUSH")
+    a.op("OP_CALLFUNC", *(a.ident("foo") + a.ident("") + [0]))
+    a.op("OP_STR_TO_NONE")
+    a.op("OP_RETURN_VOID")
+    return a, jump
+
+
+class ValidateTest(unittest.TestCase):
+    def test_valid(self):
+        a, jump = script()
+        dso = a.build()
+        dso.ident_locations = [1, 3, 5, 10, 12]  # Name, namespace, package and arguments of foo
+        self.assertEqual(validate(dso), [])
+
+    def test_invalid_opcode(self):
+        a, jump = script()
+        a.code[jump + 1] = 0xFE
+        self.assertEqual(validate(a.build()), ["ip=%d: 254 does not translate to an opcode for version 47."
+                                               % (jump + 1)])
+
+    def test_jump_out_of_range(self):
+        a, jump = script()
+        a.code[jump] = 1000
+        self.assertEqual(validate(a.build()), ["1 jump(s) out of range (first one: 1000 at ip=%d)." % jump])
+
+    def test_truncated_arguments(self):
+        a, jump = script()
+        a.code[9] = 200  # argc of foo
+        self.assertEqual(validate(a.build()), ["ip=0: OP_FUNC_DECL is truncated (200 arguments)."])
+
+    def test_end_of_function(self):
+        a, jump = script()
+        a.code[8] = 0
+        self.assertEqual(validate(a.build()), ["ip=0: the end of the function (0) is out of range."])
+
+    def test_version(self):
+        for version, supported in ((0, False), (1, False), (35, False), (36, True), (44, True), (47, True),
+                                   (48, False)):
+            a = Assembler(version)
+            a.op("OP_RETURN")
+            problems = validate(a.build())
+            if supported:
+                self.assertEqual(problems, [])
+            else:
+                self.assertEqual(problems, ["Version %d is not supported (only versions 36 to 47 are, see "
+                                            "torque_vm_values.py)." % version])
+
+    def test_ident_locations(self):
+        a, jump = script()
+        dso = a.build()
+        dso.ident_locations = [1, 11, len(dso.code)]  # The second slot of an argument, and past the end
+        self.assertEqual(validate(dso), ["2 IdentTable location(s) don't point to a string operand (first one: 11)."])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from dso_objects import extract_objects
+from dso_assembler import Assembler
+
+
+def assign_field(a, field, value, index=None):
+    # The code generated for "field = value;" or "field[index] = value;" in an object declaration.
+    a.op("OP_LOADIMMED_STR", a.string(value))
+    a.op("OP_ADVANCE_STR")
+    if index is not None:
+        a.op("OP_LOADIMMED_STR", a.string(index))
+        a.op("OP_ADVANCE_STR")
+    a.op("OP_SETCUROBJECT_NEW")
+    a.op("OP_SETCURFIELD", *a.ident(field))
+    if index is not None:
+        a.op("OP_TERMINATE_REWIND_STR")
+        a.op("OP_SETCURFIELD_ARRAY")
+    a.op("OP_SAVEFIELD_STR")
+    a.op("OP_STR_TO_NONE")
+
+
+def create_object(a, class_name, name, parent="", datablock=False):
+    a.op("OP_PUSH_FRAME")
+    a.op("OP_LOADIMMED_IDENT", *a.ident(class_name))
+    a.op("OP_PUSH")
+    a.op("OP_LOADIMMED_STR", a.string(name))
+    a.op("OP_PUSH")
+    a.op("OP_CREATE_OBJECT", *(a.ident(parent) + [int(datablock), 0, 0, 1, 0]))
+
+
+class ExtractObjectsTest(unittest.TestCase):
+    def test_array_field_datablock(self):
+        # datablock WeaponData(Rifle : BaseGun)
+        # {
+        #     damage[2] = "40";
+        #     range = "12";
+        #     new SimObject(Scope) { zoom[0] = "3"; };
+        # };
+        a = Assembler()
+        a.op("OP_LOADIMMED_UINT", 0)
+        create_object(a, "WeaponData", "Rifle", "BaseGun", datablock=True)
+        assign_field(a, "damage", "40", index="2")
+        assign_field(a, "range", "12")
+        a.op("OP_ADD_OBJECT", 1)
+        create_object(a, "SimObject", "Scope")
+        assign_field(a, "zoom", "3", index="0")
+        a.op("OP_ADD_OBJECT", 0)
+        a.op("OP_END_OBJECT", 0)
+        a.op("OP_END_OBJECT", 1)
+        a.op("OP_FINISH_OBJECT")
+        a.op("OP_UINT_TO_NONE")
+        a.op("OP_RETURN_VOID")
+
+        rifle, scope = extract_objects(a.build())
+        self.assertTrue(rifle["datablock"])
+        self.assertEqual((rifle["class"], rifle["name"], rifle["parent"]), ("WeaponData", "Rifle", "BaseGun"))
+        self.assertEqual(dict(rifle["fields"]), {"damage[2]": "40", "range": "12"})
+        self.assertFalse(scope["datablock"])
+        self.assertEqual((scope["class"], scope["name"], scope["container"]), ("SimObject", "Scope", "Rifle"))
+        self.assertEqual(dict(scope["fields"]), {"zoom[0]": "3"})
+
+
+if __name__ == "__main__":
+    unittest.main()
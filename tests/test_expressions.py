@@ -0,0 +1,131 @@
+import os
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from decompile import decompile
+from dso_assembler import Assembler
+
+
+def load(a, variable):
+    a.op("OP_SETCURVAR", *a.ident(variable))
+    a.op("OP_LOADVAR_FLT")
+
+
+def binary(a, opcode, left, right):
+    # The VM evaluates the right operand first: the left one ends up on top of the stack.
+    right(a)
+    left(a)
+    a.op(opcode)
+
+
+def var(variable):
+    return lambda a: load(a, variable)
+
+
+def ternary(a, condition, if_true, if_false, load_opcode="OP_LOADIMMED_FLT"):
+    # %c ? if_true : if_false
+    a.op("OP_SETCURVAR", *a.ident(condition))
+    a.op("OP_LOADVAR_UINT")
+    jump = a.op("OP_JMPIFNOT", 0)
+    a.op(load_opcode, if_true)
+    end = a.op("OP_JMP", 0)
+    a.code[jump] = a.here()
+    a.op(load_opcode, if_false)
+    a.code[end] = a.here()
+
+
+def assignment(expression, save_opcode="OP_SAVEVAR_FLT", pop_opcode="OP_FLT_TO_NONE"):
+    """
+    @return The code decompiled from %r = [expression];
+    """
+    a = Assembler()
+    expression(a)
+    a.op("OP_SETCURVAR_CREATE", *a.ident("%r"))
+    a.op(save_opcode)
+    a.op(pop_opcode)
+    a.op("OP_RETURN_VOID")
+    out = StringIO()
+    decompile(a.build(), sink=out)
+    return out.getvalue().strip()
+
+
+class BinaryOperationTest(unittest.TestCase):
+    def test_precedence(self):
+        self.assertEqual(assignment(lambda a: binary(a, "OP_MUL", lambda a: binary(a, "OP_ADD", var("%a"), var("%b")),
+                                                     var("%c"))),
+                         "%r = (%a + %b) * %c;")
+        self.assertEqual(assignment(lambda a: binary(a, "OP_ADD", var("%a"),
+                                                     lambda a: binary(a, "OP_MUL", var("%b"), var("%c")))),
+                         "%r = %a + %b * %c;")
+
+    def test_associativity(self):
+        self.assertEqual(assignment(lambda a: binary(a, "OP_SUB", var("%a"),
+                                                     lambda a: binary(a, "OP_SUB", var("%b"), var("%c")))),
+                         "%r = %a - (%b - %c);")
+        self.assertEqual(assignment(lambda a: binary(a, "OP_SUB", lambda a: binary(a, "OP_SUB", var("%a"), var("%b")),
+                                                     var("%c"))),
+                         "%r = %a - %b - %c;")
+
+    def test_negated_comparison(self):
+        def not_equal(a):
+            binary(a, "OP_CMPEQ", var("%a"), var("%b"))
+            a.op("OP_NOT")
+        self.assertEqual(assignment(not_equal, "OP_SAVEVAR_UINT", "OP_UINT_TO_NONE"), "%r = %a != %b;")
+
+
+class NegationTest(unittest.TestCase):
+    def negation(self, operand, times=1):
+        def expression(a):
+            operand(a)
+            for i in range(0, times):
+                a.op("OP_NEG")
+        return assignment(expression)
+
+    def test_variable(self):
+        self.assertEqual(self.negation(var("%a")), "%r = -%a;")
+
+    def test_compound(self):
+        self.assertEqual(self.negation(lambda a: binary(a, "OP_ADD", var("%a"), var("%b"))), "%r = -(%a + %b);")
+        self.assertEqual(self.negation(lambda a: binary(a, "OP_MUL", var("%a"), var("%b"))), "%r = -(%a * %b);")
+
+    def test_operand(self):
+        def expression(a):
+            var("%b")(a)
+            var("%a")(a)
+            a.op("OP_NEG")
+            a.op("OP_MUL")
+        self.assertEqual(assignment(expression), "%r = -%a * %b;")
+
+    def test_double_negation(self):
+        self.assertEqual(self.negation(var("%a"), times=2), "%r = %a;")
+
+    def test_literal(self):
+        self.assertEqual(self.negation(lambda a: a.op("OP_LOADIMMED_FLT", a.float(2.5))), "%r = -2.5;")
+
+
+class TernaryTest(unittest.TestCase):
+    def test_float(self):
+        self.assertEqual(assignment(lambda a: ternary(a, "%c", a.float(1.5), a.float(2.5))),
+                         "%r = (%c) ? 1.5 : 2.5;")
+
+    def test_string(self):
+        self.assertEqual(assignment(lambda a: ternary(a, "%c", a.string("yes"), a.string("no"), "OP_LOADIMMED_STR"),
+                                    "OP_SAVEVAR_STR", "OP_STR_TO_NONE"),
+                         '%r = (%c) ? "yes" : "no";')
+
+    def test_operand(self):
+        # The ternary binds less tightly than the addition.
+        self.assertEqual(assignment(lambda a: binary(a, "OP_ADD", var("%a"),
+                                                     lambda a: ternary(a, "%c", a.float(1.5), a.float(2.5)))),
+                         "%r = %a + ((%c) ? 1.5 : 2.5);")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bytecode import find_functions, hash_function
+from decompile import decompile
+from dso_assembler import Assembler
+from function_cache import FunctionCache
+
+
+def echo_function(a):
+    # function foo(%x) { echo(%x); }
+    end = a.function("foo", ["%x"])
+    a.op("OP_PUSH_FRAME")
+    a.op("OP_SETCURVAR", *a.ident("%x"))
+    a.op("OP_LOADVAR_STR")
+    a.op("OP_PUSH")
+    a.op("OP_CALLFUNC", *(a.ident("echo") + a.ident("") + [0]))
+    a.op("OP_STR_TO_NONE")
+    a.op("OP_RETURN_VOID")
+    a.code[end] = a.here()
+
+
+def top_level(version=47):
+    a = Assembler(version)
+    echo_function(a)
+    a.op("OP_RETURN_VOID")
+    return a.build()
+
+
+def nested():
+    # if ($c) { function foo(%x) { ... } }
+    a = Assembler()
+    a.op("OP_SETCURVAR", *a.ident("$c"))
+    a.op("OP_LOADVAR_UINT")
+    jump = a.op("OP_JMPIFNOT", 0)
+    echo_function(a)
+    a.code[jump] = a.here()
+    a.op("OP_RETURN_VOID")
+    return a.build()
+
+
+def decompile_to_string(dso, cache=None):
+    out = StringIO()
+    decompile(dso, sink=out, cache=cache)
+    return out.getvalue()
+
+
+class FunctionCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = FunctionCache(os.path.join(self.directory, "cache.db"))
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        expected = decompile_to_string(top_level())
+        self.assertIn("function foo(%x)", expected)
+        self.assertEqual(decompile_to_string(top_level(), self.cache), expected)
+        self.assertEqual(decompile_to_string(top_level(), self.cache), expected)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_indentation(self):
+        # The same function is found at another level than the one it was cached at.
+        expected = decompile_to_string(nested())
+        self.assertIn("\tfunction foo(%x)\n\t{\n\t\techo(%x);\n\t}\n", expected)
+        decompile_to_string(top_level(), self.cache)
+        self.assertEqual(decompile_to_string(nested(), self.cache), expected)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(decompile_to_string(top_level(), self.cache), decompile_to_string(top_level()))
+
+    def test_version(self):
+        old, new = top_level(45), top_level(47)  # Same opcodes, but not decompiled the same way
+        self.assertNotEqual(hash_function(old, find_functions(old)[0]), hash_function(new, find_functions(new)[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
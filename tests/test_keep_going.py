@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from decompile import decompile, DecompileError
+from dso_assembler import Assembler
+from parse_dso import decompile_keep_going
+
+
+def call(a, name):
+    a.op("OP_PUSH_FRAME")
+    a.op("OP_CALLFUNC", *(a.ident(name) + a.ident("") + [0]))
+    a.op("OP_STR_TO_NONE")
+
+
+def script():
+    # function good() { echo(); }
+    # function bad(%x) { [a loop jumping backwards from its condition, which decompile() doesn't support] }
+    # good();
+    a = Assembler()
+    end = a.function("good")
+    call(a, "echo")
+    a.op("OP_RETURN_VOID")
+    a.code[end] = a.here()
+
+    end = a.function("bad", ["%x"])
+    loop = a.here()
+    a.op("OP_SETCURVAR", *a.ident("%x"))
+    a.op("OP_LOADVAR_UINT")
+    jump = a.op("OP_JMPIFNOT", loop)
+    a.op("OP_RETURN_VOID")
+    a.code[end] = a.here()
+
+    call(a, "good")
+    a.op("OP_RETURN_VOID")
+    return a.build(), jump - 1
+
+
+class KeepGoingTest(unittest.TestCase):
+    def test_without_keep_going(self):
+        dso, ip = script()
+        self.assertRaises(DecompileError, decompile, dso, StringIO())
+
+    def test_keep_going(self):
+        dso, ip = script()
+        out = StringIO()
+        errors = decompile_keep_going(dso, out)
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0]["function"], "bad()")
+        self.assertEqual(errors[0]["ip"], ip)
+        self.assertEqual(errors[0]["opcode"], "OP_JMPIFNOT")
+        self.assertEqual(errors[0]["error"], "DecompileError: Unexpected backward jump.")
+
+        code = out.getvalue()
+        # The functions around the broken one are still decompiled, and the broken one is replaced by a stub.
+        self.assertIn("function good()\n{\n\techo();\n}\n", code)
+        self.assertIn("function bad(%%x)\n{\n\t// [!] Could not decompile this code (ip=%d, OP_JMPIFNOT)" % ip, code)
+        self.assertIn("\t// ", code[code.index("function bad"):])
+        self.assertTrue(code.rstrip().endswith("good();"))
+
+    def test_no_errors(self):
+        a = Assembler()
+        call(a, "good")
+        a.op("OP_RETURN_VOID")
+        out = StringIO()
+        self.assertEqual(decompile_keep_going(a.build(), out), [])
+        self.assertEqual(out.getvalue().strip(), "good();")
+
+
+if __name__ == "__main__":
+    unittest.main()
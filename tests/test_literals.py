@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from decompile import decompile
+from dso_assembler import Assembler
+
+
+def assignment(value, opcode="OP_LOADIMMED_STR"):
+    """
+    @return The code decompiled from %r = [value];
+    """
+    a = Assembler()
+    a.op(opcode, a.string(value))
+    a.op("OP_SETCURVAR_CREATE", *a.ident("%r"))
+    a.op("OP_SAVEVAR_STR")
+    a.op("OP_STR_TO_NONE")
+    a.op("OP_RETURN_VOID")
+    out = StringIO()
+    decompile(a.build(), sink=out)
+    return out.getvalue().strip()
+
+
+class LiteralTest(unittest.TestCase):
+    def test_classification(self):
+        a = Assembler()
+        offsets = [a.string(s) for s in ("hello", "12", "-0.5", "1e3", "", 'say "hi"')]
+        a.op("OP_RETURN_VOID")
+        dso = a.build()
+        literals = [dso.get_literal(offset) for offset in offsets]
+        self.assertEqual([l.value for l in literals], ["hello", "12", "-0.5", "1e3", "", 'say "hi"'])
+        self.assertEqual([l.is_number for l in literals], [False, True, True, True, False, False])
+        self.assertEqual(literals[0].quoted, '"hello"')
+        self.assertEqual(literals[0].tagged, "'hello'")
+        self.assertEqual(literals[1].quoted, "12")
+        self.assertEqual(literals[5].quoted, r'"say \"hi\""')
+
+    def test_rendering(self):
+        self.assertEqual(assignment("hello"), '%r = "hello";')
+        self.assertEqual(assignment("12"), "%r = 12;")
+        self.assertEqual(assignment('say "hi"'), r'%r = "say \"hi\"";')
+        self.assertEqual(assignment("hello", "OP_TAG_TO_STR"), "%r = 'hello';")
+
+    def test_inside_string(self):
+        # Offsets may point inside of a string: the literal is built and cached on the first lookup.
+        a = Assembler()
+        offset = a.string("abc42")
+        a.op("OP_RETURN_VOID")
+        dso = a.build()
+        self.assertNotIn(offset + 3, dso.global_literals)
+        self.assertEqual(dso.get_literal(offset + 3).quoted, "42")
+        self.assertIs(dso.get_literal(offset + 3), dso.global_literals[offset + 3])
+        self.assertEqual(dso.get_string(offset + 1), "bc42")
+
+    def test_tables(self):
+        # The same offset designates different strings in the global and function StringTables.
+        a = Assembler()
+        self.assertEqual(a.string("global"), a.string("local", in_function=True))
+        a.op("OP_RETURN_VOID")
+        dso = a.build()
+        self.assertEqual(dso.get_literal(0).value, "global")
+        self.assertEqual(dso.get_literal(0, in_function=True).value, "local")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lobby_history import LobbyHistory
+
+RANKINGS = "psychoff/rankings.txt"
+GAMES = "psychoff/activeGames.txt"
+
+
+class LobbyHistoryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "history.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def fill(self, history):
+        # The records of both files are interleaved, as they are when frozen.py receives them.
+        history.append(RANKINGS, b"2\nalice\t10\nbob\t3\n", 1)
+        history.append(GAMES, b"1\n42\tbob\tExtermination\n", 2)
+        history.append(RANKINGS, b"2\nalice\t11\ncarol\t1\n", 3)
+        history.append(GAMES, b"0\n", 4)
+
+    def check(self, history):
+        self.assertEqual([r["file"] for r in history.iter_records(RANKINGS)], [RANKINGS, RANKINGS])
+        self.assertEqual([r["time"] for r in history.iter_records(GAMES)], [2, 4])
+        t, header, rows = history.snapshot_at(RANKINGS, 3)
+        self.assertEqual((t, header), (3, "2"))
+        self.assertEqual(dict(rows), {"alice": ["11"], "carol": ["1"]})
+        t, header, rows = history.snapshot_at(GAMES, 3)
+        self.assertEqual(dict(rows), {"42": ["bob", "Extermination"]})
+        self.assertEqual(history.snapshot_at(GAMES, 4)[2], {})
+        changes = list(history.iter_changes(RANKINGS, 2))
+        self.assertEqual(len(changes), 1)
+        t, added, removed, changed = changes[0]
+        self.assertEqual((added, removed, changed), ({"carol": ["1"]}, ["bob"], {"alice": ["11"]}))
+
+    def test_interleaved_files(self):
+        with LobbyHistory(self.path, keyframe_interval=50) as history:
+            self.fill(history)
+            self.check(history)
+        with LobbyHistory(self.path, keyframe_interval=50) as history:
+            self.check(history)
+            # The latest snapshot is read back from the file to compute the next difference.
+            history.append(RANKINGS, b"2\nalice\t11\ncarol\t2\n", 5)
+            record = list(history.iter_records(RANKINGS, 5))[0]
+            self.assertEqual(record.get("changed"), {"carol": ["2"]})
+            self.assertNotIn("added", record)
+
+    def test_queries_do_not_modify_the_file(self):
+        with LobbyHistory(self.path) as history:
+            self.fill(history)
+        with open(self.path, "ab") as f:
+            f.write(b'{"time": 5, "fi')  # Interrupted while writing
+        size = os.path.getsize(self.path)
+        with LobbyHistory(self.path) as history:
+            self.check(history)
+        self.assertEqual(os.path.getsize(self.path), size)
+        with LobbyHistory(self.path) as history:
+            history.append(GAMES, b"1\n43\tcarol\tHostage\n", 6)
+            self.assertEqual([r["time"] for r in history.iter_records(GAMES)], [2, 4, 6])
+
+
+if __name__ == "__main__":
+    unittest.main()
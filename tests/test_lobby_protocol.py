@@ -0,0 +1,95 @@
+import os
+import random
+import sys
+import unittest
+import zlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from lobby_protocol import Dispatcher, MessageReader, parse_message, receive_compressed
+from mt_stream import receive_encounter
+from mt_synth import make_encounter
+
+
+def compress(data):
+    compress = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compress.compress(data) + compress.flush()
+
+
+class ChunkSocket(object):
+    """
+    Returns the given chunks one per recv, like packets arriving from the server.
+    """
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def recv(self, bufsize):
+        if not self.chunks:
+            return b""
+        chunk = self.chunks.pop(0)
+        if len(chunk) > bufsize:
+            self.chunks.insert(0, chunk[bufsize:])
+        return chunk[:bufsize]
+
+    def send(self, data):
+        return len(data)
+
+
+class MessageReaderTest(unittest.TestCase):
+    def read(self, chunks, handler):
+        reader = MessageReader(ChunkSocket(chunks))
+        received = []
+        for message in reader:
+            received.append(message.command)
+            if message.command == "writeFile":
+                received.append(handler(reader))
+        return received
+
+    def test_split_lines(self):
+        chunks = [b"textcom\tcommand\tping\ntextcom\tcomm", b"and\tack\t1\n", b"\n", b"textcom\tcommand\tping\n"]
+        self.assertEqual(self.read(chunks, None), ["ping", "ack", "ping"])
+
+    def test_compressed_file(self):
+        content = b"2\nalice\t10\nbob\t3\n" * 500
+        data = compress(content)
+        # The file starts in the packet of the writeFile message, and the next messages come with its end.
+        chunks = [b"textcom\tcommand\tping\nwriteFile\tpsychoff/rankings.txt\n" + data[:10], data[10:200],
+                  data[200:] + b"textcom\tcommand\tping\ntextcom\tcommand\tack\t1\n"]
+        self.assertEqual(self.read(chunks, receive_compressed), ["ping", "writeFile", content, "ping", "ack"])
+
+    def test_encounter(self):
+        data = make_encounter(random.Random(0), 1234, units=20)
+        # The units end in the middle of the second packet.
+        chunks = [b"writeFile\tgame.enc\n" + data[:50], data[50:-10], data[-10:] + b"textcom\tcommand\tping\n"]
+        received = self.read(chunks, receive_encounter)
+        self.assertEqual(received[0], "writeFile")
+        encounter = received[1]
+        self.assertEqual(encounter.game_id, 1234)
+        self.assertEqual(len(encounter.units), 20)
+        self.assertEqual(encounter.data, data)
+        self.assertEqual(received[2:], ["ping"])
+
+
+class DispatcherTest(unittest.TestCase):
+    def dispatch(self, line):
+        dispatcher = Dispatcher(default=lambda s, message: "default")
+        dispatcher.register("ping", "writeFile")(lambda s, message: message.command)
+        return dispatcher.dispatch(None, parse_message(line))
+
+    def test_commands(self):
+        self.assertEqual(self.dispatch("textcom\tcommand\tping"), "ping")
+        self.assertEqual(self.dispatch("writeFile\tpsychoff/rankings.txt"), "writeFile")
+        self.assertEqual(parse_message("writeFile\tpsychoff/rankings.txt").args, ["psychoff/rankings.txt"])
+
+    def test_other_messages(self):
+        # Only commands are routed by name: anything else goes to the default handler, even if its first
+        # field is the name of a command.
+        self.assertEqual(self.dispatch("ping"), "default")
+        self.assertEqual(self.dispatch("ping\t1"), "default")
+        self.assertEqual(self.dispatch("textcom\tchat\tping"), "default")
+        self.assertEqual(self.dispatch("textcom\tcommand"), "default")
+        self.assertEqual(parse_message("ping").command, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import io
+import os
+import random
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from frozen_parse_mt import read_mt_header, read_units
+from mt_analytics import decode_units
+from mt_synth import make_encounter
+
+
+def games(count):
+    r = random.Random(0)
+    result = []
+    for i in range(0, count):
+        data = make_encounter(random.Random(i), i, units=r.randint(0, 12))
+        if i % 5 == 4:
+            data = data[:-r.randint(1, 30)]  # Truncated
+        f = io.BytesIO(data)
+        read_mt_header(f)
+        result.append((data, f.tell()))
+    return result
+
+
+class DecodeUnitsTest(unittest.TestCase):
+    def test_same_as_read_units(self):
+        corpus = games(40)
+        data = b"".join(g[0] for g in corpus)
+        ends = np.cumsum([len(g[0]) for g in corpus])
+        starts = ends - [len(g[0]) for g in corpus] + [g[1] for g in corpus]
+        ok, units = decode_units(data, starts, ends)
+
+        expected = []
+        for i, (game, position) in enumerate(corpus):
+            f = io.BytesIO(game)
+            f.seek(position)
+            game_units = read_units(f)
+            self.assertEqual(ok[i], game_units is not None)
+            expected += [(i, u.type, u.team, u.x, u.y, u.waypoints) for u in game_units or []]
+        self.assertTrue(expected)
+        self.assertFalse(ok.all())
+
+        decoded = [(int(units["game"][i]),
+                    data[units["type_offset"][i]:units["type_offset"][i] + units["type_size"][i]].decode("latin-1"),
+                    int(units["team"][i]), float(units["x"][i]), float(units["y"][i]), int(units["waypoints"][i]))
+                   for i in range(0, len(units["game"]))]
+        self.assertEqual(decoded, expected)
+
+    def test_no_units(self):
+        ok, units = decode_units(b"\x00" * 10, np.array([0]), np.array([10]))
+        self.assertEqual(list(ok), [True])
+        self.assertEqual(len(units["x"]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
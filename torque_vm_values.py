@@ -143,6 +143,21 @@ def translate_opcode(version, opcode):
     return opcode
 
 
+# The version of the engine OPCODES corresponds to.
+LATEST_VERSION = 47
+# The oldest version translate_opcode() was written for (the one used by Frozen Synapse).
+OLDEST_VERSION = 36
+
+
+def is_version_supported(version):
+    """
+    Older versions down to OLDEST_VERSION are handled by translate_opcode() (versions 45 and 46 use the same
+    opcodes as the latest one, and the decompiler deals with their other differences). Versions outside of
+    this range have never been seen.
+    """
+    return OLDEST_VERSION <= version <= LATEST_VERSION
+
+
 def get_opcode(version, value):
     # Fix the opcode for scripts compiled with an old version.
     if version < 47:
@@ -153,6 +168,53 @@ def get_opcode(version, value):
         return None
 
 
+# Operands following each opcode in the bytecode. Opcodes which are not listed don't have any.
+#   ste:  StringTable entry (global table, 1 or 2 slots depending on the version)
+#   ns:   Same as ste, but 0 means "no namespace"
+#   str:  Offset in the global or function StringTable
+#   flt:  Index in the global or function FloatTable
+#   ip:   Absolute jump target
+#   uint: Raw value
+#   argc: Number of ste operands which follow
+OPERANDS = {
+    "OP_FUNC_DECL":                 ("ste", "ns", "ste", "uint", "ip", "argc"),
+    "OP_CREATE_OBJECT":             ("ste", "uint", "uint", "uint", "uint", "ip"),
+    "OP_ADD_OBJECT":                ("uint",),
+    "OP_END_OBJECT":                ("uint",),
+    "OP_JMPIFFNOT":                 ("ip",),
+    "OP_JMPIFNOT":                  ("ip",),
+    "OP_JMPIFF":                    ("ip",),
+    "OP_JMPIF":                     ("ip",),
+    "OP_JMPIFNOT_NP":               ("ip",),
+    "OP_JMPIF_NP":                  ("ip",),
+    "OP_JMP":                       ("ip",),
+    "OP_SETCURVAR":                 ("ste",),
+    "OP_SETCURVAR_CREATE":          ("ste",),
+    "OP_SETCUROBJECT_INTERNAL":     ("uint",),
+    "OP_SETCURFIELD":               ("ste",),
+    "OP_SETCURFIELD_TYPE":          ("uint",),
+    "OP_LOADIMMED_UINT":            ("uint",),
+    "OP_LOADIMMED_FLT":             ("flt",),
+    "OP_TAG_TO_STR":                ("str",),
+    "OP_LOADIMMED_STR":             ("str",),
+    "OP_DOCBLOCK_STR":              ("str",),
+    "OP_LOADIMMED_IDENT":           ("ste",),
+    "OP_CALLFUNC_RESOLVE":          ("ste", "ns", "uint"),
+    "OP_CALLFUNC":                  ("ste", "ns", "uint"),
+    "OP_ADVANCE_STR_APPENDCHAR":    ("uint",),
+    "OP_ASSERT":                    ("str",),
+    "OP_ITER_BEGIN":                ("ste", "ip"),
+    "OP_ITER_BEGIN_STR":            ("ste", "ip"),
+    "OP_ITER":                      ("ip",),
+}
+
+
+def get_operands(version, opcode):
+    if opcode == "OP_CREATE_OBJECT" and version < 45:
+        return "ste", "uint", "uint", "uint", "ip"  # Older versions don't have a lineNumber
+    return OPERANDS.get(opcode, ())
+
+
 STRING_OPERATORS = {
     "\t":   "TAB",
     "\n":   "NL",